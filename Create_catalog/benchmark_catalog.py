@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Mias Moda Catalog Creator benchmark
+Times each render stage on a folder of product photos (the bundled samples
+or a generated synthetic catalog) and writes the results as JSON so runs
+can be compared between commits
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+import tempfile
+from pathlib import Path
+import PIL
+from PIL import Image, ImageDraw
+
+from catalog_creator import MiasCatalogCreator
+from catalog_profiler import STAGES
+from product_filenames import product_stem
+from summary_stats import percentile
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+SAMPLES_DIR = Path(__file__).parent.parent / "sample_product_pictures"
+
+# Typical source photos: phone camera, WhatsApp export and store originals
+SYNTHETIC_SIZES = [(3024, 4032), (1080, 1920), (1500, 2000), (1791, 3230)]
+SYNTHETIC_CATEGORIES = ['Body', 'Leggins', 'Short_Faja', 'Traje_de_bao', 'Cinturilla']
+
+
+def generate_synthetic_catalog(directory, groups, seed=0, png_share=0.1):
+    """Write `groups` products of 1-4 correctly named photos each
+
+    Photos are noisy gradients with a few shapes, so they compress like
+    real photos. About png_share of them are PNG, the rest JPEG. A marker
+    file lets the same catalog be reused by later runs.
+    """
+    directory = Path(directory)
+    marker = directory / ".synthetic.json"
+    parameters = {'groups': groups, 'seed': seed, 'png_share': png_share}
+    if marker.exists() and json.loads(marker.read_text()) == parameters:
+        return directory
+
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    noise_cache = {}
+    for group in range(groups):
+        category = SYNTHETIC_CATEGORIES[group % len(SYNTHETIC_CATEGORIES)]
+        title = f"{category} Modelo {group}"
+        price = float(rng.randrange(9990, 59990, 10))
+        for number in range(1, rng.randint(1, 4) + 1):
+            size = rng.choice(SYNTHETIC_SIZES)
+            if size not in noise_cache:
+                noise_cache[size] = Image.effect_noise(size, 40).convert('RGB')
+            base = tuple(rng.randrange(60, 230) for _ in range(3))
+            image = Image.blend(Image.new('RGB', size, base), noise_cache[size], 0.25)
+            draw = ImageDraw.Draw(image)
+            for _ in range(6):
+                x, y = rng.randrange(size[0]), rng.randrange(size[1])
+                r = rng.randrange(size[0] // 10, size[0] // 3)
+                draw.ellipse((x - r, y - r, x + r, y + r), fill=tuple(rng.randrange(256) for _ in range(3)))
+            stem = product_stem(title, price, number)
+            if rng.random() < png_share:
+                image.save(directory / f"{stem}.png", compress_level=1)
+            else:
+                image.save(directory / f"{stem}.jpg", quality=90)
+            image.close()
+
+    marker.write_text(json.dumps(parameters))
+    return directory
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process and its finished children, in MB"""
+    if resource is None:
+        return None
+    scale = 1 if sys.platform == 'darwin' else 1024  # ru_maxrss is bytes on macOS, KB elsewhere
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) * scale / 1e6, 1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=Path(__file__).parent, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(seconds):
+    return {
+        'total_s': round(sum(seconds), 4),
+        'p50_ms': round(percentile(seconds, 0.50) * 1e3, 2),
+        'p95_ms': round(percentile(seconds, 0.95) * 1e3, 2),
+    }
+
+
+def benchmark_stages(creator, pages=None):
+    """Time grouping, then compose, encode and save page by page in this process"""
+    start = time.perf_counter()
+    groups = creator.group_product_images()
+    group_seconds = time.perf_counter() - start
+
+    compose, encode, save, latency, sizes = [], [], [], [], []
+    breakdown = {stage: [] for stage in STAGES}
+    keys = sorted(groups)[:pages]
+    for key in keys:
+        name, price = key.rsplit('-', 1)
+        creator.timer.reset()
+        page_start = time.perf_counter()
+        canvas = creator.create_catalog_page(groups[key], name, price)
+        encode_start = time.perf_counter()
+        data, quality = creator.encode_page_to_size(canvas)
+        canvas.close()
+        save_start = time.perf_counter()
+        creator.write_page(creator.catalog_filename(name, price), data)
+        end = time.perf_counter()
+
+        compose.append(encode_start - page_start)
+        encode.append(save_start - encode_start)
+        save.append(end - save_start)
+        latency.append(end - page_start)
+        sizes.append(len(data))
+        for stage in STAGES:
+            breakdown[stage].append(creator.timer.durations.get(stage, 0.0))
+
+    total = sum(latency)
+    return {
+        'groups': len(groups),
+        'images': sum(len(images) for images in groups.values()),
+        'pages': len(keys),
+        'group_product_images_s': round(group_seconds, 4),
+        'create_catalog_page': summarize(compose),
+        'encode': summarize(encode),
+        'save': summarize(save),
+        'page_latency': summarize(latency),
+        'page_stages': {stage: summarize(values) for stage, values in breakdown.items() if any(values)},
+        'pages_per_second': round(len(keys) / total, 2) if total else None,
+        'bytes_per_page': round(sum(sizes) / len(sizes)) if sizes else None,
+    }
+
+
+def benchmark_end_to_end(input_dir, workers, output_format):
+    """Wall-clock time of a full forced build with the process pool"""
+    with tempfile.TemporaryDirectory() as output_dir:
+        creator = MiasCatalogCreator(input_dir, output_dir, workers=workers)
+        creator.set_output_format(output_format)
+        start = time.perf_counter()
+        failures = creator.create_catalog(force=True)
+        elapsed = time.perf_counter() - start
+        pages = len(list(Path(output_dir).glob('*-catalog.*')))
+    return {
+        'workers': workers,
+        'pages': pages,
+        'failures': len(failures),
+        'seconds': round(elapsed, 3),
+        'pages_per_second': round(pages / elapsed, 2) if elapsed else None,
+    }
+
+
+def compare(results, baseline_path):
+    """Print the change of the headline numbers against an earlier result file"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('commit')}):")
+    rows = [
+        ('pages/s (stages)', ('stages', 'pages_per_second')),
+        ('page p50 ms', ('stages', 'page_latency', 'p50_ms')),
+        ('page p95 ms', ('stages', 'page_latency', 'p95_ms')),
+        ('pages/s (end to end)', ('end_to_end', 'pages_per_second')),
+        ('peak RSS MB', ('peak_rss_mb',)),
+    ]
+    for label, path in rows:
+        old, new = baseline, results
+        for part in path:
+            old = old.get(part) if isinstance(old, dict) else None
+            new = new.get(part) if isinstance(new, dict) else None
+        if old and new:
+            print(f"  {label:22} {old:>10} -> {new:>10} ({(new - old) / old * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mias Moda Catalog Creator benchmark')
+    parser.add_argument('--input', default=str(SAMPLES_DIR),
+                      help='Folder of product photos (default: sample_product_pictures)')
+    parser.add_argument('--synthetic', type=int, default=0, metavar='GROUPS',
+                      help='Generate a synthetic catalog with this many products instead of using --input')
+    parser.add_argument('--synthetic-dir', default=os.path.join(tempfile.gettempdir(), 'mias_synthetic_catalog'),
+                      help='Where to generate (and reuse) the synthetic catalog')
+    parser.add_argument('--pages', type=int, default=None,
+                      help='Only time this many pages in the stage benchmark')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                      help='Workers for the end-to-end run (default: number of CPU cores, 0 = skip it)')
+    parser.add_argument('--format', default='jpeg',
+                      help='Output format to benchmark (default: jpeg)')
+    parser.add_argument('--output', default='benchmark_results.json',
+                      help='Where to write the JSON results')
+    parser.add_argument('--compare', default=None,
+                      help='Earlier results file to compare against')
+    args = parser.parse_args()
+
+    input_dir = args.input
+    if args.synthetic:
+        print(f"Generating synthetic catalog with {args.synthetic} products in {args.synthetic_dir}")
+        input_dir = generate_synthetic_catalog(args.synthetic_dir, args.synthetic)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        creator = MiasCatalogCreator(input_dir, output_dir)
+        creator.set_output_format(args.format)
+        print(f"Timing render stages on {input_dir}")
+        stages = benchmark_stages(creator, args.pages)
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'cpu_count': os.cpu_count(),
+        'input': str(input_dir),
+        'format': args.format,
+        'stages': stages,
+    }
+    if args.workers:
+        print(f"Timing a full build with {args.workers} workers")
+        results['end_to_end'] = benchmark_end_to_end(input_dir, args.workers, args.format)
+    results['peak_rss_mb'] = peak_rss_mb()
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\n{stages['pages']} pages from {stages['images']} images in {stages['groups']} groups")
+    print(f"  group_product_images  {stages['group_product_images_s'] * 1e3:8.1f} ms")
+    for stage in ('create_catalog_page', 'encode', 'save', 'page_latency'):
+        print(f"  {stage:20}  p50 {stages[stage]['p50_ms']:8.1f} ms   p95 {stages[stage]['p95_ms']:8.1f} ms")
+    print(f"  throughput            {stages['pages_per_second']} pages/s (one process)")
+    if 'end_to_end' in results:
+        print(f"  end to end            {results['end_to_end']['pages_per_second']} pages/s "
+              f"({results['end_to_end']['workers']} workers)")
+    print(f"  peak RSS              {results['peak_rss_mb']} MB")
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
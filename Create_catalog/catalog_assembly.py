@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Catalog assembly
+Combines rendered catalog pages into a multi-page PDF and N-up contact
+sheets, one page at a time
+"""
+
+import io
+from pathlib import Path
+from typing import NamedTuple
+from PIL import Image
+
+from catalog_manifest import MANIFEST_NAME, CatalogManifest
+from product_filenames import ProductRecord, parse_product_filename
+
+
+ORDERS = ('name', 'category', 'price')
+
+
+class CatalogPage(NamedTuple):
+    """A rendered page and the product it shows"""
+    record: ProductRecord  # the product's main image
+    path: Path
+
+
+def load_catalog_pages(output_dir):
+    """Pages listed in the output directory's manifest that exist on disk"""
+    output_dir = Path(output_dir)
+    manifest = CatalogManifest.load(output_dir / MANIFEST_NAME)
+    pages = []
+    for key, entry in manifest.groups.items():
+        path = output_dir / entry['output']
+        record = parse_product_filename(Path(entry['sources'][0]['file']).stem)
+        if record and path.exists():
+            pages.append(CatalogPage(record, path))
+    return pages
+
+
+def sort_pages(pages, order='name', category_order=()):
+    """Sort pages by name, by category prefix or by price
+
+    With order='category', categories listed in category_order come first
+    in that order, the others follow alphabetically.
+    """
+    if order not in ORDERS:
+        raise ValueError(f"Unknown page order: {order}")
+
+    rank = {category.lower(): index for index, category in enumerate(category_order)}
+
+    def sort_key(page):
+        record = page.record
+        if order == 'category':
+            category = record.category.lower()
+            return (rank.get(category, len(rank)), category, record.display_name, record.price)
+        if order == 'price':
+            return (record.price, record.display_name)
+        return (record.display_name, record.price)
+
+    return sorted(pages, key=sort_key)
+
+
+def jpeg_for_pdf(path, quality=95):
+    """JPEG bytes and size of a page; JPEG files are used as they are"""
+    with Image.open(path) as image:
+        size = image.size
+        if image.format == 'JPEG' and image.mode == 'RGB':
+            return Path(path).read_bytes(), size
+        buffer = io.BytesIO()
+        image.convert('RGB').save(buffer, 'JPEG', quality=quality)
+        return buffer.getvalue(), size
+
+
+class StreamingPdfWriter:
+    """Minimal PDF writer that embeds one JPEG per page
+
+    Pages are written to the file as they are added, so memory use does
+    not depend on the number of pages. JPEG data is embedded as is
+    (DCTDecode), without decoding or re-encoding.
+    """
+
+    def __init__(self, path, resolution=200):
+        self.path = Path(path)
+        self.resolution = resolution
+        self.file = open(self.path, 'wb')
+        self.offsets = {}
+        self.page_ids = []
+        # Objects 1 and 2 are the catalog and the page tree
+        self.next_id = 3
+        self.file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+    def _write_object(self, object_id, body, stream=None):
+        self.offsets[object_id] = self.file.tell()
+        self.file.write(f'{object_id} 0 obj\n'.encode('ascii'))
+        self.file.write(body.encode('ascii'))
+        if stream is not None:
+            self.file.write(b'\nstream\n')
+            self.file.write(stream)
+            self.file.write(b'\nendstream')
+        self.file.write(b'\nendobj\n')
+
+    def add_jpeg(self, data, size):
+        """Add a page showing a JPEG image of size (width, height) pixels"""
+        width, height = size
+        page_width = width * 72 / self.resolution
+        page_height = height * 72 / self.resolution
+        image_id, content_id, page_id = self.next_id, self.next_id + 1, self.next_id + 2
+        self.next_id += 3
+
+        self._write_object(
+            image_id,
+            f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} '
+            f'/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /DCTDecode /Length {len(data)} >>',
+            data
+        )
+        content = f'q {page_width:.2f} 0 0 {page_height:.2f} 0 0 cm /Im0 Do Q'.encode('ascii')
+        self._write_object(content_id, f'<< /Length {len(content)} >>', content)
+        self._write_object(
+            page_id,
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width:.2f} {page_height:.2f}] '
+            f'/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>'
+        )
+        self.page_ids.append(page_id)
+
+    def close(self):
+        """Write the page tree, cross-reference table and trailer"""
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self.page_ids)
+        self._write_object(1, '<< /Type /Catalog /Pages 2 0 R >>')
+        self._write_object(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>')
+
+        xref_offset = self.file.tell()
+        self.file.write(f'xref\n0 {self.next_id}\n'.encode('ascii'))
+        self.file.write(b'0000000000 65535 f \n')
+        for object_id in range(1, self.next_id):
+            self.file.write(f'{self.offsets[object_id]:010d} 00000 n \n'.encode('ascii'))
+        self.file.write(
+            f'trailer\n<< /Size {self.next_id} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n'.encode('ascii')
+        )
+        self.file.close()
+
+
+def write_pdf(pages, pdf_path, resolution=200):
+    """Write pages to a multi-page PDF, one page at a time"""
+    pdf_path = Path(pdf_path)
+    tmp_path = pdf_path.with_name(pdf_path.name + '.tmp')
+    with StreamingPdfWriter(tmp_path, resolution) as writer:
+        for page in pages:
+            writer.add_jpeg(*jpeg_for_pdf(page.path))
+    tmp_path.replace(pdf_path)
+    return len(pages)
+
+
+def write_contact_sheets(pages, sheets_dir, columns=4, rows=3, thumb_width=400,
+                         margin=20, background=(255, 255, 255), quality=90):
+    """Write N-up overview sheets of the pages; returns the sheet paths
+
+    Each page is decoded at reduced size and pasted as a thumbnail, so
+    only one sheet and one thumbnail are in memory at a time.
+    """
+    if columns < 1 or rows < 1:
+        raise ValueError(f"A contact sheet needs at least one column and one row, not {columns}x{rows}")
+    sheets_dir = Path(sheets_dir)
+    sheets_dir.mkdir(parents=True, exist_ok=True)
+    per_sheet = columns * rows
+    sheet_paths = []
+    if not pages:
+        return sheet_paths
+
+    # Cells take the aspect ratio of the first page
+    with Image.open(pages[0].path) as first:
+        cell_height = round(first.height * thumb_width / first.width)
+
+    for start in range(0, len(pages), per_sheet):
+        batch = pages[start:start + per_sheet]
+        sheet_rows = (len(batch) + columns - 1) // columns
+        sheet = Image.new('RGB', (
+            columns * thumb_width + (columns + 1) * margin,
+            sheet_rows * cell_height + (sheet_rows + 1) * margin
+        ), background)
+
+        for index, page in enumerate(batch):
+            row, column = divmod(index, columns)
+            with Image.open(page.path) as image:
+                image.draft('RGB', (thumb_width, cell_height))
+                image.thumbnail((thumb_width, cell_height), Image.Resampling.LANCZOS)
+                sheet.paste(image.convert('RGB'), (
+                    margin + column * (thumb_width + margin),
+                    margin + row * (cell_height + margin)
+                ))
+
+        sheet_path = sheets_dir / f"contact_sheet_{len(sheet_paths) + 1:03d}.jpg"
+        sheet.save(sheet_path, 'JPEG', quality=quality)
+        sheet.close()
+        sheet_paths.append(sheet_path)
+
+    return sheet_paths
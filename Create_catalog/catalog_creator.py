@@ -4,332 +4,731 @@ Mias Moda Catalog Creator
 Creates catalog pages from product images with product variations
 """
 
+import io
 import os
 import sys
+import math
+import time
+import hashlib
+import logging
 import argparse
+import contextlib
+import concurrent.futures
 from pathlib import Path
-from collections import defaultdict
-from PIL import Image, ImageDraw, ImageFont
-import re
+from collections import defaultdict, deque
+from PIL import Image
+
+from catalog_asset_cache import AssetCache
+from catalog_assembly import ORDERS, load_catalog_pages, sort_pages, write_contact_sheets, write_pdf
+from catalog_layouts import LOGO_PATH, RenderPlan, resolve_layouts
+from catalog_manifest import MANIFEST_NAME, CatalogManifest, file_digest, fingerprint
+from catalog_profiler import RenderProfile, StageTimer, capture_profile
+from catalog_shards import (load_shard_manifest, merge_shard_manifests, parse_shard, remove_shard_manifests,
+                            select_shard, shard_info, shard_summary_lines)
+from product_filenames import parse_product_filename, scan_product_images
+
+
+log = logging.getLogger(__name__)
+
+# Bump when a code change alters the rendered pages, so incremental builds redo them
+RENDER_VERSION = 1
+
+# Output formats: Pillow format name and file extension
+OUTPUT_FORMATS = {
+    'jpeg': ('JPEG', '.jpg'),
+    'webp': ('WEBP', '.webp'),
+    'avif': ('AVIF', '.avif'),
+}
+DEFAULT_QUALITY = {'jpeg': 95, 'webp': 90, 'avif': 75}
+# Lowest quality tried when fitting a page into max_bytes
+MIN_QUALITY = 30
 
 
 class MiasCatalogCreator:
-    def __init__(self, input_dir, output_dir):
+    def __init__(self, input_dir, output_dir, workers=1, fast_decode=True,
+                 max_source_pixels=50_000_000, recursive=False, max_in_flight=None):
         self.input_dir = Path(input_dir)
+        # Also look for images in subfolders (e.g. one folder per category)
+        self.recursive = recursive
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
-        # Standard dimensions for the catalog page
-        self.page_width = 2000
-        self.page_height = 2500
-        self.main_image_width = int(self.page_width * 0.65)
-        self.main_image_height = self.page_height
-        self.circle_diameter = 400  # Updated circle size
-        self.circle_margin = 50
-        
-        # Colors
-        self.white = (255, 255, 255)
-        self.black = (0, 0, 0)
-        self.teal = (100, 180, 180)
-        self.pink = (255, 150, 150)
-        self.border_color = (137, 213, 201)  # #89d5c9
+        # Number of worker processes used to render pages (1 = serial) and
+        # cap on pages queued or rendering at once (None = 2 per worker)
+        self.workers = max(1, int(workers or 1))
+        self.max_in_flight = max_in_flight
+        
+        # Source decoding: with fast_decode, JPEGs are decoded at a reduced
+        # scale and large reductions are done in integer steps before LANCZOS
+        self.fast_decode = fast_decode
+        self.reducing_gap = 3.0
+        # Refuse to decode sources bigger than this (e.g. huge PNGs)
+        self.max_source_pixels = max_source_pixels
+        # Resized photos kept between runs (see catalog_asset_cache.py), None = off
+        self.asset_cache = None
+        
+        # Page layouts rendered for each group (see catalog_layouts.py), their
+        # render plan, built on first use, and a process pool kept between
+        # builds in watch mode
+        self.layouts = resolve_layouts(['default'])
+        self._render_plan = None
+        self._executor = None
+        
+        # Per-stage timings of the page being rendered, and whether each
+        # page is also run under cProfile (see catalog_profiler.py)
+        self.timer = StageTimer()
+        self.profile_pages = False
+        
+        # Output encoding, see set_output_format
+        self.output_format = 'jpeg'
+        self.quality = DEFAULT_QUALITY['jpeg']
+        self.progressive = False
+        self.webp_method = 4
+        self.avif_speed = 6
+        self.max_bytes = None
+    
+    def set_output_format(self, output_format='jpeg', quality=None, progressive=False,
+                          webp_method=4, avif_speed=6, max_bytes=None):
+        """Choose how pages are encoded
+        
+        output_format is 'jpeg', 'webp' or 'avif'. progressive applies to
+        JPEG (optimized progressive encoding), webp_method (0-6, slower is
+        smaller) to WebP and avif_speed (0-10, faster is bigger) to AVIF.
+        With max_bytes, each page is encoded at the highest quality that
+        fits, found by binary search between MIN_QUALITY and quality.
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
+        if quality is not None and not 1 <= quality <= 100:
+            raise ValueError(f"Quality must be between 1 and 100, not {quality}")
+        if max_bytes is not None and max_bytes <= 0:
+            raise ValueError(f"Maximum page size must be a positive number of bytes, not {max_bytes}")
+        
+        self.output_format = output_format
+        self.quality = quality if quality is not None else DEFAULT_QUALITY[output_format]
+        self.progressive = progressive
+        self.webp_method = webp_method
+        self.avif_speed = avif_speed
+        self.max_bytes = max_bytes
+        
+        # Fail early if this Pillow build cannot write the format (e.g. AVIF)
+        try:
+            self.encode_page(Image.new('RGB', (8, 8), (255, 255, 255)))
+        except (KeyError, OSError, ValueError) as e:
+            raise ValueError(f"{output_format.upper()} output is not supported by this Pillow build: {e}")
         
     def extract_product_info(self, filename):
         """Extract product info from filename pattern: {name}-{price}-{number}"""
-        # Handle various filename patterns
-        patterns = [
-            r'(.+?)-(\d+)-(\d+)',  # Original pattern
-            r'Body_(.+?)-(\d+)-(\d+)',  # Body_Name-price-number
-            r'Leggins_(.+?)-(\d+)-(\d+)',  # Leggins_Name-price-number
-            r'(.+?)_-_(\d+)-(\d+)-(\d+)',  # Name_-_code-price-number
-            r'(.+?)_(.+?)-(\d+)-(\d+)',  # Name_Description-price-number
-        ]
-        
-        for pattern in patterns:
-            match = re.match(pattern, filename)
-            if match:
-                groups = match.groups()
-                if len(groups) == 3:
-                    name, price, number = groups
-                    # Divide price by 10 to get the correct value
-                    price_int = int(price) // 10
-                    return name, f"${price_int:,}".replace(',', '.'), int(number)
-                elif len(groups) == 4:
-                    # Handle pattern with code
-                    name, code, price, number = groups
-                    # Divide price by 10 to get the correct value
-                    price_int = int(price) // 10
-                    return f"{name} {code}", f"${price_int:,}".replace(',', '.'), int(number)
-        
-        # If no pattern matches, try a simple split
-        parts = filename.split('-')
-        if len(parts) >= 3:
-            name = '-'.join(parts[:-2])
-            price = parts[-2]
-            number = parts[-1]
-            try:
-                # Divide price by 10 to get the correct value
-                price_int = int(price) // 10
-                return name, f"${price_int:,}".replace(',', '.'), int(number)
-            except ValueError:
-                pass
-        
-        print(f"Could not parse filename: {filename}")
-        return None, None, None
+        record = parse_product_filename(filename)
+        if record is None:
+            log.warning(f"Could not parse filename: {filename}")
+            return None, None, None
+        return record.name, record.display_price, record.number
     
-    def group_product_images(self):
-        """Group images by product name and price"""
+    def group_product_images(self, paths=None):
+        """Group images by product name and price
+        
+        Groups every image in the input directory, or only `paths` if given.
+        """
         groups = defaultdict(list)
         
-        for file in self.input_dir.glob('*.*'):
-            if file.suffix.lower() in ['.jpg', '.jpeg', '.png']:
-                filename = file.stem
-                name, price, number = self.extract_product_info(filename)
-                
-                if name and price and number is not None:
-                    # Clean up name by replacing underscores with spaces
-                    name = name.replace('_', ' ').strip()
-                    key = f"{name}-{price}"
-                    groups[key].append((number, file))
-                    print(f"Grouped: {filename} -> {key}")
+        if paths is None:
+            entries = scan_product_images(self.input_dir, recursive=self.recursive)
+        else:
+            entries = ((Path(path), parse_product_filename(Path(path).stem)) for path in paths)
+        
+        for path, record in entries:
+            if record is None:
+                log.warning(f"Could not parse filename: {path.name}")
+                continue
+            groups[record.group_key].append((record.number, path))
         
         # Sort each group by number
         for key in groups:
-            groups[key].sort(key=lambda x: x[0])
+            groups[key].sort()
         
         return groups
     
-    def create_circular_mask(self, size, border_only=False):
-        """Create a circular mask or border for images"""
-        mask = Image.new('L', (size, size), 0)
-        draw = ImageDraw.Draw(mask)
+    def set_layouts(self, names, files=()):
+        """Choose the layouts every group is rendered in, by name
         
-        if border_only:
-            # Draw only the border circle with 3px width
-            draw.ellipse((0, 0, size-1, size-1), outline=255, width=3)
-        else:
-            # Fill the entire circle
-            draw.ellipse((0, 0, size-1, size-1), fill=255)
-            
-        return mask
+        Names come from layouts.json and the given layout files (JSON or
+        YAML). The first layout is the primary one: its page is the one
+        render_group_bytes returns and the PDF and contact sheets show.
+        Raises ValueError for unknown names or invalid layout files.
+        """
+        self.layouts = resolve_layouts(names, files)
+        self._render_plan = None
     
-    def extract_top_center_portion(self, image, target_size):
-        """Extract the top center portion of an image for circular previews"""
-        width, height = image.size
-        
-        # Calculate square crop from top center
+    def top_center_box(self, width, height):
+        """Square region at the top center of an image, used for circular previews"""
         crop_size = min(width, height // 2)
         left = (width - crop_size) // 2
-        top = 0
-        right = left + crop_size
-        bottom = crop_size
-        
-        cropped = image.crop((left, top, right, bottom))
-        # Resize to target size
-        return cropped.resize((target_size, target_size), Image.Resampling.LANCZOS)
+        return (left, 0, left + crop_size, crop_size)
     
-    def add_logo(self, canvas):
-        """Add Mias Moda logo to the canvas"""
+    def open_source_image(self, path, targets):
+        """Decode a source photo for resizing regions of it to several target sizes
+        
+        `targets` lists (target_size, region) pairs, where `region` maps the
+        full image size to the box that will be resized (None: the whole
+        image). With fast_decode, JPEGs are decoded at the smallest 1/2, 1/4
+        or 1/8 scale that still covers every target. Returns the decoded
+        image and the boxes scaled to the decoded size.
+        """
+        image = Image.open(path)
         try:
-            # Load the logo image
-            logo_path = Path(__file__).parent / "LOGO_MIAS_MODA.webp"
-            logo = Image.open(logo_path)
-            
-            # Calculate position (100px from right, 20px from top)
-            logo_x = self.page_width - logo.width - 100
-            logo_y = 20
-            
-            # Paste the logo
-            if logo.mode == 'RGBA':
-                # If the logo has transparency, use it as mask
-                canvas.paste(logo, (logo_x, logo_y), logo)
-            else:
-                # If no transparency, paste without mask
-                canvas.paste(logo, (logo_x, logo_y))
-                
-        except Exception as e:
-            print(f"Error loading logo: {e}")
-            # Fallback to text-based logo if image fails to load
-            logo_width = 400
-            logo_height = 200
-            logo_area = Image.new('RGBA', (logo_width, logo_height), (255, 255, 255, 0))
-            draw = ImageDraw.Draw(logo_area)
-            
-            try:
-                font_large = ImageFont.truetype("arial.ttf", 100)
-                font_small = ImageFont.truetype("arial.ttf", 30)
-            except:
-                try:
-                    font_large = ImageFont.truetype("C:\\Windows\\Fonts\\arial.ttf", 100)
-                    font_small = ImageFont.truetype("C:\\Windows\\Fonts\\arial.ttf", 30)
-                except:
-                    font_large = ImageFont.load_default()
-                    font_small = ImageFont.load_default()
+            full_width, full_height = image.size
+            boxes = [region(full_width, full_height) if region else (0, 0, full_width, full_height)
+                     for target_size, region in targets]
             
-            # draw.text((10, 10), "Mias", fill=self.pink, font=font_large)
-            # draw.text((10, 110), "MODA", fill=self.teal, font=font_large)
-            # draw.text((10, 160), "HECHO EN COLOMBIA", fill=self.pink, font=font_small)
+            if self.fast_decode:
+                image.draft(image.mode, (
+                    max(math.ceil(full_width * size[0] / (box[2] - box[0])) for (size, _), box in zip(targets, boxes)),
+                    max(math.ceil(full_height * size[1] / (box[3] - box[1])) for (size, _), box in zip(targets, boxes))
+                ))
             
-            # Place logo in top right corner
-            logo_x = self.page_width - logo_width - 100
-            logo_y = 20
-            canvas.paste(logo_area, (logo_x, logo_y), logo_area)
+            if image.width * image.height > self.max_source_pixels:
+                raise ValueError(
+                    f"{Path(getattr(path, 'name', path)).name} is too large to decode "
+                    f"({image.width}x{image.height}, limit {self.max_source_pixels} pixels)"
+                )
+            image.load()
+        except Exception:
+            image.close()
+            raise
+        
+        scale_x = image.width / full_width
+        scale_y = image.height / full_height
+        boxes = [(box[0] * scale_x, box[1] * scale_y, box[2] * scale_x, box[3] * scale_y) for box in boxes]
+        return image, boxes
+    
+    def resize_source(self, image, target_size, box=None):
+        """LANCZOS resize of box, with integer pre-reduction for large ratios"""
+        reducing_gap = self.reducing_gap if self.fast_decode else None
+        return image.resize(target_size, Image.Resampling.LANCZOS, box=box, reducing_gap=reducing_gap)
     
-    def add_product_info(self, canvas, name, price):
-        """Add product name and price to the canvas"""
+    def load_tiles(self, path, requests):
+        """Decode a source photo once, resized for each (target_size, crop) request
+        
+        `crop` names the part of the photo that is used: None for all of it,
+        'top_center' for top_center_box. With an asset cache, the tiles are
+        taken from the cache if it holds all of them for the same photo
+        content and parameters. Otherwise the photo is decoded for every
+        request, so the decode scale never depends on what was cached, and
+        all tiles are stored (as RGB, the page's mode). `path` may also be a
+        file object (e.g. a photo downloaded into memory), which is never
+        cached. Returns the tiles in the order of requests.
+        """
+        cache = self.asset_cache if isinstance(path, (str, os.PathLike)) else None
+        keys = []
+        if cache is not None:
+            with self.timer.stage('decode'):
+                for target_size, crop in requests:
+                    parameters = {
+                        'size': list(target_size),
+                        'crop': crop,
+                        'filter': 'lanczos',
+                        'fast_decode': self.fast_decode,
+                        'reducing_gap': self.reducing_gap,
+                    }
+                    if len(requests) > 1:
+                        # The decode scale depends on every tile made from it
+                        parameters['decoded_for'] = sorted([list(size), crop or ''] for size, crop in requests)
+                    keys.append(cache.key(path, parameters))
+                tiles = cache.get_all(keys)
+            if tiles is not None:
+                return tiles
+        
+        tiles = []
         try:
-            font_name = ImageFont.truetype("arial.ttf", 80)
-            font_price = ImageFont.truetype("arial.ttf", 80)
-        except:
-            try:
-                font_name = ImageFont.truetype("C:\\Windows\\Fonts\\arial.ttf", 80)
-                font_price = ImageFont.truetype("C:\\Windows\\Fonts\\arial.ttf", 80)
-            except:
-                font_name = ImageFont.load_default()
-                font_price = ImageFont.load_default()
-        
-        draw = ImageDraw.Draw(canvas)
-        
-        # Calculate text size for the box
-        bbox = font_name.getbbox(name)
-        text_width = bbox[2] - bbox[0]
-        text_height = bbox[3] - bbox[1]
-        
-        # Add padding around text
-        padding = 20
-        
-        # Draw product name box with teal color at y=2280
-        name_box_x = 100
-        name_box_y = 2280  # Updated from 2300 to 2280
-        draw.rectangle(
-            [
-                name_box_x, 
-                name_box_y, 
-                name_box_x + text_width + (padding * 2), 
-                name_box_y + text_height + (padding * 2)
-            ],
-            fill=self.border_color  # Using the teal color #89d5c9
-        )
+            with self.timer.stage('decode'):
+                image, boxes = self.open_source_image(path, [
+                    (target_size, self.top_center_box if crop == 'top_center' else None)
+                    for target_size, crop in requests
+                ])
+            with image, self.timer.stage('resize'):
+                for (target_size, crop), box in zip(requests, boxes):
+                    tiles.append(self.resize_source(image, target_size, box))
+        except Exception:
+            for tile in tiles:
+                tile.close()
+            raise
         
-        # Draw product name centered in the box
-        name_x = name_box_x + padding
-        name_y = name_box_y + padding
-        draw.text((name_x, name_y), name, fill=self.black, font=font_name)
-        
-        # Position the price box
-        price_box_x = 220
-        price_box_y = 2390
-        price_box_width = 300
-        price_box_height = 80
-        
-        # Draw white background for price
-        draw.rectangle(
-            [price_box_x, price_box_y, price_box_x + price_box_width, price_box_y + price_box_height],
-            fill=self.white
-        )
+        if cache is not None:
+            for index, key in enumerate(keys):
+                if tiles[index].mode != 'RGB':
+                    with tiles[index]:
+                        tiles[index] = tiles[index].convert('RGB')
+                cache.put(key, tiles[index])
+        return tiles
+    
+    def load_resized(self, path, target_size, crop=None):
+        """Decode a source photo resized to target_size (see load_tiles)"""
+        return self.load_tiles(path, [(target_size, crop)])[0]
+    
+    @property
+    def render_plan(self):
+        """The layouts compiled with their fonts, logo, masks and templates, built on first use"""
+        if self._render_plan is None:
+            self._render_plan = RenderPlan(self.layouts)
+        return self._render_plan
+    
+    def __getstate__(self):
+        # The render plan is rebuilt in each worker process instead of pickled
+        state = self.__dict__.copy()
+        state['_render_plan'] = None
+        state['_executor'] = None
+        return state
+    
+    def load_group_tiles(self, images, layouts):
+        """Tiles of every layout for a group, decoding each photo once
         
-        # Draw price text - adjust Y position to center in taller box
-        bbox = font_price.getbbox(price)
-        text_height = bbox[3] - bbox[1]
-        price_y_offset = (price_box_height - text_height) // 2
-        draw.text((price_box_x + 10, price_box_y + price_y_offset), price, fill=self.black, font=font_price)
+        Returns one {photo index: tile} dict per layout. Layouts asking for
+        the same size and crop of a photo share the tile.
+        """
+        tiles = [{} for _ in layouts]
+        loaded = []
+        try:
+            for index, requests in sorted(self.render_plan.photo_requests(len(images), layouts).items()):
+                unique = list(dict.fromkeys((size, crop) for position, size, crop in requests))
+                photo_tiles = dict(zip(unique, self.load_tiles(images[index][1], unique)))
+                loaded.extend(photo_tiles.values())
+                for position, size, crop in requests:
+                    tiles[position][index] = photo_tiles[(size, crop)]
+        except Exception:
+            for tile in loaded:
+                tile.close()
+            raise
+        return tiles
     
-    def create_catalog_page(self, product_group, name, price):
-        """Create a catalog page for a product group"""
-        canvas = Image.new('RGB', (self.page_width, self.page_height), self.white)
+    def create_catalog_pages(self, product_group, name, price, layouts=None):
+        """Create the pages of a product group in each layout, yielding (layout, page)
         
-        # Sort images by number
+        The group's photos are decoded once for all layouts (default: every
+        selected layout) before the first page is drawn; they are released
+        when the generator is exhausted or closed.
+        """
+        layouts = self.render_plan.layouts if layouts is None else layouts
         images = sorted(product_group, key=lambda x: x[0])
+        tiles = self.load_group_tiles(images, layouts)
+        try:
+            for layout, layout_tiles in zip(layouts, tiles):
+                yield layout, layout.compose(layout_tiles, name, price, self.timer)
+        finally:
+            for tile in {id(tile): tile for layout_tiles in tiles for tile in layout_tiles.values()}.values():
+                tile.close()
+    
+    def create_catalog_page(self, product_group, name, price):
+        """Create the page of a product group in the primary layout"""
+        layouts = self.render_plan.layouts[:1]
+        with contextlib.closing(self.create_catalog_pages(product_group, name, price, layouts)) as pages:
+            return next(pages)[1]
+    
+    def layout_parameters(self):
+        """Everything besides the source photos that affects the rendered pages"""
+        return {
+            'render_version': RENDER_VERSION,
+            'layouts': self.layouts,
+            'fast_decode': self.fast_decode,
+            'reducing_gap': self.reducing_gap,
+            'output': [self.output_format, self.quality, self.progressive,
+                       self.webp_method, self.avif_speed, self.max_bytes],
+            'logo': file_digest(LOGO_PATH) if LOGO_PATH.exists() else None,
+        }
+    
+    def layout_fingerprint(self):
+        return fingerprint(self.layout_parameters())
+    
+    def catalog_filename(self, name, price, layout=None):
+        """Build the output filename for a product page, with the layout's suffix"""
+        extension = OUTPUT_FORMATS[self.output_format][1]
+        suffix = layout['suffix'] if layout else ''
+        return f"{name.replace(' ', '_').replace('/', '')}-{price.replace('$', '').replace('.', '')}-catalog{suffix}{extension}"
+    
+    def encode_page(self, canvas, quality=None, dpi=None):
+        """Encode a page in the output format"""
+        options = {'quality': self.quality if quality is None else quality}
+        if self.output_format == 'jpeg' and self.progressive:
+            options.update(optimize=True, progressive=True)
+        elif self.output_format == 'webp':
+            options['method'] = self.webp_method
+        elif self.output_format == 'avif':
+            options['speed'] = self.avif_speed
+        if dpi:
+            options['dpi'] = (dpi, dpi)
         
-        # Add main image (image number 1)
-        if images:
-            main_image_path = images[0][1]
-            main_image = Image.open(main_image_path)
-            
-            # Resize main image to fit left side
-            main_image = main_image.resize(
-                (self.main_image_width, self.main_image_height),
-                Image.Resampling.LANCZOS
-            )
-            canvas.paste(main_image, (0, 0))
+        buffer = io.BytesIO()
+        canvas.save(buffer, OUTPUT_FORMATS[self.output_format][0], **options)
+        return buffer.getvalue()
+    
+    def encode_page_to_size(self, canvas, dpi=None):
+        """Encode a page, lowering the quality until it fits max_bytes
         
-        # Add circular detail images (2-4) in vertical line
-        if len(images) > 1:
-            circle_diameter = 402  # 201px radius * 2
-            
-            # Position circles 100px from right edge
-            circle_x = self.page_width - circle_diameter - 100
-            
-            # Start at 600px from top
-            start_y = 600
-            
-            # Create masks
-            circle_mask = self.create_circular_mask(circle_diameter)
-            border_mask = self.create_circular_mask(circle_diameter, border_only=True)
-            
-            for idx, (number, img_path) in enumerate(images[1:4]):  # Get up to 3 additional images
-                img = Image.open(img_path)
-                
-                # Extract top center portion for circular view
-                top_portion = self.extract_top_center_portion(img, circle_diameter)
-                
-                # Create circular image
-                circular_img = Image.new('RGBA', (circle_diameter, circle_diameter), (0, 0, 0, 0))
-                
-                # Create the inner circular image
-                inner_img = Image.new('RGBA', (circle_diameter, circle_diameter), (0, 0, 0, 0))
-                inner_img.paste(top_portion, (0, 0))
-                inner_img.putalpha(circle_mask)
-                
-                # Add the image to the final composition
-                circular_img.paste(inner_img, (0, 0), inner_img)
-                
-                # Add the border
-                border_img = Image.new('RGBA', (circle_diameter, circle_diameter), (0, 0, 0, 0))
-                border_draw = ImageDraw.Draw(border_img)
-                border_draw.ellipse((0, 0, circle_diameter-1, circle_diameter-1), outline=self.border_color, width=3)
-                
-                # Combine image and border
-                circular_img.paste(border_img, (0, 0), border_mask)
-                
-                # Calculate vertical position
-                circle_y = start_y + idx * (circle_diameter + 50)  # 50px margin between circles
-                
-                canvas.paste(circular_img, (circle_x, circle_y), circular_img)
+        Returns the encoded bytes and the quality used. If even MIN_QUALITY
+        (or the configured quality, if lower) does not fit, that encoding is
+        returned.
+        """
+        data = self.encode_page(canvas, dpi=dpi)
+        if not self.max_bytes or len(data) <= self.max_bytes:
+            return data, self.quality
         
-        # Add logo
-        self.add_logo(canvas)
+        # Binary search for the highest quality that fits, never above the configured one
+        lowest = min(MIN_QUALITY, self.quality)
+        low, high = lowest, self.quality - 1
+        best = None
+        while low <= high:
+            quality = (low + high) // 2
+            candidate = self.encode_page(canvas, quality, dpi)
+            if len(candidate) <= self.max_bytes:
+                best = (candidate, quality)
+                low = quality + 1
+            else:
+                high = quality - 1
         
-        # Add product info
-        self.add_product_info(canvas, name, price)
+        if best is None:
+            best = (data, self.quality) if lowest == self.quality else (
+                self.encode_page(canvas, lowest, dpi), lowest)
+        return best
+    
+    def write_page(self, output_filename, data):
+        """Write an encoded page atomically, so a partial page is never left behind"""
+        output_path = self.output_dir / output_filename
+        tmp_path = output_path.with_name(output_path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, output_path)
+    
+    def render_group_bytes(self, key, images):
+        """Render the catalog page for one product group to encoded bytes
         
-        return canvas
+        Only the primary layout is rendered and nothing is written to disk.
+        Returns the encoded page and the quality it was encoded with.
+        """
+        # The price never contains a dash, the name may
+        name, price = key.rsplit('-', 1)
+        with self.create_catalog_page(images, name, price) as catalog_page:
+            with self.timer.stage('encode'):
+                return self.encode_page_to_size(catalog_page, self.layouts[0]['dpi'])
     
-    def create_catalog(self):
-        """Main method to create the catalog"""
-        groups = self.group_product_images()
+    def render_group(self, key, images):
+        """Render and save the catalog pages for one product group, one per layout
         
-        if not groups:
-            print("No product groups found. Check your image filenames.")
+        The photos are decoded once for every layout. Each page goes
+        through the compose, encode and write stages and is released before
+        the next layout is drawn. Returns the primary page's file name and
+        the render stats; stats['pages'] describes the file of each layout.
+        """
+        name, price = key.rsplit('-', 1)
+        
+        self.timer.reset()
+        cache = self.asset_cache
+        cache_hits = cache.hits if cache else 0
+        cache_lookups = cache.hits + cache.misses if cache else 0
+        start = time.perf_counter()
+        pages = {}
+        with capture_profile(self.profile_pages) as profile:
+            with contextlib.closing(self.create_catalog_pages(images, name, price)) as rendered:
+                for layout, catalog_page in rendered:
+                    with catalog_page, self.timer.stage('encode'):
+                        data, quality = self.encode_page_to_size(catalog_page, layout.spec['dpi'])
+                    output_filename = self.catalog_filename(name, price, layout.spec)
+                    with self.timer.stage('write'):
+                        self.write_page(output_filename, data)
+                    pages[output_filename] = {
+                        'layout': layout.name,
+                        'quality': quality,
+                        'bytes': len(data),
+                        'sha256': hashlib.sha256(data).hexdigest(),
+                    }
+        
+        output_filename = next(iter(pages))
+        stats = {
+            'format': self.output_format,
+            'quality': pages[output_filename]['quality'],
+            'bytes': pages[output_filename]['bytes'],
+            'sha256': pages[output_filename]['sha256'],
+            'pages': pages,
+            'seconds': time.perf_counter() - start,
+            'stages': dict(self.timer.durations),
+        }
+        if cache:
+            stats['cached_tiles'] = cache.hits - cache_hits
+            stats['tiles'] = cache.hits + cache.misses - cache_lookups
+        stats.update(profile)
+        return output_filename, stats
+    
+    def render_group_safely(self, key, images):
+        """Render one group, returning (output_filename, stats, error) instead of raising"""
+        try:
+            return self.render_group(key, images) + (None,)
+        except Exception as e:
+            return None, None, f"{type(e).__name__}: {e}"
+    
+    def render_groups(self, groups):
+        """Render groups in key order, yielding (key, output_filename, stats, error)
+        
+        With more than one worker the pages are rendered in a process pool;
+        results are still yielded in key order so the log is deterministic.
+        """
+        keys = [key for key in sorted(groups) if groups[key]]
+        yield from self.render_items(((key, groups[key]) for key in keys), min(self.workers, len(keys)))
+    
+    def render_items(self, items, workers=None):
+        """Render (key, images) pairs as they come, yielding (key, output_filename, stats, error)
+        
+        `items` may be a generator that waits for groups to become
+        available; it is only advanced when there is room in the pool.
+        Results are yielded in the order of items.
+        """
+        workers = self.workers if workers is None else workers
+        if workers <= 1:
+            for key, images in items:
+                yield (key,) + self.render_group_safely(key, images)
             return
         
-        print(f"Found {len(groups)} product groups")
+        # At most max_in_flight pages are queued or rendering at any time,
+        # so memory use does not grow with the size of the catalog
+        max_in_flight = self.max_in_flight or 2 * workers
+        executor = self._executor or self.create_executor(workers)
+        in_flight = deque()
+        try:
+            for key, images in items:
+                if len(in_flight) >= max_in_flight:
+                    done_key, future = in_flight.popleft()
+                    yield (done_key,) + future.result()
+                in_flight.append((key, executor.submit(_render_group_in_worker, key, images)))
+            while in_flight:
+                done_key, future = in_flight.popleft()
+                yield (done_key,) + future.result()
+        finally:
+            # Pages not started yet are dropped if rendering stops early
+            for _, future in in_flight:
+                future.cancel()
+            if executor is not self._executor:
+                executor.shutdown()
+    
+    def create_executor(self, workers):
+        """Process pool whose workers each keep a copy of this creator"""
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_render_worker,
+            initargs=(self,)
+        )
+    
+    def create_catalog(self, force=False, profile=None, groups=None, shard=None, keep=()):
+        """Main method to create the catalog
+        
+        Only groups whose source files or layout changed since the last run
+        are rendered (see catalog_manifest.py); force=True renders them all.
+        Page timings are added to `profile` (a RenderProfile) if given.
+        `groups` replaces the scan of the input directory. With shard=(i, N)
+        only the groups of shard i are handled, and recorded in the shard's
+        own manifest (see catalog_shards.py). The pages of groups in `keep`
+        are neither rendered nor removed, even though they are not in groups.
+        Returns the list of (key, error) for groups that failed.
+        """
+        start = time.perf_counter()
+        if groups is None:
+            groups = self.group_product_images()
+        all_keys = list(groups)
+        if shard:
+            groups = select_shard(groups, *shard)
+            manifest = load_shard_manifest(self.output_dir, *shard)
+            log.info(f"Shard {shard[0]}/{shard[1]}: {len(groups)} of {len(all_keys)} product groups")
+        else:
+            manifest = CatalogManifest.load(self.output_dir / MANIFEST_NAME)
+        layout = self.layout_fingerprint()
+        
+        # Clean up pages of products that disappeared
+        for key in manifest.remove_stale(set(groups) | set(keep), self.output_dir):
+            log.info(f"Removed catalog page of missing product: {key}")
+        
+        if not groups:
+            if shard:
+                manifest.shard = shard_info(*shard, all_keys, layout, [], time.perf_counter() - start, [])
+            manifest.save()
+            if not all_keys and not keep:
+                log.warning("No product groups found. Check your image filenames.")
+            return []
+        
+        log.info(f"Found {len(groups)} product groups")
         
-        for key, images in groups.items():
-            if not images:
+        failures = []
+        pending = {}
+        sources = {}
+        for key in sorted(groups):
+            try:
+                sources[key] = manifest.describe_sources(key, groups[key], self.input_dir)
+            except OSError as e:
+                failures.append((key, f"{type(e).__name__}: {e}"))
+                manifest.forget(key)
                 continue
             
-            name, price = key.split('-', 1)
-            
-            # Create catalog page
-            catalog_page = self.create_catalog_page(images, name, price)
-            
-            # Save catalog page
-            output_filename = f"{name.replace(' ', '_').replace('/', '')}-{price.replace('$', '').replace('.', '')}-catalog.jpg"
-            output_path = self.output_dir / output_filename
-            catalog_page.save(output_path, 'JPEG', quality=95)
-            
-            print(f"Created catalog page: {output_filename}")
+            if not force and manifest.is_current(key, sources[key], layout, self.output_dir):
+                manifest.refresh_sources(key, sources[key])
+            else:
+                pending[key] = groups[key]
+        
+        log.info(f"{len(groups) - len(pending) - len(failures)} pages up to date, {len(pending)} to render")
+        if min(self.workers, len(pending)) > 1:
+            log.info(f"Rendering with {min(self.workers, len(pending))} worker processes")
+        
+        encoded = []
+        try:
+            for key, output_filename, stats, error in self.render_groups(pending):
+                if error:
+                    log.error(f"Error creating catalog page for {key}: {error}")
+                    failures.append((key, error))
+                    manifest.forget(key)
+                    continue
+                
+                page = {'bytes': stats['bytes'], 'sha256': stats['sha256'], 'seconds': round(stats['seconds'], 3)}
+                if len(stats['pages']) > 1:
+                    page['files'] = {filename: {'bytes': info['bytes'], 'sha256': info['sha256']}
+                                     for filename, info in stats['pages'].items()}
+                manifest.record(key, output_filename, layout, sources[key], self.output_dir, page=page,
+                               outputs=list(stats['pages']))
+                encoded.append(stats)
+                if profile is not None:
+                    profile.add(key, output_filename, stats)
+                log.info(f"Created catalog page: {', '.join(stats['pages'])}")
+                log.debug("  " + ", ".join(
+                    f"{stage} {seconds * 1e3:.0f} ms" for stage, seconds in stats['stages'].items()
+                ) + f", {sum(info['bytes'] for info in stats['pages'].values()):,} bytes")
+                for filename, info in stats['pages'].items():
+                    if self.max_bytes and info['bytes'] > self.max_bytes:
+                        log.warning(f"  {filename} is {info['bytes']:,} bytes even at quality {info['quality']}")
+        finally:
+            if shard:
+                manifest.shard = shard_info(*shard, all_keys, layout, failures, time.perf_counter() - start, encoded)
+            manifest.save()
+        
+        self.report_encoding(encoded)
+        if self.asset_cache is not None:
+            tiles = sum(stats.get('tiles', 0) for stats in encoded)
+            cached = sum(stats.get('cached_tiles', 0) for stats in encoded)
+            log.info(f"Asset cache: {cached} of {tiles} tiles reused without decoding")
+            removed = self.asset_cache.prune()
+            if removed:
+                log.info(f"Asset cache: removed {removed} least recently used tiles")
+        
+        if failures:
+            log.error(f"{len(failures)} of {len(groups)} product groups failed:")
+            for key, error in failures:
+                log.error(f"  {key}: {error}")
+        
+        return failures
+    
+    def snapshot_input(self):
+        """Size and modification time of every image in the input directory"""
+        snapshot = {}
+        for path, record in scan_product_images(self.input_dir, recursive=self.recursive):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+    
+    def settled_groups(self, current, previous, built, settle):
+        """Groups ready to be rendered in watch mode, with their photos' size and mtime
+        
+        A group is ready when its photos did not change since the previous
+        poll and all of them are at least `settle` seconds old. A built
+        group whose photos are gone at both polls is ready with None.
+        """
+        oldest_allowed = time.time_ns() - settle * 1e9
+        settled = {
+            key: signature for key, signature in current.items()
+            if previous.get(key) == signature
+            and all(mtime_ns <= oldest_allowed for path, (size, mtime_ns) in signature)
+        }
+        for key in built:
+            if key not in current and key not in previous:
+                settled[key] = None
+        return settled
+    
+    def watch(self, interval=2.0, settle=3.0, profile=None):
+        """Keep the catalog up to date while photos are added, changed or deleted
+        
+        Polls the input directory every `interval` seconds. Each product
+        group is rendered on its own as soon as it settles (see
+        settled_groups), so finished products get their page while photos
+        of others (e.g. from the scraper) are still being written, and no
+        photo is rendered half-written. Pages of groups still changing are
+        left alone until they settle. Only groups whose photos changed are
+        rendered, by the same workers, which keep their fonts, logo and
+        masks loaded. Runs until interrupted with Ctrl+C.
+        """
+        if self.workers > 1:
+            self._executor = self.create_executor(self.workers)
+        
+        log.info(f"Watching {self.input_dir} for changes (Ctrl+C to stop)")
+        # Size and mtime of each group's photos at the last poll, and at the
+        # time its page was built
+        previous = None
+        built = None
+        try:
+            while True:
+                snapshot = self.snapshot_input()
+                groups = self.group_product_images(list(snapshot))
+                current = {
+                    key: tuple((str(path), snapshot[path]) for number, path in images)
+                    for key, images in groups.items()
+                }
+                if previous is not None:
+                    settled = self.settled_groups(current, previous, built or {}, settle)
+                    due = [key for key, signature in settled.items() if (built or {}).get(key) != signature]
+                    if due or built is None:
+                        if built is not None:
+                            added = sum(1 for key in due if key not in built)
+                            removed = sum(1 for key in due if settled[key] is None)
+                            log.info(f"Detected {added} new, {len(due) - added - removed} changed "
+                                     f"and {removed} deleted products")
+                        waiting = (set(current) | set(built or {})) - set(settled)
+                        self.create_catalog(profile=profile, keep=waiting, groups={
+                            key: groups[key] for key, signature in settled.items() if signature is not None})
+                        built = {key: signature for key, signature in {**(built or {}), **settled}.items()
+                                 if signature is not None}
+                previous = current
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            log.info("Stopped watching")
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+    
+    def report_encoding(self, encoded):
+        """Print bytes and encode time per output format"""
+        by_format = defaultdict(list)
+        for stats in encoded:
+            by_format[stats['format']].append(stats)
+        
+        for output_format, groups in sorted(by_format.items()):
+            pages = [info for stats in groups for info in stats['pages'].values()]
+            total_bytes = sum(info['bytes'] for info in pages)
+            total_seconds = sum(stats['stages']['encode'] for stats in groups)
+            log.info(
+                f"Encoded {len(pages)} pages as {output_format.upper()}: "
+                f"{total_bytes / 1e6:.1f} MB ({total_bytes / len(pages) / 1e3:.0f} KB/page), "
+                f"{total_seconds:.2f}s encoding ({total_seconds / len(pages) * 1e3:.0f} ms/page)"
+            )
+
+
+# Per-process creator used by the render pool (set by _init_render_worker)
+_worker_creator = None
+
+
+def _init_render_worker(creator):
+    """Process pool initializer: keep one creator per worker process"""
+    global _worker_creator
+    _worker_creator = creator
+
+
+def _render_group_in_worker(key, images):
+    """Render a single group inside a pool worker"""
+    return _worker_creator.render_group_safely(key, images)
 
 
 def main():
@@ -338,15 +737,168 @@ def main():
                       help='Input directory containing product images')
     parser.add_argument('--output', default='./new_catalog',
                       help='Output directory for catalog pages')
+    parser.add_argument('--recursive', action='store_true',
+                      help='Also look for images in subfolders of the input directory')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                      help='Number of processes used to render pages (default: number of CPU cores, 1 = serial)')
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                      help='Maximum number of pages queued or rendering at once (default: 2 per worker)')
+    parser.add_argument('--force', action='store_true',
+                      help='Render every page, even those that are up to date')
+    parser.add_argument('--format', choices=sorted(OUTPUT_FORMATS), default='jpeg',
+                      help='Output image format (default: jpeg)')
+    parser.add_argument('--quality', type=int, default=None,
+                      help='Encoder quality (default: 95 for JPEG, 90 for WebP, 75 for AVIF)')
+    parser.add_argument('--progressive', action='store_true',
+                      help='Write optimized progressive JPEGs')
+    parser.add_argument('--webp-method', type=int, default=4, choices=range(7), metavar='0-6',
+                      help='WebP encoder effort, higher is slower and smaller (default: 4)')
+    parser.add_argument('--avif-speed', type=int, default=6, choices=range(11), metavar='0-10',
+                      help='AVIF encoder speed, lower is slower and smaller (default: 6)')
+    parser.add_argument('--max-bytes', type=int, default=None,
+                      help='Lower the quality of each page until it fits in this many bytes')
+    parser.add_argument('--watch', action='store_true',
+                      help='Keep running and re-render products whose photos are added, changed or deleted')
+    parser.add_argument('--watch-interval', type=float, default=2.0,
+                      help='Seconds between checks of the input directory in watch mode (default: 2)')
+    parser.add_argument('--settle', type=float, default=3.0,
+                      help='Seconds a photo must stay unchanged before it is rendered in watch mode (default: 3)')
+    parser.add_argument('--pdf', default=None,
+                      help='Also combine all pages into this PDF file')
+    parser.add_argument('--contact-sheets', default=None,
+                      help='Also write N-up overview sheets of all pages to this directory')
+    parser.add_argument('--sheet-grid', default='4x3',
+                      help='Columns x rows of the contact sheets (default: 4x3)')
+    parser.add_argument('--order', choices=ORDERS, default='name',
+                      help='Page order in the PDF and contact sheets (default: name)')
+    parser.add_argument('--category-order', default='',
+                      help='With --order category, comma-separated categories to put first (e.g. Body,Leggins)')
+    parser.add_argument('--profile', action='store_true',
+                      help='Print time per render stage and write a per-page trace')
+    parser.add_argument('--profile-trace', default=None,
+                      help='Per-page trace file, CSV if it ends in .csv, else JSON (default: OUTPUT/catalog_profile.json)')
+    parser.add_argument('--profile-slowest', type=int, default=0, metavar='N',
+                      help='Profile, and save cProfile data of the N slowest pages to OUTPUT/profiles')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                      help='Also log the stage timings of every page')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                      help='Only log warnings and errors')
+    parser.add_argument('--exact-decode', action='store_true',
+                      help='Fully decode every source photo before resizing (slower, reference output)')
+    parser.add_argument('--asset-cache', default=None,
+                      help='Keep resized photos in this directory, so unchanged photos are not decoded again')
+    parser.add_argument('--asset-cache-mb', type=int, default=2048,
+                      help='Size limit of the asset cache in MB (default: 2048)')
+    parser.add_argument('--shard', default=None, metavar='I/N',
+                      help='Only render the I-th of N parts of the catalog (e.g. 2/4), to split a build '
+                           'between processes or machines writing to the same output directory')
+    parser.add_argument('--merge-shards', action='store_true',
+                      help='Check that every shard of a sharded build is done and combine their manifests')
+    parser.add_argument('--max-source-pixels', type=int, default=50_000_000,
+                      help='Skip products whose source photos exceed this many pixels (default: 50000000)')
+    parser.add_argument('--layouts', default='default',
+                      help='Comma-separated page layouts rendered for each product, all from one decode of its '
+                           'photos, e.g. default,instagram,story,print (default: default)')
+    parser.add_argument('--layout-file', action='append', default=[], metavar='FILE',
+                      help='JSON or YAML file with more layouts, or overriding those of layouts.json (repeatable)')
     
     args = parser.parse_args()
     
-    print(f"Looking for images in: {args.input}")
-    print(f"Will save catalogs to: {args.output}")
+    logging.basicConfig(level=logging.WARNING if args.quiet else logging.INFO, format='%(message)s')
+    if args.verbose:
+        # Only this tool's debug output, not Pillow's
+        log.setLevel(logging.DEBUG)
+    
+    log.info(f"Looking for images in: {args.input}")
+    log.info(f"Will save catalogs to: {args.output}")
+    
+    creator = MiasCatalogCreator(
+        args.input, args.output,
+        workers=args.workers,
+        max_in_flight=args.max_in_flight,
+        recursive=args.recursive,
+        fast_decode=not args.exact_decode,
+        max_source_pixels=args.max_source_pixels
+    )
+    try:
+        creator.set_output_format(
+            args.format,
+            quality=args.quality,
+            progressive=args.progressive,
+            webp_method=args.webp_method,
+            avif_speed=args.avif_speed,
+            max_bytes=args.max_bytes
+        )
+        creator.set_layouts([name.strip() for name in args.layouts.split(',') if name.strip()], args.layout_file)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if args.asset_cache:
+        creator.asset_cache = AssetCache(args.asset_cache, args.asset_cache_mb * 1024 * 1024)
+    
+    try:
+        columns, rows = (int(n) for n in args.sheet_grid.lower().split('x'))
+    except ValueError:
+        parser.error(f"--sheet-grid must look like 4x3, not {args.sheet_grid}")
+    if columns < 1 or rows < 1:
+        parser.error(f"--sheet-grid needs at least one column and one row, not {args.sheet_grid}")
+    
+    shard = None
+    if args.shard:
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.watch or args.merge_shards:
+            parser.error("--shard cannot be combined with --watch or --merge-shards")
+    
+    profile = None
+    if args.profile or args.profile_slowest:
+        profile = RenderProfile(slowest=args.profile_slowest)
+        creator.profile_pages = args.profile_slowest > 0
+    
+    if args.watch:
+        if args.force:
+            creator.create_catalog(force=True, profile=profile)
+        creator.watch(args.watch_interval, args.settle, profile=profile)
+        return
+    
+    if args.merge_shards:
+        manifest, problems = merge_shard_manifests(args.output)
+        if problems:
+            log.error(f"Cannot merge the shards in {args.output}:")
+            for problem in problems:
+                log.error(f"  {problem}")
+            sys.exit(1)
+        for line in shard_summary_lines(args.output):
+            log.info(line)
+        manifest.save()
+        remove_shard_manifests(args.output)
+        log.info(f"Merged {len(manifest.groups)} product groups into {manifest.path}")
+        failures = []
+    else:
+        failures = creator.create_catalog(force=args.force, profile=profile, shard=shard)
+        log.info("Catalog creation completed!")
+    
+    if profile is not None:
+        for line in profile.summary_lines():
+            log.info(line)
+        trace_path = profile.write_trace(args.profile_trace or Path(args.output) / 'catalog_profile.json')
+        log.info(f"Wrote page trace to {trace_path}")
+        for path, seconds in profile.write_slowest(Path(args.output) / 'profiles'):
+            log.info(f"Wrote cProfile data of a {seconds * 1e3:.0f} ms page to {path}")
     
-    creator = MiasCatalogCreator(args.input, args.output)
-    creator.create_catalog()
-    print("Catalog creation completed!")
+    if args.pdf or args.contact_sheets:
+        # Assemble from the pages on disk, including those not rendered in this run
+        category_order = [c.strip() for c in args.category_order.split(',') if c.strip()]
+        pages = sort_pages(load_catalog_pages(args.output), args.order, category_order)
+        if args.pdf:
+            write_pdf(pages, args.pdf)
+            log.info(f"Wrote {len(pages)} pages to {args.pdf}")
+        if args.contact_sheets:
+            sheets = write_contact_sheets(pages, args.contact_sheets, columns, rows)
+            log.info(f"Wrote {len(sheets)} contact sheets to {args.contact_sheets}")
+    if failures:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Catalog page layouts
+Layouts are data (layouts.json, or any JSON or YAML file with the same
+fields) compiled once into a render plan: fonts, scaled logo, circle masks
+and a page template per layout
+"""
+
+import json
+import logging
+from pathlib import Path
+from PIL import Image, ImageDraw, ImageFont
+
+try:
+    import yaml
+except ImportError:  # YAML layout files are optional
+    yaml = None
+
+
+log = logging.getLogger(__name__)
+
+LAYOUTS_PATH = Path(__file__).parent / "layouts.json"
+LOGO_PATH = Path(__file__).parent / "LOGO_MIAS_MODA.webp"
+FONT_CANDIDATES = ["arial.ttf", "C:\\Windows\\Fonts\\arial.ttf"]
+
+# Fields of each section of a layout and the kind of value they hold (see KINDS)
+LAYOUT_FIELDS = {
+    'page': {'width': 'size', 'height': 'size', 'background': 'color'},
+    'main_image': {'x': 'position', 'y': 'position', 'width': 'size', 'height': 'size'},
+    'circles': {'count': 'count', 'x': 'position', 'y': 'position', 'diameter': 'size', 'gap': 'position',
+                'border_width': 'count', 'border_color': 'color'},
+    'logo': {'right': 'position', 'top': 'position', 'scale': 'scale'},
+    'product_name': {'x': 'position', 'y': 'position', 'padding': 'count', 'font_size': 'size',
+                     'color': 'color', 'background': 'color'},
+    'price': {'x': 'position', 'y': 'position', 'width': 'size', 'height': 'size', 'padding': 'count',
+              'font_size': 'size', 'color': 'color', 'background': 'color'},
+}
+KINDS = {
+    'position': "an integer",
+    'size': "an integer above 0",
+    'count': "an integer of 0 or more",
+    'scale': "a number above 0",
+    'color': "an [r, g, b] list of integers from 0 to 255",
+}
+DIRECTIONS = ('vertical', 'horizontal')
+
+
+def load_font(size):
+    """Load Arial at the given size, falling back to Pillow's default font"""
+    for candidate in FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(candidate, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+def circular_mask(size, border_width=None):
+    """Filled circle mask, or only its border if border_width is given"""
+    mask = Image.new('L', (size, size), 0)
+    draw = ImageDraw.Draw(mask)
+    if border_width:
+        draw.ellipse((0, 0, size - 1, size - 1), outline=255, width=border_width)
+    else:
+        draw.ellipse((0, 0, size - 1, size - 1), fill=255)
+    return mask
+
+
+def load_layout_file(path):
+    """Layouts defined in a JSON or YAML (.yaml, .yml) file: a list of layouts or a single one"""
+    path = Path(path)
+    with open(path, encoding='utf-8') as f:
+        if path.suffix.lower() in ('.yaml', '.yml'):
+            if yaml is None:
+                raise ValueError(f"Reading {path.name} needs PyYAML (pip install pyyaml)")
+            try:
+                data = yaml.safe_load(f)
+            except yaml.YAMLError as e:
+                raise ValueError(f"Invalid layout file {path.name}: {e}") from None
+        else:
+            data = json.load(f)
+    return data if isinstance(data, list) else [data]
+
+
+def valid_value(kind, value):
+    """Whether a layout field value is of the given kind (see LAYOUT_FIELDS)"""
+    if kind == 'color':
+        return (isinstance(value, list) and len(value) == 3
+                and all(isinstance(c, int) and not isinstance(c, bool) and 0 <= c <= 255 for c in value))
+    if kind == 'scale':
+        return isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0
+    if not isinstance(value, int) or isinstance(value, bool):
+        return False
+    return {'position': True, 'size': value > 0, 'count': value >= 0}[kind]
+
+
+def check_layout(spec):
+    """Validate a layout and fill in its defaults; raises ValueError"""
+    if not isinstance(spec, dict) or not spec.get('name'):
+        raise ValueError(f"A layout needs a name: {spec!r}")
+    name = spec['name']
+    for section, fields in LAYOUT_FIELDS.items():
+        values = spec.get(section)
+        if not isinstance(values, dict):
+            raise ValueError(f"Layout {name} has no {section} section")
+        missing = [field for field in fields if field not in values]
+        if missing:
+            raise ValueError(f"Layout {name}: {section} is missing {', '.join(missing)}")
+        for field, kind in fields.items():
+            if not valid_value(kind, values[field]):
+                raise ValueError(f"Layout {name}: {section}.{field} must be {KINDS[kind]}, not {values[field]!r}")
+    spec = dict(spec)
+    spec['circles'] = dict(spec['circles'])
+    spec['circles'].setdefault('direction', 'vertical')
+    if spec['circles']['direction'] not in DIRECTIONS:
+        raise ValueError(f"Layout {name}: circles direction must be vertical or horizontal")
+    spec.setdefault('suffix', f"-{name}")
+    if not isinstance(spec['suffix'], str) or '/' in spec['suffix'] or '\\' in spec['suffix']:
+        raise ValueError(f"Layout {name}: suffix must be text that can go in a file name")
+    spec.setdefault('dpi', None)
+    if spec['dpi'] is not None and not valid_value('size', spec['dpi']):
+        raise ValueError(f"Layout {name}: dpi must be {KINDS['size']}, not {spec['dpi']!r}")
+    return spec
+
+
+def available_layouts(files=()):
+    """Layouts of layouts.json and the given files by name; later files override earlier ones"""
+    layouts = {}
+    for path in (LAYOUTS_PATH, *files):
+        for spec in load_layout_file(path):
+            spec = check_layout(spec)
+            layouts[spec['name']] = spec
+    return layouts
+
+
+def resolve_layouts(names, files=()):
+    """Checked layouts for a list of names; raises ValueError for unknown names"""
+    layouts = available_layouts(files)
+    unknown = [name for name in names if name not in layouts]
+    if unknown:
+        raise ValueError(f"Unknown layout {', '.join(unknown)} (available: {', '.join(layouts)})")
+    if not names:
+        raise ValueError("No layout selected")
+    selected = [layouts[name] for name in dict.fromkeys(names)]
+    # Each layout's pages need their own file names
+    suffixes = {}
+    for spec in selected:
+        if spec['suffix'] in suffixes:
+            raise ValueError(f"Layouts {suffixes[spec['suffix']]} and {spec['name']} have the same "
+                             f"suffix {spec['suffix']!r}, so their pages would overwrite each other")
+        suffixes[spec['suffix']] = spec['name']
+    return selected
+
+
+class LayoutPlan:
+    """One layout compiled for rendering
+
+    Holds the layout's fonts, its scaled logo, the circle and border masks
+    and a page template with the background and logo already drawn. Pages
+    start from a copy of the template.
+    """
+
+    def __init__(self, spec, logo=None):
+        self.spec = spec
+        self.name = spec['name']
+        page = spec['page']
+        self.page_size = (page['width'], page['height'])
+        main = spec['main_image']
+        self.main_position = (main['x'], main['y'])
+        self.main_size = (main['width'], main['height'])
+
+        circles = spec['circles']
+        self.circle_count = circles['count']
+        self.circle_diameter = circles['diameter']
+        step = circles['diameter'] + circles['gap']
+        if circles['direction'] == 'vertical':
+            self.circle_positions = [(circles['x'], circles['y'] + i * step) for i in range(circles['count'])]
+        else:
+            self.circle_positions = [(circles['x'] + i * step, circles['y']) for i in range(circles['count'])]
+        self.circle_mask = circular_mask(self.circle_diameter)
+        self.border_mask = circular_mask(self.circle_diameter, circles['border_width'])
+        self.border_overlay = Image.new('RGB', (self.circle_diameter,) * 2, tuple(circles['border_color']))
+
+        self.font_name = load_font(spec['product_name']['font_size'])
+        self.font_price = (self.font_name if spec['price']['font_size'] == spec['product_name']['font_size']
+                           else load_font(spec['price']['font_size']))
+
+        self.template = Image.new('RGB', self.page_size, tuple(page['background']))
+        if logo is not None:
+            placement = spec['logo']
+            if placement['scale'] != 1:
+                size = (max(1, round(logo.width * placement['scale'])), max(1, round(logo.height * placement['scale'])))
+                logo = logo.resize(size, Image.Resampling.LANCZOS)
+            position = (self.page_size[0] - logo.width - placement['right'], placement['top'])
+            # If the logo has transparency, use it as mask
+            self.template.paste(logo, position, logo if logo.mode == 'RGBA' else None)
+
+    def photo_requests(self, photo_count):
+        """(photo index, size, crop) of the tiles a group with photo_count photos needs"""
+        if not photo_count:
+            return []
+        requests = [(0, self.main_size, None)]
+        for index in range(1, min(photo_count, self.circle_count + 1)):
+            requests.append((index, (self.circle_diameter,) * 2, 'top_center'))
+        return requests
+
+    def compose(self, tiles, name, price, timer):
+        """Draw a page from the group's tiles ({photo index: resized image})"""
+        with timer.stage('template'):
+            canvas = self.template.copy()
+
+        if 0 in tiles:
+            with timer.stage('composite'):
+                canvas.paste(tiles[0], self.main_position)
+
+        with timer.stage('circles'):
+            for index, position in enumerate(self.circle_positions, start=1):
+                if index not in tiles:
+                    break
+                # Paste the image through the circle mask, then the border on top
+                tile = tiles[index]
+                if tile.mode == canvas.mode:
+                    canvas.paste(tile, position, self.circle_mask)
+                else:
+                    with tile.convert(canvas.mode) as converted:
+                        canvas.paste(converted, position, self.circle_mask)
+                canvas.paste(self.border_overlay, position, self.border_mask)
+
+        with timer.stage('text'):
+            self.draw_text(canvas, name, price)
+        return canvas
+
+    def draw_text(self, canvas, name, price):
+        """Product name in a colored box, price below it in its own box"""
+        draw = ImageDraw.Draw(canvas)
+
+        style = self.spec['product_name']
+        bbox = self.font_name.getbbox(name)
+        text_width = bbox[2] - bbox[0]
+        text_height = bbox[3] - bbox[1]
+        padding = style['padding']
+        draw.rectangle(
+            [style['x'], style['y'], style['x'] + text_width + padding * 2, style['y'] + text_height + padding * 2],
+            fill=tuple(style['background'])
+        )
+        draw.text((style['x'] + padding, style['y'] + padding), name, fill=tuple(style['color']), font=self.font_name)
+
+        # Price vertically centered in its box
+        style = self.spec['price']
+        draw.rectangle(
+            [style['x'], style['y'], style['x'] + style['width'], style['y'] + style['height']],
+            fill=tuple(style['background'])
+        )
+        bbox = self.font_price.getbbox(price)
+        text_height = bbox[3] - bbox[1]
+        y_offset = (style['height'] - text_height) // 2
+        draw.text((style['x'] + style['padding'], style['y'] + y_offset), price,
+                  fill=tuple(style['color']), font=self.font_price)
+
+
+class RenderPlan:
+    """The selected layouts compiled once (per creator and per worker process)
+
+    photo_requests() merges what every layout needs from each photo, so a
+    photo is decoded once for all of them.
+    """
+
+    def __init__(self, specs, logo_path=LOGO_PATH):
+        logo = None
+        try:
+            with Image.open(logo_path) as image:
+                image.load()
+                logo = image.copy()
+        except Exception as e:
+            log.error(f"Error loading logo: {e}")
+        self.layouts = [LayoutPlan(spec, logo) for spec in specs]
+
+    def photo_requests(self, photo_count, layouts=None):
+        """{photo index: [(layout position, size, crop)]} for the given layouts (default: all)"""
+        requests = {}
+        for position, layout in enumerate(self.layouts if layouts is None else layouts):
+            for index, size, crop in layout.photo_requests(photo_count):
+                requests.setdefault(index, []).append((position, size, crop))
+        return requests
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Catalog build manifest
+Records what each catalog page was rendered from, so unchanged product
+groups can be skipped on the next run
+"""
+
+import os
+import json
+import hashlib
+import logging
+from pathlib import Path
+
+
+log = logging.getLogger(__name__)
+
+
+MANIFEST_NAME = "catalog_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's content, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint(parameters):
+    """Stable hash of a JSON-serializable set of parameters"""
+    encoded = json.dumps(parameters, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def write_json_atomic(path, data):
+    """Write JSON to a temporary file and rename it over path"""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+class CatalogManifest:
+    """Per-group record of source files, layout fingerprint and output files
+
+    Each group entry looks like:
+        {"output": "Body_Ada-24990-catalog.jpg",
+         "layout": "<layout fingerprint>",
+         "sources": [{"file": "Body_Ada-249900-1.jpg", "size": 270303,
+                      "mtime_ns": 1715400000000000000, "sha256": "..."}],
+         "page": {"bytes": 512345, "sha256": "...", "seconds": 0.61}}
+    "output" and "page" describe the page of the primary layout. When
+    several layouts are rendered, "outputs" lists every file of the group
+    and page["files"] holds the size and SHA-256 of each. The manifest of
+    a sharded build (see catalog_shards.py) also has a "shard" section.
+    """
+
+    def __init__(self, path, groups=None, shard=None):
+        self.path = Path(path)
+        self.groups = groups or {}
+        self.shard = shard
+
+    @classmethod
+    def load(cls, path):
+        """Load a manifest, starting empty if it is missing or unreadable"""
+        path = Path(path)
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                return cls(path, data.get('groups', {}), data.get('shard'))
+            log.warning(f"Ignoring manifest with unknown version: {path}")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            log.warning(f"Ignoring unreadable manifest {path}: {e}")
+        return cls(path)
+
+    def save(self):
+        data = {'version': MANIFEST_VERSION, 'groups': self.groups}
+        if self.shard is not None:
+            data['shard'] = self.shard
+        write_json_atomic(self.path, data)
+
+    def describe_sources(self, key, images, input_dir):
+        """Size, mtime and content hash of a group's source files
+
+        Files whose size and mtime match the previous entry reuse its hash
+        instead of being read again.
+        """
+        previous = {
+            source['file']: source
+            for source in self.groups.get(key, {}).get('sources', [])
+        }
+        sources = []
+        for number, path in sorted(images, key=lambda x: x[0]):
+            stat = os.stat(path)
+            name = Path(path).relative_to(input_dir).as_posix()
+            old = previous.get(name)
+            if old and old['size'] == stat.st_size and old['mtime_ns'] == stat.st_mtime_ns:
+                digest = old['sha256']
+            else:
+                digest = file_digest(path)
+            sources.append({
+                'file': name,
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'sha256': digest,
+            })
+        return sources
+
+    def is_current(self, key, sources, layout, output_dir):
+        """True if the group's page exists and was rendered from the same inputs"""
+        entry = self.groups.get(key)
+        if not entry or entry.get('layout') != layout:
+            return False
+        if not all((Path(output_dir) / output).exists() for output in entry_outputs(entry)):
+            return False
+        old = [(source['file'], source['sha256']) for source in entry['sources']]
+        new = [(source['file'], source['sha256']) for source in sources]
+        return old == new
+
+    def refresh_sources(self, key, sources):
+        """Update size and mtime of an up-to-date group (content unchanged)"""
+        self.groups[key]['sources'] = sources
+
+    def record(self, key, output, layout, sources, output_dir, page=None, outputs=None):
+        """Store a freshly rendered group, removing old outputs it no longer has
+
+        `outputs` lists every file of the group when there are several
+        layouts; `output` is the primary one.
+        """
+        outputs = outputs or [output]
+        old = self.groups.get(key)
+        if old:
+            for filename in entry_outputs(old):
+                if filename not in outputs:
+                    remove_output(output_dir, filename)
+        self.groups[key] = {'output': output, 'layout': layout, 'sources': sources}
+        if len(outputs) > 1:
+            self.groups[key]['outputs'] = outputs
+        if page is not None:
+            self.groups[key]['page'] = page
+
+    def forget(self, key):
+        """Drop a group so it is rendered again on the next run"""
+        return self.groups.pop(key, None)
+
+    def remove_stale(self, keys, output_dir):
+        """Delete pages of groups that no longer exist; returns removed keys"""
+        removed = []
+        for key in sorted(set(self.groups) - set(keys)):
+            entry = self.groups.pop(key)
+            for filename in entry_outputs(entry):
+                remove_output(output_dir, filename)
+            removed.append(key)
+        return removed
+
+
+def entry_outputs(entry):
+    """Every file of a group entry, primary layout first"""
+    return entry.get('outputs') or [entry['output']]
+
+
+def remove_output(output_dir, filename):
+    """Delete a rendered page if it exists"""
+    try:
+        (Path(output_dir) / filename).unlink()
+    except FileNotFoundError:
+        pass
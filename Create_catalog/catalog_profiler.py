@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Render profiling
+Per-stage page timings, the --profile summary and trace files, and
+cProfile captures of the slowest pages
+"""
+
+import csv
+import json
+import time
+import heapq
+import logging
+import marshal
+import cProfile
+from pathlib import Path
+from contextlib import contextmanager
+
+from summary_stats import percentile
+
+
+log = logging.getLogger(__name__)
+
+# Render stages in page order
+STAGES = ('template', 'decode', 'resize', 'composite', 'circles', 'text', 'encode', 'write')
+
+
+class StageTimer:
+    """Accumulates the time spent in each render stage of the current page"""
+
+    def __init__(self):
+        self.durations = {}
+
+    def reset(self):
+        self.durations = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0.0) + time.perf_counter() - start
+
+
+@contextmanager
+def capture_profile(enabled):
+    """cProfile the block; yields a dict that receives the marshalled stats
+
+    The stats are marshalled (the format of cProfile dump files) so they
+    can be sent back from a worker process.
+    """
+    result = {}
+    if not enabled:
+        yield result
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield result
+    finally:
+        profiler.disable()
+        profiler.create_stats()
+        result['cprofile'] = marshal.dumps(profiler.stats)
+
+
+class RenderProfile:
+    """Collects page timings of a run for the summary table and trace files
+
+    With slowest=N, the cProfile captures of the N slowest pages are kept
+    and can be written as .prof files (open them with pstats or snakeviz).
+    """
+
+    def __init__(self, slowest=0):
+        self.slowest = slowest
+        self.pages = []
+        # Size of every file written, one per layout of each page
+        self.file_sizes = []
+        self._slowest = []
+
+    def add(self, key, output, stats):
+        sizes = [info['bytes'] for info in stats['pages'].values()]
+        self.file_sizes.extend(sizes)
+        row = {
+            'key': key,
+            'output': output,
+            'seconds': stats['seconds'],
+            'files': len(sizes),
+            'bytes': sum(sizes),
+            'quality': stats['quality'],
+        }
+        for stage in STAGES:
+            row[stage] = stats['stages'].get(stage, 0.0)
+        self.pages.append(row)
+
+        data = stats.get('cprofile')
+        if self.slowest and data:
+            entry = (stats['seconds'], len(self.pages), key, data)
+            if len(self._slowest) < self.slowest:
+                heapq.heappush(self._slowest, entry)
+            else:
+                heapq.heappushpop(self._slowest, entry)
+
+    def summary_lines(self):
+        """Table of time per stage over all pages"""
+        if not self.pages:
+            return ["No pages were rendered"]
+        total = sum(page['seconds'] for page in self.pages)
+        lines = [
+            f"Profile of {len(self.pages)} pages ({total:.2f}s rendering)",
+            f"  {'stage':10} {'total s':>9} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'share':>7}",
+        ]
+        for stage in STAGES + ('seconds',):
+            values = [page[stage] for page in self.pages]
+            if not any(values):
+                continue
+            label = 'page' if stage == 'seconds' else stage
+            lines.append(
+                f"  {label:10} {sum(values):9.3f} {sum(values) / len(values) * 1e3:9.1f} "
+                f"{percentile(values, 0.5) * 1e3:9.1f} {percentile(values, 0.95) * 1e3:9.1f} "
+                f"{sum(values) / total * 100 if total else 0:6.1f}%"
+            )
+        sizes = self.file_sizes
+        lines.append(
+            f"  bytes/file: mean {sum(sizes) / len(sizes) / 1e3:.0f} KB, "
+            f"p95 {percentile(sizes, 0.95) / 1e3:.0f} KB over {len(sizes)} files"
+        )
+        return lines
+
+    def write_trace(self, path):
+        """Write one row per page, as CSV if path ends in .csv, else JSON"""
+        path = Path(path)
+        if path.suffix.lower() == '.csv':
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=['key', 'output', 'seconds', 'files', 'bytes', 'quality'] + list(STAGES))
+                writer.writeheader()
+                writer.writerows(self.pages)
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'stages': STAGES, 'pages': self.pages}, f, indent=2)
+        return path
+
+    def write_slowest(self, directory):
+        """Write the cProfile captures of the slowest pages; returns the paths"""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        paths = []
+        for rank, (seconds, _, key, data) in enumerate(sorted(self._slowest, reverse=True), 1):
+            safe_key = ''.join(c if c.isalnum() else '_' for c in key)
+            path = directory / f"{rank:02d}_{safe_key}.prof"
+            path.write_bytes(data)
+            paths.append((path, seconds))
+        return paths
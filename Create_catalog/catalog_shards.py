@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Sharded catalog builds
+Splits the product groups between several catalog_creator.py runs
+(--shard i/N) and merges their manifests once all of them are done
+"""
+
+import os
+import hashlib
+from pathlib import Path
+
+from catalog_manifest import MANIFEST_NAME, CatalogManifest, entry_outputs, file_digest, fingerprint
+
+
+def parse_shard(value):
+    """Parse 'i/N' (1 <= i <= N) into (i, N); raises ValueError"""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise ValueError(f"shard must look like 2/4, not {value!r}") from None
+    if not 1 <= index <= count:
+        raise ValueError(f"shard {value} is out of range: the index must be between 1 and the count")
+    return index, count
+
+
+def shard_of(key, count):
+    """Shard (1 to count) a group key belongs to
+
+    A hash of the key, not Python's hash(), so every process and machine
+    puts a group in the same shard.
+    """
+    digest = hashlib.sha256(key.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count + 1
+
+
+def select_shard(groups, index, count):
+    """The groups of shard index out of count"""
+    return {key: images for key, images in groups.items() if shard_of(key, count) == index}
+
+
+def shard_manifest_name(index, count):
+    return f"catalog_manifest.shard-{index}-of-{count}.json"
+
+
+def groups_fingerprint(keys):
+    """Hash of the full set of group keys, so shards can check they saw the same input"""
+    return fingerprint(sorted(keys))
+
+
+def shard_info(index, count, all_keys, layout, failures, seconds, rendered):
+    """Shard section of a shard manifest (see CatalogManifest.shard)
+
+    `rendered` lists the render stats of the pages rendered by this run.
+    """
+    return {
+        'index': index,
+        'count': count,
+        'groups_total': len(all_keys),
+        'groups_fingerprint': groups_fingerprint(all_keys),
+        'layout': layout,
+        'failed': dict(failures),
+        'seconds': round(seconds, 3),
+        'rendered': len(rendered),
+        'render_seconds': round(sum(stats['seconds'] for stats in rendered), 3),
+    }
+
+
+def load_shard_manifest(output_dir, index, count):
+    """A shard's manifest, seeded from the merged manifest after a merge"""
+    output_dir = Path(output_dir)
+    path = output_dir / shard_manifest_name(index, count)
+    if path.exists():
+        return CatalogManifest.load(path)
+    merged = CatalogManifest.load(output_dir / MANIFEST_NAME)
+    groups = {key: entry for key, entry in merged.groups.items() if shard_of(key, count) == index}
+    return CatalogManifest(path, groups)
+
+
+def merge_shard_manifests(output_dir, verify=True):
+    """Check that the shard manifests of output_dir cover every group and combine them
+
+    Every shard i/N must be present, all of them rendered with the same
+    layout from the same set of groups, with no failed group. Each group
+    must be in exactly one shard, the one it hashes to, and its pages must
+    exist with the recorded size (and SHA-256 if verify is set). Returns
+    (manifest, problems): the combined manifest, not yet saved, or None
+    if there are problems to report.
+    """
+    output_dir = Path(output_dir)
+    problems = []
+    shards = {}
+    for path in sorted(output_dir.glob('catalog_manifest.shard-*-of-*.json')):
+        manifest = CatalogManifest.load(path)
+        info = manifest.shard
+        if not info:
+            problems.append(f"{path.name} is not a shard manifest")
+            continue
+        if (info['index'], info['count']) in shards:
+            problems.append(f"Shard {info['index']}/{info['count']} is there twice")
+        shards[(info['index'], info['count'])] = (path, manifest)
+
+    if not shards:
+        return None, problems or [f"No shard manifests found in {output_dir}"]
+
+    counts = {count for index, count in shards}
+    if len(counts) > 1:
+        return None, problems + [f"Shards of different splits: {', '.join(f'{i}/{n}' for i, n in sorted(shards))}"]
+    count = counts.pop()
+    for index in range(1, count + 1):
+        if (index, count) not in shards:
+            problems.append(f"Shard {index}/{count} is missing")
+
+    reference = next(iter(shards.values()))[1].shard
+    groups = {}
+    for (index, count), (path, manifest) in sorted(shards.items()):
+        info = manifest.shard
+        for field in ('layout', 'groups_fingerprint'):
+            if info[field] != reference[field]:
+                what = 'layout' if field == 'layout' else 'set of product groups'
+                problems.append(f"Shard {index}/{count} was rendered with a different {what}")
+        for key, error in info['failed'].items():
+            problems.append(f"Shard {index}/{count} failed to render {key}: {error}")
+        for key, entry in manifest.groups.items():
+            if shard_of(key, count) != index:
+                problems.append(f"{key} is in shard {index}/{count}, but belongs to shard {shard_of(key, count)}")
+            elif key in groups:
+                problems.append(f"{key} is in more than one shard")
+            elif entry.get('layout') != info['layout']:
+                problems.append(f"{key} was rendered with an older layout")
+            else:
+                problems.extend(check_page(output_dir, key, entry, verify))
+                groups[key] = entry
+
+    if len(groups) != reference['groups_total'] or groups_fingerprint(groups) != reference['groups_fingerprint']:
+        problems.append(f"{len(groups)} of {reference['groups_total']} product groups are in the shard manifests")
+
+    if problems:
+        return None, problems
+    return CatalogManifest(output_dir / MANIFEST_NAME, groups), []
+
+
+def check_page(output_dir, key, entry, verify):
+    """Problems with a group's pages on disk, compared with its manifest entry"""
+    page = entry.get('page', {})
+    files = page.get('files') or {entry['output']: page}
+    problems = []
+    for filename in entry_outputs(entry):
+        path = Path(output_dir) / filename
+        recorded = files.get(filename, {})
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            problems.append(f"Page of {key} is missing: {filename}")
+            continue
+        if 'bytes' in recorded and size != recorded['bytes']:
+            problems.append(f"Page {filename} of {key} has {size} bytes, the manifest says {recorded['bytes']}")
+        elif verify and 'sha256' in recorded and file_digest(path) != recorded['sha256']:
+            problems.append(f"Page {filename} of {key} does not match its SHA-256 in the manifest")
+    return problems
+
+
+def remove_shard_manifests(output_dir):
+    for path in Path(output_dir).glob('catalog_manifest.shard-*-of-*.json'):
+        path.unlink()
+
+
+def shard_summary_lines(output_dir):
+    """Groups, render time and wall time of each shard, for the merge log"""
+    manifests = [CatalogManifest.load(path) for path in Path(output_dir).glob('catalog_manifest.shard-*-of-*.json')]
+    return [
+        f"  shard {info['index']}/{info['count']}: {len(manifest.groups)} groups, "
+        f"{info['rendered']} rendered in {info['seconds']:.1f}s ({info['render_seconds']:.1f}s of rendering)"
+        for manifest, info in sorted(((m, m.shard) for m in manifests if m.shard), key=lambda x: x[1]['index'])
+    ]
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Fixtures shared by the catalog tests
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from product_filenames import product_stem
+
+
+CREATOR = Path(__file__).parent / "catalog_creator.py"
+
+
+class PhotoFolder:
+    """An input folder of correctly named product photos"""
+
+    def __init__(self, path):
+        self.path = path
+        path.mkdir()
+
+    def add(self, name, price, number, color=(200, 120, 90), size=(300, 450), image=None):
+        """Write one photo (a plain color, or the given image); returns its path"""
+        path = self.path / f"{product_stem(name, price, number)}.jpg"
+        (image or Image.new('RGB', size, color)).save(path)
+        return path
+
+    def add_groups(self, groups, photos=None):
+        """Write products 'Body Modelo N' with `photos` photos each (default: 1 to 3)"""
+        for group in range(groups):
+            for number in range(1, (photos or group % 3 + 1) + 1):
+                self.add(f'Body Modelo {group}', 10000.0 + group * 1000, number,
+                         (group * 20 % 256, number * 60, 90))
+
+
+@pytest.fixture
+def photos(tmp_path):
+    """Empty photo folder in the test's tmp_path (tmp_path / "photos")"""
+    return PhotoFolder(tmp_path / "photos")
+
+
+@pytest.fixture
+def creator_command():
+    """Command line running catalog_creator.py serially with the given arguments"""
+    def command(*args):
+        return [sys.executable, str(CREATOR), '--workers', '1', *args]
+    return command
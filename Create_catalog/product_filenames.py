@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Product image filenames
+Builds and parses the {name}-{price}-{number} filenames shared by the
+scraper, the catalog creator and the tests
+"""
+
+import os
+import re
+import time
+import argparse
+import tempfile
+from pathlib import Path
+from typing import NamedTuple
+
+
+IMAGE_EXTENSIONS = frozenset(['.jpg', '.jpeg', '.png', '.webp'])
+
+# {name}-{price}-{number}: the name is everything before the last two numeric
+# fields, so names containing dashes (Leggins_Faja_-_3104) parse correctly
+FILENAME_PATTERN = re.compile(r'(?P<name>.+)-(?P<price>\d+)-(?P<number>\d+)')
+
+# Characters kept by the scraper when building a filename
+UNSAFE_CHARACTERS = re.compile(r'[^a-zA-Z0-9_-]')
+
+
+class ProductRecord(NamedTuple):
+    """A parsed product image filename"""
+    name: str    # name as written in the filename, e.g. "Body_Ada"
+    price: int   # price in pesos
+    number: int  # 1 = main image, 2+ = variations
+
+    @property
+    def display_name(self):
+        """Name shown on the catalog page: underscores become spaces"""
+        return self.name.replace('_', ' ').strip()
+
+    @property
+    def display_price(self):
+        return format_price(self.price)
+
+    @property
+    def group_key(self):
+        """Images with the same name and price belong on the same page"""
+        return f"{self.display_name}-{self.display_price}"
+
+    @property
+    def category(self):
+        """Product type prefix, e.g. "Body" for Body_Ada"""
+        return self.name.split('_', 1)[0]
+
+
+def format_price(price):
+    """Format pesos with $ symbol and dot separators: 24990 -> $24.990"""
+    return f"${price:,}".replace(',', '.')
+
+
+def parse_product_filename(stem):
+    """Parse a filename stem; returns a ProductRecord or None
+
+    The price field is written by the scraper as the store price with its
+    decimal point removed (29990.0 -> 299900), so it is divided by 10.
+    """
+    match = FILENAME_PATTERN.fullmatch(stem)
+    if not match:
+        return None
+    record = ProductRecord(match['name'], int(match['price']) // 10, int(match['number']))
+    if not record.display_name:
+        return None
+    return record
+
+
+def product_stem(title, price, counter):
+    """Filename stem the scraper uses for a product image"""
+    filename = f"{title}-{price}-{counter}".replace(' ', '_')
+    return UNSAFE_CHARACTERS.sub('', filename)
+
+
+def scan_product_images(root, recursive=False):
+    """Yield (path, record) for every image file under root
+
+    Uses os.scandir so large folders are listed without a stat call per
+    file. With recursive=True, category subfolders are walked as well.
+    record is None for images whose filename could not be parsed.
+    """
+    pending = [os.fspath(root)]
+    while pending:
+        directory = pending.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if recursive:
+                        pending.append(entry.path)
+                    continue
+                stem, ext = os.path.splitext(entry.name)
+                if ext.lower() in IMAGE_EXTENSIONS and entry.is_file():
+                    yield Path(entry.path), parse_product_filename(stem)
+
+
+def benchmark(count):
+    """Time filename parsing and directory indexing over count synthetic files"""
+    categories = ['Body', 'Leggins', 'Short_Faja', 'Traje_de_bao']
+    stems = [
+        product_stem(f"{categories[i % len(categories)]} Modelo {i // 6}", float(10000 + i // 6), i % 6 + 1)
+        for i in range(count)
+    ]
+
+    start = time.perf_counter()
+    parsed = sum(1 for stem in stems if parse_product_filename(stem))
+    elapsed = time.perf_counter() - start
+    print(f"Parsed {parsed}/{count} names in {elapsed:.3f}s ({count / elapsed:,.0f} names/s)")
+
+    with tempfile.TemporaryDirectory() as root:
+        for category in categories:
+            os.mkdir(os.path.join(root, category))
+        for i, stem in enumerate(stems):
+            open(os.path.join(root, categories[i % len(categories)], stem + '.jpg'), 'wb').close()
+
+        start = time.perf_counter()
+        indexed = sum(1 for path, record in scan_product_images(root, recursive=True) if record)
+        elapsed = time.perf_counter() - start
+        print(f"Indexed {indexed}/{count} files in {elapsed:.3f}s ({count / elapsed:,.0f} files/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Product filename parsing micro-benchmark')
+    parser.add_argument('--count', type=int, default=100_000,
+                      help='Number of synthetic filenames (default: 100000)')
+    args = parser.parse_args()
+
+    benchmark(args.count)
+
+
+if __name__ == "__main__":
+    main()
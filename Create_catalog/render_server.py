@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Mias Moda render server
+Serves catalog pages over HTTP, rendered on demand from the product photos
+and kept in an in-memory LRU cache
+"""
+
+import json
+import time
+import logging
+import argparse
+import threading
+from pathlib import Path
+from collections import OrderedDict, defaultdict
+from urllib.parse import unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from catalog_asset_cache import AssetCache
+from catalog_creator import OUTPUT_FORMATS, MiasCatalogCreator
+from catalog_manifest import MANIFEST_NAME, CatalogManifest, fingerprint
+
+
+log = logging.getLogger(__name__)
+
+CONTENT_TYPES = {'jpeg': 'image/jpeg', 'webp': 'image/webp', 'avif': 'image/avif'}
+
+
+class PageCache:
+    """Thread-safe LRU cache of encoded pages, bounded by total bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.pages = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            data = self.pages.get(key)
+            if data is not None:
+                self.pages.move_to_end(key)
+            return data
+
+    def count(self, hit):
+        """Count a request once it is known whether it was served from the cache"""
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.pages.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self.pages[key] = data
+            self.bytes += len(data)
+            while self.bytes > self.max_bytes:
+                _, evicted = self.pages.popitem(last=False)
+                self.bytes -= len(evicted)
+
+    def stats(self):
+        with self.lock:
+            return {'pages': len(self.pages), 'bytes': self.bytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+class RenderService:
+    """Renders catalog pages to bytes on request
+
+    Pages are cached under a hash of their source photos' content and the
+    layout fingerprint, which is also their ETag: a changed photo or layout
+    gives a new key, so cached pages never go stale. Photos whose size and
+    mtime are unchanged are not hashed again; hashes are seeded from the
+    output directory's manifest if there is one.
+    """
+
+    def __init__(self, creator, cache_bytes=256 * 1024 * 1024, rescan_interval=2.0, prune_interval=60.0):
+        self.creator = creator
+        self.cache = PageCache(cache_bytes)
+        self.layout = creator.layout_fingerprint()
+        self.rescan_interval = rescan_interval
+        # Never saved: only used to reuse known hashes
+        self.sources = CatalogManifest.load(creator.output_dir / MANIFEST_NAME)
+        self.groups = {}
+        self.page_ids = {}
+        self.scanned_at = None
+        self.forced_at = None
+        self.lock = threading.Lock()
+        # Held while the input directory is scanned, so only one scan runs at a time
+        self.scan_lock = threading.Lock()
+        # One render per page at a time; concurrent requests wait for it
+        self.render_locks = defaultdict(threading.Lock)
+        # The creator's stage timer and asset cache counters are not
+        # thread-safe: pages are rendered one at a time
+        self.creator_lock = threading.Lock()
+        # The asset cache is pruned at most every prune_interval seconds
+        self.prune_interval = prune_interval
+        self.pruned_at = time.monotonic()
+        # Load fonts, logo and masks before the first request
+        creator.render_plan
+
+    def page_id(self, key):
+        """URL name of a product, e.g. Body_Ada-24990"""
+        name, price = key.rsplit('-', 1)
+        stem = Path(self.creator.catalog_filename(name, price)).stem
+        return stem[:-len('-catalog')] if stem.endswith('-catalog') else stem
+
+    def scan(self, force=False):
+        """Re-index the input directory, at most every rescan_interval seconds
+
+        force rescans sooner, to find a product that was just added, but
+        forced scans are limited to one per rescan_interval too, so requests
+        for unknown products cannot keep the server rescanning. One scan
+        runs at a time; other requests keep using the previous index
+        meanwhile (except before the first scan, which they wait for).
+        """
+        if not self.scan_lock.acquire(blocking=self.scanned_at is None):
+            return
+        try:
+            now = time.monotonic()
+            last = self.forced_at if force else self.scanned_at
+            if last is not None and now - last < self.rescan_interval:
+                return
+            groups = self.creator.group_product_images()
+            page_ids = {self.page_id(key): key for key in groups}
+            with self.lock:
+                self.groups = groups
+                self.page_ids = page_ids
+                self.scanned_at = now
+                if force:
+                    self.forced_at = now
+        finally:
+            self.scan_lock.release()
+
+    def find(self, product):
+        """Group key and images of a product given by page id or group key"""
+        self.scan()
+        key, images = self.lookup(product)
+        if images is None:
+            # Maybe a photo was just added
+            self.scan(force=True)
+            key, images = self.lookup(product)
+        return key, images
+
+    def lookup(self, product):
+        with self.lock:
+            key = self.page_ids.get(product, product)
+            return key, self.groups.get(key)
+
+    def etag(self, key, images):
+        """Cache key of a page: hash of its photos' content and the layout"""
+        sources = self.sources.describe_sources(key, images, self.creator.input_dir)
+        with self.lock:
+            self.sources.groups[key] = {'sources': sources}
+        return fingerprint({
+            'layout': self.layout,
+            'sources': [(source['file'], source['sha256']) for source in sources],
+        })
+
+    def page(self, product, if_none_match=()):
+        """Return (status, etag, data, cache) for a product page
+
+        status is 404 for unknown products and 304 if the current ETag is in
+        if_none_match; data is only set for 200.
+        """
+        key, images = self.find(product)
+        if images is None:
+            return 404, None, None, None
+        try:
+            etag = self.etag(key, images)
+        except FileNotFoundError:
+            # A photo was deleted since the last scan
+            self.scan(force=True)
+            key, images = self.find(product)
+            if images is None:
+                return 404, None, None, None
+            etag = self.etag(key, images)
+
+        if etag in if_none_match:
+            return 304, etag, None, None
+
+        data = self.cache.get(etag)
+        if data is not None:
+            self.cache.count(hit=True)
+            return 200, etag, data, 'hit'
+
+        with self.lock:
+            render_lock = self.render_locks[etag]
+        try:
+            with render_lock:
+                # Rendered by another request while this one waited
+                data = self.cache.get(etag)
+                if data is not None:
+                    self.cache.count(hit=True)
+                    return 200, etag, data, 'hit'
+                data = self.render(key, images)
+                self.cache.put(etag, data)
+                self.cache.count(hit=False)
+        finally:
+            with self.lock:
+                self.render_locks.pop(etag, None)
+        return 200, etag, data, 'miss'
+
+    def render(self, key, images):
+        """Render a page to bytes, pruning the asset cache from time to time"""
+        with self.creator_lock:
+            start = time.perf_counter()
+            data, quality = self.creator.render_group_bytes(key, images)
+            log.info(f"Rendered {key} in {(time.perf_counter() - start) * 1e3:.0f} ms ({len(data) / 1e3:.0f} KB)")
+            cache = self.creator.asset_cache
+            if cache is not None and time.monotonic() - self.pruned_at >= self.prune_interval:
+                self.pruned_at = time.monotonic()
+                removed = cache.prune()
+                if removed:
+                    log.info(f"Asset cache: removed {removed} least recently used tiles")
+        return data
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """GET /page/{product}, /pages (product list) and /stats"""
+
+    service = None
+
+    def do_GET(self):
+        path = unquote(self.path.split('?', 1)[0])
+        if path.startswith('/page/'):
+            self.send_page(path[len('/page/'):])
+        elif path == '/pages':
+            self.service.scan()
+            self.send_json(sorted(self.service.page_ids))
+        elif path == '/stats':
+            self.send_json(self.service.cache.stats())
+        else:
+            self.send_error(404)
+
+    def send_page(self, product):
+        # Clients send back the quoted ETags of the copies they have
+        if_none_match = set()
+        for tag in self.headers.get('If-None-Match', '').split(','):
+            tag = tag.strip()
+            if_none_match.add((tag[2:] if tag.startswith('W/') else tag).strip('"'))
+        try:
+            status, etag, data, cache = self.service.page(product, if_none_match)
+        except Exception as e:
+            log.error(f"Failed to render {product}: {e}")
+            self.send_error(500, str(e))
+            return
+        if status == 404:
+            self.send_error(404, f"Unknown product: {product}")
+            return
+
+        self.send_response(status)
+        self.send_header('ETag', f'"{etag}"')
+        self.send_header('Cache-Control', 'no-cache')
+        if status == 304:
+            self.end_headers()
+            return
+        self.send_header('Content-Type', CONTENT_TYPES[self.service.creator.output_format])
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('X-Cache', cache)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_json(self, value):
+        data = json.dumps(value, indent=2).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        log.debug(format % args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mias Moda render server')
+    parser.add_argument('--input', default='./product_pictures',
+                      help='Input directory containing product images')
+    parser.add_argument('--output', default='./new_catalog',
+                      help='Catalog directory whose manifest is used to avoid re-hashing photos')
+    parser.add_argument('--recursive', action='store_true',
+                      help='Also look for images in subfolders of the input directory')
+    parser.add_argument('--host', default='127.0.0.1',
+                      help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8000,
+                      help='Port to listen on (default: 8000)')
+    parser.add_argument('--cache-mb', type=int, default=256,
+                      help='Memory for cached pages in MB (default: 256)')
+    parser.add_argument('--format', choices=sorted(OUTPUT_FORMATS), default='jpeg',
+                      help='Output image format (default: jpeg)')
+    parser.add_argument('--quality', type=int, default=None,
+                      help='Encoder quality (default: 95 for JPEG, 90 for WebP, 75 for AVIF)')
+    parser.add_argument('--max-bytes', type=int, default=None,
+                      help='Lower the quality of each page until it fits in this many bytes')
+    parser.add_argument('--asset-cache', default=None,
+                      help='Keep resized photos in this directory, shared with catalog_creator.py --asset-cache')
+    parser.add_argument('--asset-cache-mb', type=int, default=2048,
+                      help='Size limit of the asset cache in MB, checked every minute (default: 2048)')
+    parser.add_argument('--exact-decode', action='store_true',
+                      help='Fully decode every source photo before resizing (slower, reference output)')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                      help='Also log every request')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if args.verbose:
+        log.setLevel(logging.DEBUG)
+
+    creator = MiasCatalogCreator(args.input, args.output, recursive=args.recursive,
+                                 fast_decode=not args.exact_decode)
+    try:
+        creator.set_output_format(args.format, quality=args.quality, max_bytes=args.max_bytes)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.asset_cache:
+        creator.asset_cache = AssetCache(args.asset_cache, args.asset_cache_mb * 1024 * 1024)
+
+    RenderRequestHandler.service = RenderService(creator, args.cache_mb * 1024 * 1024)
+    server = ThreadingHTTPServer((args.host, args.port), RenderRequestHandler)
+    log.info(f"Serving catalog pages of {args.input} on http://{args.host}:{args.port}/page/<product>")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log.info("Stopped")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+"""
+Summary statistics
+Shared by the render profiler, the benchmark and the scraper's request
+metrics; standard library only
+"""
+
+import math
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers
+
+    The smallest value with at least `fraction` of the values at or below it.
+    """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
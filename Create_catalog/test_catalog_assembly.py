@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Tests of the PDF catalog and contact sheets
+Run with pytest
+"""
+
+import re
+
+from PIL import Image
+
+from catalog_assembly import load_catalog_pages, sort_pages, write_contact_sheets, write_pdf
+from catalog_creator import MiasCatalogCreator
+
+
+def build_catalog(tmp_path, photos):
+    for name, price in [('Body Ada', 24990.0), ('Body Nubia', 299900.0), ('Leggins Roma', 159900.0)]:
+        photos.add(name, price, 1)
+    output = tmp_path / "catalog"
+    assert MiasCatalogCreator(photos.path, output).create_catalog() == []
+    return output
+
+
+def test_pdf_has_one_page_per_product(tmp_path, photos):
+    pages = sort_pages(load_catalog_pages(build_catalog(tmp_path, photos)), 'price')
+    assert [page.record.price for page in pages] == [24990.0, 159900.0, 299900.0]
+
+    pdf = tmp_path / "catalog.pdf"
+    assert write_pdf(pages, pdf) == 3
+    data = pdf.read_bytes()
+    assert data.startswith(b'%PDF-') and data.endswith(b'%%EOF\n')
+    assert data.count(b'/Type /Page ') == 3 and b'/Count 3 ' in data
+    assert not pdf.with_name(pdf.name + '.tmp').exists()
+
+    # Every cross-reference entry points at its object
+    xref = int(re.search(rb'startxref\n(\d+)\n', data).group(1))
+    assert data[xref:].startswith(b'xref\n')
+    offsets = re.findall(rb'(\d{10}) 00000 n ', data[xref:])
+    assert len(offsets) == int(re.search(rb'/Size (\d+)', data).group(1)) - 1
+    for object_id, offset in enumerate(offsets, start=1):
+        assert data[int(offset):].startswith(f'{object_id} 0 obj'.encode('ascii'))
+
+
+def test_contact_sheets(tmp_path, photos):
+    pages = sort_pages(load_catalog_pages(build_catalog(tmp_path, photos)))
+    sheets = write_contact_sheets(pages, tmp_path / "sheets", columns=2, rows=1, thumb_width=100, margin=10)
+    assert [sheet.name for sheet in sheets] == ["contact_sheet_001.jpg", "contact_sheet_002.jpg"]
+    with Image.open(sheets[0]) as first, Image.open(sheets[1]) as second:
+        assert first.size == (2 * 100 + 3 * 10, 125 + 2 * 10)
+        assert second.size == first.size
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Tests of catalog builds: incremental builds, the asset cache, watch mode and page encoding
+Run with pytest
+"""
+
+import os
+import subprocess
+import time
+from pathlib import Path
+
+import pytest
+from PIL import Image, ImageChops, ImageStat
+
+from catalog_asset_cache import AssetCache
+from catalog_creator import MiasCatalogCreator
+
+
+SAMPLES_DIR = Path(__file__).parent.parent / "sample_product_pictures"
+
+
+def counting_creator(photos, output):
+    """Serial creator that records the keys of the groups it renders"""
+    creator = MiasCatalogCreator(photos, output)
+    creator.rendered = []
+    render_group = creator.render_group
+
+    def counted(key, images):
+        creator.rendered.append(key)
+        return render_group(key, images)
+
+    creator.render_group = counted
+    return creator
+
+
+def test_incremental_builds(tmp_path, photos):
+    output = tmp_path / "catalog"
+    edited = photos.add('Body Ada', 24990.0, 1)
+    photos.add('Body Ada', 24990.0, 2, (90, 120, 200))
+    photos.add('Body Nubia', 29990.0, 1, (90, 200, 120))
+
+    creator = counting_creator(photos.path, output)
+    assert creator.create_catalog() == []
+    assert sorted(creator.rendered) == ['Body Ada-$24.990', 'Body Nubia-$29.990']
+
+    # Nothing changed
+    creator.rendered.clear()
+    creator.create_catalog()
+    assert creator.rendered == []
+
+    # Only the group of an edited photo is rendered again
+    Image.new('RGB', (300, 450), (10, 10, 10)).save(edited)
+    creator.create_catalog()
+    assert creator.rendered == ['Body Ada-$24.990']
+
+    creator.rendered.clear()
+    creator.create_catalog(force=True)
+    assert len(creator.rendered) == 2
+
+
+def test_pages_of_removed_groups_are_deleted(tmp_path, photos):
+    output = tmp_path / "catalog"
+    photos.add('Body Ada', 24990.0, 1)
+    removed = photos.add('Body Nubia', 29990.0, 1, (90, 200, 120))
+
+    creator = counting_creator(photos.path, output)
+    creator.create_catalog()
+    assert (output / "Body_Nubia-29990-catalog.jpg").exists()
+
+    removed.unlink()
+    creator.rendered.clear()
+    creator.create_catalog()
+    assert creator.rendered == []
+    assert sorted(path.name for path in output.iterdir()) == ["Body_Ada-24990-catalog.jpg", "catalog_manifest.json"]
+
+
+def test_asset_cache_reuses_every_tile(tmp_path, photos):
+    output = tmp_path / "catalog"
+    for number in range(1, 4):
+        photos.add('Body Ada', 24990.0, number, (number * 60, 120, 90))
+    photos.add('Body Nubia', 29990.0, 1, (90, 200, 120))
+
+    creator = MiasCatalogCreator(photos.path, output)
+    creator.asset_cache = AssetCache(tmp_path / "cache")
+    creator.create_catalog()
+    pages = {path.name: path.read_bytes() for path in output.glob('*.jpg')}
+    assert len(pages) == 2 and creator.asset_cache.hits == 0
+
+    decoded = []
+    open_source_image = creator.open_source_image
+    creator.open_source_image = lambda path, targets: decoded.append(path) or open_source_image(path, targets)
+    lookups = creator.asset_cache.misses
+    assert lookups == 4  # Ada's main photo and two circles, Nubia's main photo
+    creator.create_catalog(force=True)
+    assert decoded == []
+    assert creator.asset_cache.hits == lookups and creator.asset_cache.misses == lookups
+    assert {path.name: path.read_bytes() for path in output.glob('*.jpg')} == pages
+
+
+def test_asset_cache_tiles_are_compressed_losslessly(tmp_path):
+    cache = AssetCache(tmp_path / "cache")
+    tile = Image.linear_gradient('L').resize((1300, 2500)).convert('RGB')
+    cache.put('ab12', tile)
+    path = cache.tile_path('ab12')
+    assert path.suffix == '.png' and path.stat().st_size < 1300 * 2500 * 3 // 4
+    (loaded,) = cache.get_all(['ab12'])
+    assert loaded.mode == 'RGB' and ImageChops.difference(loaded, tile).getbbox() is None
+
+    # Uncompressed tiles of the previous cache version are pruned first
+    old_tile = path.with_name('ab34.ppm')
+    tile.save(old_tile, 'PPM')
+    os.utime(old_tile, (0, 0))
+    cache.max_bytes = path.stat().st_size
+    assert cache.prune() == 1 and path.exists() and not old_tile.exists()
+
+
+def test_process_pool_writes_the_same_pages(tmp_path, photos):
+    photos.add_groups(6)
+    pages = []
+    for workers in (1, 2):
+        output = tmp_path / f"catalog_{workers}"
+        assert MiasCatalogCreator(photos.path, output, workers=workers).create_catalog() == []
+        pages.append({path.name: path.read_bytes() for path in output.glob('*.jpg')})
+    assert len(pages[0]) == 6 and pages[1] == pages[0]
+
+
+def test_reduced_decoding_stays_close_to_exact_decode(tmp_path, photos):
+    # Sample photos at twice their size, so both the main photo and the circle are decoded reduced
+    for number in (1, 2):
+        with Image.open(SAMPLES_DIR / f"Body_Ada-249900-{number}.jpg") as sample:
+            photos.add('Body Ada', 24990.0, number, image=sample.resize((sample.width * 2, sample.height * 2)))
+
+    pages = {}
+    for fast_decode in (True, False):
+        creator = MiasCatalogCreator(photos.path, tmp_path / f"catalog_{fast_decode}", fast_decode=fast_decode)
+        decoded = []
+        open_source_image = creator.open_source_image
+
+        def record_decode(path, targets):
+            image, boxes = open_source_image(path, targets)
+            decoded.append(image.size)
+            return image, boxes
+
+        creator.open_source_image = record_decode
+        assert creator.create_catalog() == []
+        with Image.open(tmp_path / f"catalog_{fast_decode}" / "Body_Ada-24990-catalog.jpg") as page:
+            pages[fast_decode] = page.convert('RGB')
+        if fast_decode:
+            assert all(width < 3000 for width, _ in decoded)
+
+    # Mean per-channel difference below 1/255 in the main photo and in the circle (see README)
+    layout = creator.render_plan.layouts[0]
+    (x, y), (width, height) = layout.main_position, layout.main_size
+    (cx, cy), diameter = layout.circle_positions[0], layout.circle_diameter
+    difference = ImageChops.difference(pages[True], pages[False])
+    for box in ((x, y, x + width, y + height), (cx, cy, cx + diameter, cy + diameter)):
+        assert max(ImageStat.Stat(difference.crop(box)).mean) < 1
+
+
+def test_render_items_pulls_groups_as_room_frees_up(tmp_path, photos):
+    for number in range(8):
+        photos.add(f'Body Modelo {number}', 10000.0 + number, 1, (number * 30, 90, 90))
+    creator = MiasCatalogCreator(photos.path, tmp_path / "catalog", workers=2, max_in_flight=2)
+    groups = creator.group_product_images()
+
+    pulled = []
+
+    def items():
+        for key in sorted(groups):
+            pulled.append(key)
+            yield key, groups[key]
+
+    results = creator.render_items(items())
+    key, output_filename, stats, error = next(results)
+    # At most max_in_flight groups are taken before the first page is done
+    assert error is None and len(pulled) <= 3
+    assert [key] + [result[0] for result in results] == sorted(groups)
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason="needs /proc to count open files")
+def test_rendering_releases_files(tmp_path, photos):
+    for number in range(20):
+        for photo in range(1, 4):
+            photos.add(f'Body Modelo {number}', 10000.0 + number, photo, (number * 10, photo * 60, 90))
+    creator = MiasCatalogCreator(photos.path, tmp_path / "catalog")
+    creator.create_catalog()
+    open_files = len(os.listdir('/proc/self/fd'))
+    creator.create_catalog(force=True)
+    assert len(list((tmp_path / "catalog").glob('*.jpg'))) == 20
+    assert len(os.listdir('/proc/self/fd')) <= open_files
+
+
+def test_watch_renders_finished_groups_while_others_are_written(tmp_path, photos, creator_command):
+    output = tmp_path / "catalog"
+    watcher = subprocess.Popen(creator_command('--watch', '--watch-interval', '0.2', '--settle', '1',
+                                               '--input', str(photos.path), '--output', str(output)),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        photos.add('Body Ada', 24990.0, 1)
+        photos.add('Body Ada', 24990.0, 2, (90, 120, 200))
+
+        # A scraper keeps writing photos of another product, one every 0.25s
+        ada_page = output / "Body_Ada-24990-catalog.jpg"
+        rendered_during_writes = False
+        for number in range(1, 25):
+            photos.add('Body Nubia', 29990.0, number, (number * 10, 80, 80))
+            time.sleep(0.25)
+            rendered_during_writes = rendered_during_writes or ada_page.exists()
+        assert rendered_during_writes
+        assert not (output / "Body_Nubia-29990-catalog.jpg").exists()
+
+        # Once the writes stop, the other product settles too
+        deadline = time.monotonic() + 20
+        while not (output / "Body_Nubia-29990-catalog.jpg").exists() and time.monotonic() < deadline:
+            time.sleep(0.2)
+        assert (output / "Body_Nubia-29990-catalog.jpg").exists()
+    finally:
+        watcher.kill()
+        watcher.wait()
+
+
+def test_quality_limits(tmp_path):
+    creator = MiasCatalogCreator(tmp_path, tmp_path / "catalog")
+    for quality in (0, 101):
+        with pytest.raises(ValueError, match="between 1 and 100"):
+            creator.set_output_format('jpeg', quality=quality)
+
+    # A page that cannot fit is encoded at the configured quality when it is below MIN_QUALITY
+    page = Image.effect_noise((400, 400), 100).convert('RGB')
+    creator.set_output_format('jpeg', quality=10, max_bytes=100)
+    data, quality = creator.encode_page_to_size(page)
+    assert quality == 10 and data == creator.encode_page(page)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Tests of catalog page layouts
+Run with pytest
+"""
+
+import json
+
+import pytest
+from PIL import Image
+
+from catalog_asset_cache import AssetCache
+from catalog_creator import MiasCatalogCreator
+from catalog_layouts import available_layouts, resolve_layouts
+from catalog_manifest import MANIFEST_NAME, CatalogManifest
+
+
+def test_layout_files(tmp_path):
+    layouts = available_layouts()
+    assert {'default', 'instagram', 'story', 'print'} <= set(layouts)
+    assert layouts['default']['suffix'] == '' and layouts['story']['suffix'] == '-story'
+
+    # A layout file adds layouts and overrides those of layouts.json
+    square = dict(layouts['instagram'], name='square', page={'width': 1080, 'height': 1080, 'background': [0, 0, 0]})
+    del square['suffix']
+    path = tmp_path / "extra.json"
+    path.write_text(json.dumps(square))
+    (square_spec,) = resolve_layouts(['square'], [path])
+    assert square_spec['suffix'] == '-square' and square_spec['circles']['direction'] == 'vertical'
+
+    with pytest.raises(ValueError, match="Unknown layout"):
+        resolve_layouts(['default', 'poster'])
+    # Two layouts writing the same files
+    path.write_text(json.dumps(dict(square, suffix='-story')))
+    with pytest.raises(ValueError, match="same suffix"):
+        resolve_layouts(['story', 'square'], [path])
+
+    path.write_text(json.dumps(dict(square, circles=dict(square['circles'], diameter="200"))))
+    with pytest.raises(ValueError, match="circles.diameter must be an integer above 0"):
+        resolve_layouts(['square'], [path])
+    path.write_text(json.dumps(dict(square, page=dict(square['page'], background=[0, 0, 300]))))
+    with pytest.raises(ValueError, match="page.background must be an"):
+        resolve_layouts(['square'], [path])
+
+    del square['price']
+    path.write_text(json.dumps(square))
+    with pytest.raises(ValueError, match="no price section"):
+        resolve_layouts(['square'], [path])
+
+
+def test_layouts_rendered_from_one_decode(tmp_path, photos):
+    for number in range(1, 4):
+        photos.add('Body Ada', 24990.0, number, (number * 60, 120, 90), size=(1200, 1800))
+    creator = MiasCatalogCreator(photos.path, tmp_path / "catalog")
+    creator.set_layouts(['default', 'instagram', 'story', 'print'])
+
+    decoded = []
+    open_source_image = creator.open_source_image
+    creator.open_source_image = lambda path, targets: decoded.append(path) or open_source_image(path, targets)
+    assert creator.create_catalog() == []
+    assert sorted(decoded) == sorted(photos.path.iterdir())
+
+    sizes = {'': (2000, 2500), '-instagram': (1080, 1350), '-story': (1080, 1920), '-print': (2480, 3508)}
+    for suffix, size in sizes.items():
+        with Image.open(tmp_path / "catalog" / f"Body_Ada-24990-catalog{suffix}.jpg") as page:
+            assert page.size == size
+    entry = CatalogManifest.load(tmp_path / "catalog" / MANIFEST_NAME).groups['Body Ada-$24.990']
+    assert entry['output'] == "Body_Ada-24990-catalog.jpg" and len(entry['page']['files']) == 4
+
+    # Dropping layouts removes their pages
+    creator.set_layouts(['default', 'story'])
+    assert creator.create_catalog() == []
+    assert sorted(path.name for path in (tmp_path / "catalog").glob('*.jpg')) == [
+        "Body_Ada-24990-catalog-story.jpg", "Body_Ada-24990-catalog.jpg"]
+
+
+def test_cached_tiles_match_a_fresh_decode(tmp_path, photos):
+    # Large enough that the default and print layouts want different decode scales
+    photos.add('Body Ada', 24990.0, 1, image=Image.linear_gradient('L').resize((2600, 5000)).convert('RGB'))
+    page = tmp_path / "catalog" / "Body_Ada-24990-catalog.jpg"
+
+    creator = MiasCatalogCreator(photos.path, tmp_path / "catalog")
+    creator.set_layouts(['default', 'print'])
+    creator.create_catalog()
+    uncached = page.read_bytes()
+
+    creator.asset_cache = AssetCache(tmp_path / "cache")
+    creator.create_catalog(force=True)
+    tiles = sorted((tmp_path / "cache").glob('*/*.png'))
+    assert len(tiles) == 2 and page.read_bytes() == uncached
+
+    # Evict the default layout's tile only: the photo is decoded for both again
+    for tile in tiles:
+        with Image.open(tile) as image:
+            if image.size == (1300, 2500):
+                tile.unlink()
+    creator.create_catalog(force=True)
+    assert page.read_bytes() == uncached
+    assert len(list((tmp_path / "cache").glob('*/*.png'))) == 2
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Tests of render profiling and benchmark summaries
+Run with pytest
+"""
+
+from benchmark_catalog import summarize
+from catalog_creator import MiasCatalogCreator
+from catalog_profiler import RenderProfile
+from summary_stats import percentile
+
+
+def test_percentile_is_nearest_rank():
+    # The smallest value with at least `fraction` of the values at or below it
+    assert percentile([2, 1], 0.5) == 1
+    assert percentile(range(1, 11), 0.5) == 5
+    assert percentile(range(1, 11), 0.95) == 10
+    assert percentile(range(1, 21), 0.5) == 10
+    assert percentile(range(1, 21), 0.95) == 19
+    assert percentile(range(100, 0, -1), 0.5) == 50
+    assert percentile(range(1, 101), 0.95) == 95
+    assert percentile([7], 0.95) == 7
+    assert percentile(range(1, 11), 0) == 1
+
+
+def test_benchmark_summary():
+    # 20 pages of 1 to 20 ms
+    seconds = [ms / 1e3 for ms in range(20, 0, -1)]
+    assert summarize(seconds) == {'total_s': 0.21, 'p50_ms': 10.0, 'p95_ms': 19.0}
+    assert summarize([0.004, 0.002]) == {'total_s': 0.006, 'p50_ms': 2.0, 'p95_ms': 4.0}
+
+
+def test_profile_counts_the_files_of_every_layout(tmp_path, photos):
+    photos.add_groups(3)
+    creator = MiasCatalogCreator(photos.path, tmp_path / "catalog")
+    creator.set_layouts(['default', 'story'])
+    profile = RenderProfile()
+    assert creator.create_catalog(profile=profile) == []
+
+    files = list((tmp_path / "catalog").glob('*.jpg'))
+    assert len(files) == 6 and sorted(profile.file_sizes) == sorted(path.stat().st_size for path in files)
+    assert [page['files'] for page in profile.pages] == [2, 2, 2]
+    mean = sum(path.stat().st_size for path in files) / 6 / 1e3
+    assert f"bytes/file: mean {mean:.0f} KB" in profile.summary_lines()[-1]
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests of sharded catalog builds
+Run with pytest
+"""
+
+import json
+import subprocess
+
+import pytest
+
+from catalog_manifest import MANIFEST_NAME
+from catalog_shards import merge_shard_manifests, parse_shard, select_shard, shard_manifest_name, shard_of
+
+
+def test_shards_partition_groups():
+    keys = [f"Body Modelo {n}-$1{n:03d}" for n in range(200)]
+    groups = {key: [] for key in keys}
+    shards = [select_shard(groups, index, 4) for index in range(1, 5)]
+    assert sorted(key for shard in shards for key in shard) == sorted(keys)
+    assert all(len(shard) > 20 for shard in shards)
+    # Stable across processes, unlike hash()
+    assert shard_of("Body Ada-$24.990", 4) == 3
+    assert parse_shard("2/4") == (2, 4)
+    for value in ("0/4", "5/4", "2", "a/b"):
+        with pytest.raises(ValueError):
+            parse_shard(value)
+
+
+def test_shard_processes_and_merge(tmp_path, photos, creator_command):
+    output = tmp_path / "catalog"
+    photos.add_groups(10)
+
+    def run_creator(*args):
+        return subprocess.run(creator_command('--input', str(photos.path), '--output', str(output), *args),
+                              capture_output=True, text=True)
+
+    # Shards of one build run at the same time against the same folders
+    shards = [subprocess.Popen(creator_command('--input', str(photos.path), '--output', str(output),
+                                               '--shard', f"{index}/3"),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+              for index in (1, 2)]
+    assert all(shard.wait() == 0 for shard in shards)
+
+    # Shard 3 is missing
+    assert merge_shard_manifests(output)[1] == [
+        "Shard 3/3 is missing", f"{len(list(output.glob('*.jpg')))} of 10 product groups are in the shard manifests"]
+    assert run_creator('--merge-shards').returncode == 1
+
+    assert run_creator('--shard', '3/3').returncode == 0
+    shard = json.loads((output / shard_manifest_name(3, 3)).read_text())
+    assert shard['shard']['rendered'] == len(shard['groups'])
+    assert all(entry['page']['sha256'] and entry['page']['seconds'] > 0 for entry in shard['groups'].values())
+
+    result = run_creator('--merge-shards')
+    assert result.returncode == 0, result.stderr
+    merged = json.loads((output / MANIFEST_NAME).read_text())
+    assert len(merged['groups']) == len(list(output.glob('*-catalog.jpg'))) == 10
+    assert not list(output.glob('catalog_manifest.shard-*'))
+
+    # The merged manifest keeps later builds incremental, sharded or not
+    result = run_creator('--shard', '1/3')
+    assert "0 to render" in result.stderr
+    result = run_creator()
+    assert "10 pages up to date, 0 to render" in result.stderr
@@ -1,67 +1,79 @@
 #!/usr/bin/env python3
 """
 Test script to verify filename parsing works correctly
+Run with pytest, or directly to print the parse results
 """
 
-import re
 from pathlib import Path
 
-def extract_product_info(filename):
-    """Extract product info from filename pattern"""
-    patterns = [
-        r'(.+?)-(\d+)-(\d+)',  # Original pattern
-        r'Body_(.+?)-(\d+)-(\d+)',  # Body_Name-price-number
-        r'Leggins_(.+?)-(\d+)-(\d+)',  # Leggins_Name-price-number
-        r'(.+?)_-_(\d+)-(\d+)-(\d+)',  # Name_-_code-price-number
-        r'(.+?)_(.+?)-(\d+)-(\d+)',  # Name_Description-price-number
-    ]
-    
-    for pattern in patterns:
-        match = re.match(pattern, filename)
-        if match:
-            groups = match.groups()
-            if len(groups) == 3:
-                name, price, number = groups
-                return name, f"${int(price):,}".replace(',', '.'), int(number)
-            elif len(groups) == 4:
-                # Handle pattern with code
-                name, code, price, number = groups
-                return f"{name} {code}", f"${int(price):,}".replace(',', '.'), int(number)
-    
-    # If no pattern matches, try a simple split
-    parts = filename.split('-')
-    if len(parts) >= 3:
-        name = '-'.join(parts[:-2])
-        price = parts[-2]
-        number = parts[-1]
-        try:
-            return name, f"${int(price):,}".replace(',', '.'), int(number)
-        except ValueError:
-            pass
-    
-    return None, None, None
+from product_filenames import parse_product_filename, product_stem, scan_product_images
 
-# Test with actual filenames from your directory
-test_filenames = [
-    "Body_Abigail-299900-1.jpg",
-    "Body_Ada-249900-1.jpg",
-    "Leggins_Faja_-_3104-337400-1.jpg",
-    "Leggins_Punto_Roma-159900-1.jpg",
-    "Cinturilla_Ltex_Forrada-119900-1.png",
-    "Traje_de_bao_Karen-259900-1.jpg"
-]
+# filename -> (name, price, number, group key), None if it must not parse
+PARSE_CASES = {
+    "Body_Abigail-299900-1.jpg": ("Body_Abigail", 29990, 1, "Body Abigail-$29.990"),
+    "Body_Ada-249900-1.jpg": ("Body_Ada", 24990, 1, "Body Ada-$24.990"),
+    "Body_Nubia-299900-2.png": ("Body_Nubia", 29990, 2, "Body Nubia-$29.990"),
+    "Leggins_Faja_-_3104-337400-1.jpg": ("Leggins_Faja_-_3104", 33740, 1, "Leggins Faja - 3104-$33.740"),
+    "Leggins_Punto_Roma-159900-1.jpg": ("Leggins_Punto_Roma", 15990, 1, "Leggins Punto Roma-$15.990"),
+    "Cinturilla_Ltex_Forrada-119900-1.png": ("Cinturilla_Ltex_Forrada", 11990, 1, "Cinturilla Ltex Forrada-$11.990"),
+    "Traje_de_bao_Karen-259900-1.jpg": ("Traje_de_bao_Karen", 25990, 1, "Traje de bao Karen-$25.990"),
+    "Short_Faja_810-199900-3.jpg": ("Short_Faja_810", 19990, 3, "Short Faja 810-$19.990"),
+    "Set_2-3-1299900-12.jpg": ("Set_2-3", 129990, 12, "Set 2-3-$129.990"),
+    "Body_Ada-249900.jpg": None,
+    "Body_Ada-abc-1.jpg": None,
+    "Body_Ada-249900-1b.jpg": None,
+    "-249900-1.jpg": None,
+    "_-249900-1.jpg": None,
+    "Imagen de WhatsApp 2025-04-24 a las 12.53.50_2f858a0a.jpg": None,
+}
 
-print("Testing filename parsing:")
-print("-" * 50)
 
-for filename in test_filenames:
-    name, price, number = extract_product_info(Path(filename).stem)
-    if name and price and number is not None:
-        print(f"File: {filename}")
-        print(f"  Name: {name}")
-        print(f"  Price: {price}")
-        print(f"  Number: {number}")
-        print()
-    else:
-        print(f"Failed to parse: {filename}")
-        print()
+def test_parse_product_filename():
+    for filename, expected in PARSE_CASES.items():
+        record = parse_product_filename(Path(filename).stem)
+        if expected is None:
+            assert record is None, filename
+        else:
+            assert (record.name, record.price, record.number, record.group_key) == expected, filename
+
+
+def test_scraper_names_round_trip():
+    # Scraped prices are floats; their decimal point is dropped from the name
+    stem = product_stem("Body Abigail", 29990.0, 2)
+    assert stem == "Body_Abigail-299900-2"
+    record = parse_product_filename(stem)
+    assert record.group_key == "Body Abigail-$29.990"
+    assert record.number == 2
+
+
+def test_scan_product_images(tmp_path):
+    (tmp_path / "Body").mkdir()
+    for name in ["Body/Body_Ada-249900-1.jpg", "Body/Body_Ada-249900-2.JPG",
+                 "Leggins_Punto_Roma-159900-1.png", "notes.txt", "unknown.jpeg"]:
+        (tmp_path / name).touch()
+
+    flat = {path.name: record for path, record in scan_product_images(tmp_path)}
+    assert sorted(flat) == ["Leggins_Punto_Roma-159900-1.png", "unknown.jpeg"]
+    assert flat["unknown.jpeg"] is None
+
+    nested = {path.name: record for path, record in scan_product_images(tmp_path, recursive=True)}
+    assert sorted(nested) == ["Body_Ada-249900-1.jpg", "Body_Ada-249900-2.JPG",
+                              "Leggins_Punto_Roma-159900-1.png", "unknown.jpeg"]
+    assert nested["Body_Ada-249900-2.JPG"].category == "Body"
+
+
+if __name__ == "__main__":
+    print("Testing filename parsing:")
+    print("-" * 50)
+
+    for filename in PARSE_CASES:
+        record = parse_product_filename(Path(filename).stem)
+        if record:
+            print(f"File: {filename}")
+            print(f"  Name: {record.display_name}")
+            print(f"  Price: {record.display_price}")
+            print(f"  Number: {record.number}")
+            print()
+        else:
+            print(f"Failed to parse: {filename}")
+            print()
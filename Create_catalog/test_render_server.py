@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Tests of the render server
+Run with pytest
+"""
+
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from catalog_creator import MiasCatalogCreator
+from render_server import RenderRequestHandler, RenderService
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch, photos):
+    """Start a server on a free local port; yields a function making GET requests"""
+    photos.add('Body Ada', 24990.0, 1, (200, 120, 90))
+    photos.add('Body Nubia', 29990.0, 1, (90, 120, 200))
+
+    creator = MiasCatalogCreator(photos.path, tmp_path / "catalog")
+    service = RenderService(creator, rescan_interval=0)
+    monkeypatch.setattr(RenderRequestHandler, 'service', service)
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), RenderRequestHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+
+    def get(path, headers=None):
+        request = urllib.request.Request(f"http://127.0.0.1:{httpd.server_port}{path}", headers=headers or {})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read()
+
+    get.service = service
+    get.photos = photos
+    yield get
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_miss_hit_and_not_modified(server):
+    status, headers, data = server('/page/Body_Ada-24990')
+    assert status == 200 and headers['X-Cache'] == 'miss' and headers['Content-Type'] == 'image/jpeg'
+    assert data[:2] == b'\xff\xd8'
+    etag = headers['ETag']
+
+    status, headers, cached = server('/page/Body_Ada-24990')
+    assert status == 200 and headers['X-Cache'] == 'hit' and cached == data and headers['ETag'] == etag
+
+    status, headers, body = server('/page/Body_Ada-24990', {'If-None-Match': etag})
+    assert status == 304 and body == b''
+    # Weak validators and lists of ETags match too
+    assert server('/page/Body_Ada-24990', {'If-None-Match': f'"other", W/{etag}'})[0] == 304
+    assert server.service.cache.stats()['hits'] == 1 and server.service.cache.stats()['misses'] == 1
+
+
+def test_etag_changes_when_a_photo_is_edited(server):
+    status, headers, data = server('/page/Body_Ada-24990')
+    server.photos.add('Body Ada', 24990.0, 1, (10, 200, 10))
+    status, new_headers, new_data = server('/page/Body_Ada-24990', {'If-None-Match': headers['ETag']})
+    assert status == 200 and new_headers['X-Cache'] == 'miss'
+    assert new_headers['ETag'] != headers['ETag'] and new_data != data
+
+
+def test_unknown_product(server):
+    assert server('/page/Body_Nadie-1000')[0] == 404
+    assert server('/nothing')[0] == 404
+
+
+def test_least_recently_used_pages_are_evicted(server):
+    size = len(server('/page/Body_Ada-24990')[2])
+    # Room for one page only
+    server.service.cache.max_bytes = size * 3 // 2
+    assert server('/page/Body_Nubia-29990')[1]['X-Cache'] == 'miss'
+    assert server.service.cache.stats()['pages'] == 1
+    assert server('/page/Body_Nubia-29990')[1]['X-Cache'] == 'hit'
+    assert server('/page/Body_Ada-24990')[1]['X-Cache'] == 'miss'
+    assert server('/page/Body_Ada-24990')[1]['X-Cache'] == 'hit'
+    assert server.service.cache.stats()['pages'] == 1
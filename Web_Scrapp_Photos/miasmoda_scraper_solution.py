@@ -1,121 +1,893 @@
 import os
 import re
+import sys
 import time
 import json
+import random
+import hashlib
+import argparse
+import threading
 import requests
-from urllib.parse import urljoin
+from email.utils import parsedate_to_datetime
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
 from collections import defaultdict
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
 
-class MiasModaScraper:
+# Filename format and summary statistics shared with the catalog creator
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Create_catalog'))
+from product_filenames import product_stem
+from summary_stats import percentile
+
+# Responses worth retrying: rate limited or temporary server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread-safe rate limiter: `rate` requests per second, bursts of up to `burst`"""
+    
+    def __init__(self, rate, burst=1):
+        if not rate > 0:
+            raise ValueError(f"The request rate must be above 0, not {rate}")
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Wait until a request may be sent"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def retry_after_seconds(response):
+    """Delay requested by a Retry-After header (seconds or HTTP date), or None"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# Upper bounds (ms) of the latency histogram buckets
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class ScrapeMetrics:
+    """Thread-safe counters and timings of a scrape
+    
+    Requests are counted by kind ('page' or 'image') and status, every
+    attempt included; latencies and bytes only for responses that were
+    used. An image's latency runs from sending the request to the last
+    byte of the body. The time spent waiting for the rate limit, on the
+    network, writing to disk and sleeping before retries is summed over
+    all threads, so with 8 workers it can add up to 8 seconds per second.
+    """
+    
+    TIMES = ('rate_limit_wait', 'network', 'disk', 'backoff')
+    
     def __init__(self):
-        self.base_url = "https://miasmoda.cl"
-        self.collection_url = "https://miasmoda.cl/collections/all"
-        self.output_dir = "./product_pictures"
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.retries = defaultdict(int)
+        self.bytes = defaultdict(int)
+        self.latencies = defaultdict(list)
+        self.times = dict.fromkeys(self.TIMES, 0.0)
+        self.images_done = 0
+        self.images_failed = 0
+    
+    def add_time(self, name, seconds):
+        with self.lock:
+            self.times[name] += seconds
+    
+    def request(self, kind, status):
+        """Count an attempt; status is the HTTP status or 'error'"""
+        with self.lock:
+            self.requests[kind] += 1
+            self.statuses[kind][str(status)] += 1
+    
+    def retry(self, kind):
+        with self.lock:
+            self.retries[kind] += 1
+    
+    def response(self, kind, seconds, size):
+        with self.lock:
+            self.latencies[kind].append(seconds)
+            self.bytes[kind] += size
+    
+    def image_finished(self, ok):
+        with self.lock:
+            if ok:
+                self.images_done += 1
+            else:
+                self.images_failed += 1
+    
+    def elapsed(self):
+        return time.monotonic() - self.started
+    
+    @staticmethod
+    def latency_summary(values):
+        histogram = {f"<={bound}": 0 for bound in LATENCY_BUCKETS_MS}
+        histogram['more'] = 0
+        for value in values:
+            bucket = next((f"<={bound}" for bound in LATENCY_BUCKETS_MS if value * 1e3 <= bound), 'more')
+            histogram[bucket] += 1
+        summary = {'count': len(values), 'histogram_ms': histogram}
+        if values:
+            summary.update({
+                'mean_ms': round(sum(values) / len(values) * 1e3, 1),
+                'p50_ms': round(percentile(values, 0.50) * 1e3, 1),
+                'p95_ms': round(percentile(values, 0.95) * 1e3, 1),
+                'max_ms': round(max(values) * 1e3, 1),
+            })
+        return summary
+    
+    def summary(self):
+        """Everything as a JSON-serializable dict"""
+        with self.lock:
+            elapsed = self.elapsed()
+            kinds = sorted(set(self.requests) | set(self.latencies))
+            return {
+                'elapsed_s': round(elapsed, 3),
+                'requests': {kind: self.requests[kind] for kind in kinds},
+                'statuses': {kind: dict(self.statuses[kind]) for kind in kinds},
+                'retries': {kind: self.retries[kind] for kind in kinds},
+                'not_modified': self.statuses['image'].get('304', 0),
+                'bytes': {kind: self.bytes[kind] for kind in kinds},
+                'latency': {kind: self.latency_summary(self.latencies[kind]) for kind in kinds},
+                'time_s': {name: round(seconds, 3) for name, seconds in self.times.items()},
+                'images': {'done': self.images_done, 'failed': self.images_failed},
+                'images_per_second': round(self.images_done / elapsed, 2) if elapsed else None,
+                'megabytes_per_second': round(sum(self.bytes.values()) / 1e6 / elapsed, 2) if elapsed else None,
+            }
+    
+    def progress_line(self, queued):
+        """One line of progress, e.g. for printing every few seconds"""
+        with self.lock:
+            elapsed = self.elapsed()
+            finished = self.images_done + self.images_failed
+            return (f"[{elapsed:6.1f}s] pages {len(self.latencies['page'])}, "
+                    f"images {finished}/{queued} ({self.images_done / elapsed if elapsed else 0:.1f}/s), "
+                    f"{sum(self.bytes.values()) / 1e6:.1f} MB, "
+                    f"retries {sum(self.retries.values())}, 304s {self.statuses['image'].get('304', 0)}, "
+                    f"failed {self.images_failed}")
+    
+    def summary_lines(self):
+        summary = self.summary()
+        lines = [f"Metrics ({summary['elapsed_s']:.1f}s): {summary['images_per_second']} images/s, "
+                 f"{summary['megabytes_per_second']} MB/s"]
+        for kind, latency in summary['latency'].items():
+            if latency['count']:
+                lines.append(
+                    f"  {kind:6} {summary['requests'][kind]:6} requests {summary['retries'][kind]:4} retries "
+                    f"{summary['bytes'][kind] / 1e6:9.1f} MB   p50 {latency['p50_ms']:7.1f} ms   "
+                    f"p95 {latency['p95_ms']:7.1f} ms")
+        lines.append(f"  304 Not Modified: {summary['not_modified']}")
+        lines.append("  thread time: " + ", ".join(
+            f"{name.replace('_', ' ')} {seconds:.1f}s" for name, seconds in summary['time_s'].items()))
+        return lines
+
+
+# Image types the store serves, and the extension they are saved with
+IMAGE_CONTENT_TYPES = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/webp': '.webp',
+    'image/gif': '.gif',
+    'image/avif': '.avif',
+}
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Image formats that can be requested from the Shopify CDN: 'original' keeps
+# the uploaded format, jpg/pjpg are converted by the CDN (format= parameter),
+# webp is negotiated with the Accept header
+CDN_FORMATS = ('original', 'jpg', 'pjpg', 'webp')
+
+# Most products Shopify's products.json returns per request
+MAX_PAGE_SIZE = 250
+
+DOWNLOAD_MANIFEST_NAME = "download_manifest.json"
+DOWNLOAD_MANIFEST_VERSION = 1
+
+
+class DownloadManifest:
+    """Record of downloaded images, so re-runs only transfer what changed
+    
+    Images are keyed by their normalized URL (see normalize_image_url), and
+    keep their file name across runs:
+        {"url": "https://miasmoda.cl/cdn/shop/files/1543.jpg?v=1741509261",
+         "file": "Body_Abigail-299900-1.jpg", "product": "Body Abigail-29990.0",
+         "number": 1, "etag": "...", "last_modified": "...",
+         "size": 254016, "sha256": "..."}
+    An image with the same content as another image of its product is not
+    saved again; its entry has "duplicate_of": <key of that image> instead
+    of a number. "variants" maps each variant id to the key of its image.
+    The manifest is saved at most every save_interval seconds while
+    downloading, so an interrupted run resumes from the last save. With
+    path=None the manifest is only kept in memory.
+    """
+    
+    def __init__(self, path, save_interval=2.0):
+        self.path = path
+        self.save_interval = save_interval
+        self.images = {}
+        self.variants = {}
+        self.lock = threading.Lock()
+        self.saved_at = time.monotonic()
+        try:
+            if path is None:
+                raise FileNotFoundError  # kept in memory only
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == DOWNLOAD_MANIFEST_VERSION:
+                self.images = data['images']
+                self.variants = data.get('variants', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable download manifest {path}: {e}")
+        # Numbers in use per product, including images not seen this run,
+        # and the image holding each content hash of a product
+        self.taken = defaultdict(set)
+        self.by_content = {}
+        for key, entry in self.images.items():
+            if 'duplicate_of' not in entry:
+                self.taken[entry['product']].add(entry['number'])
+                self.by_content[(entry['product'], entry['sha256'])] = key
+    
+    def assign(self, product, key):
+        """Number of an image of a product: its previous one, or the lowest free one
+        
+        An image whose product was renamed or repriced keeps its number if
+        it is free under the new name.
+        """
+        with self.lock:
+            entry = self.images.get(key)
+            if entry and 'duplicate_of' in entry:
+                entry = None
+            if entry and entry['product'] == product:
+                return entry['number']
+            if entry and entry['number'] not in self.taken[product]:
+                number = entry['number']
+            else:
+                number = 1
+                while number in self.taken[product]:
+                    number += 1
+            self.taken[product].add(number)
+            return number
+    
+    def get(self, key):
+        with self.lock:
+            return self.images.get(key)
+    
+    def file_of(self, key):
+        """File holding an image, following duplicates; None if unknown"""
+        with self.lock:
+            entry = self.images.get(key)
+            if entry and 'duplicate_of' in entry:
+                entry = self.images.get(entry['duplicate_of'])
+            return entry['file'] if entry else None
+    
+    def map_variant(self, variant_id, key):
+        with self.lock:
+            self.variants[variant_id] = key
+    
+    def record(self, key, entry):
+        """Store a downloaded image, unless its product already has one with that content
+        
+        Returns None if the entry was stored as a new image, or the key of
+        the image with the same content; the entry is then stored as its
+        duplicate and its number is freed.
+        """
+        with self.lock:
+            content = (entry['product'], entry['sha256'])
+            original = self.by_content.get(content)
+            if original is not None and original != key and original in self.images:
+                self.taken[entry['product']].discard(entry['number'])
+                entry = dict(entry, duplicate_of=original, file=self.images[original]['file'])
+                del entry['number']
+            else:
+                original = None
+                old = self.images.get(key)
+                if old and self.by_content.get((old['product'], old.get('sha256'))) == key:
+                    del self.by_content[(old['product'], old['sha256'])]
+                self.by_content[content] = key
+            self.images[key] = entry
+            due = time.monotonic() - self.saved_at >= self.save_interval
+        if due:
+            self.save()
+        return original
+    
+    def update(self, key, entry):
+        with self.lock:
+            self.images[key] = entry
+            if time.monotonic() - self.saved_at < self.save_interval:
+                return
+        self.save()
+    
+    def save(self):
+        """Write the manifest atomically"""
+        if self.path is None:
+            return
+        with self.lock:
+            data = json.dumps({'version': DOWNLOAD_MANIFEST_VERSION, 'images': self.images,
+                               'variants': self.variants}, indent=2, sort_keys=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+            self.saved_at = time.monotonic()
+
+
+CHECKPOINT_NAME = "crawl_checkpoint.jsonl"
+
+
+class CrawlCheckpoint:
+    """Journal of the current crawl, so an interrupted crawl can be resumed
+    
+    One JSON line is appended per fetched product page (with the products
+    found on it) and per finished image download:
+        {"source": "html", "page": 3, "products": [...], "last_page": 7}
+        {"image": "https://miasmoda.cl/cdn/shop/files/1543.jpg", "ok": true}
+    With resume=True, pages in the journal are not fetched again and
+    downloaded images are skipped; otherwise the journal starts empty. It
+    is deleted once a crawl completes without errors. With path=None
+    nothing is journaled.
+    """
+    
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.pages = {}
+        self.images = {}
+        if resume and path:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue  # last line cut off by the interruption
+                        if 'image' in record:
+                            self.images[record['image']] = record['ok']
+                        else:
+                            self.pages[(record['source'], record['page'])] = record
+                print(f"Resuming: {len(self.pages)} pages and {sum(self.images.values())} images already done")
+            except FileNotFoundError:
+                print("Nothing to resume, starting a new crawl")
+        self.file = open(path, 'a' if resume else 'w', encoding='utf-8') if path else None
+        self.lock = threading.Lock()
+    
+    def page(self, source, page):
+        return self.pages.get((source, page))
+    
+    def image_done(self, key):
+        return self.images.get(key, False)
+    
+    def _append(self, record):
+        if self.file is None:
+            return
+        with self.lock:
+            self.file.write(json.dumps(record) + '\n')
+            self.file.flush()
+    
+    def record_page(self, source, page, data):
+        self._append(dict(data, source=source, page=page))
+    
+    def record_image(self, key, ok):
+        self._append({'image': key, 'ok': ok})
+    
+    def close(self, complete):
+        if self.file is None:
+            return
+        self.file.close()
+        if complete:
+            os.remove(self.path)
+
+
+PRODUCT_VARIANTS_KEY = '"productVariants":'
+
+
+# Size suffixes of older Shopify image URLs, e.g. 1543_1024x1024.jpg or 1543_grande.jpg
+SHOPIFY_SIZE_SUFFIX = re.compile(
+    r'_(?:\d+x\d*|x\d+|pico|icon|thumb|small|compact|medium|large|grande|original|master)(?:@\dx)?(?=\.\w+$)',
+    re.IGNORECASE
+)
+
+
+def normalize_image_url(url):
+    """The URL an image is known by, whatever size or version was asked for
+    
+    Drops the query string (?v=<upload time>, &width=...) and Shopify size
+    suffixes, and lowercases the host.
+    """
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme, parts.netloc.lower(), SHOPIFY_SIZE_SUFFIX.sub('', parts.path), '', ''))
+
+
+def is_shopify_cdn(url):
+    """True for images served by the Shopify CDN, which can resize them"""
+    parts = urlsplit(url)
+    return parts.netloc.endswith('cdn.shopify.com') or parts.path.startswith('/cdn/shop/')
+
+
+def cdn_image_url(url, width=None, image_format='original'):
+    """Ask the Shopify CDN for at most `width` pixels wide and the given format
+    
+    The CDN never enlarges, so smaller originals come back unchanged. Other
+    URLs are returned as they are.
+    """
+    if not is_shopify_cdn(url):
+        return url
+    parts = urlsplit(url)
+    query = [(name, value) for name, value in parse_qsl(parts.query) if name not in ('width', 'format')]
+    if width:
+        query.append(('width', str(width)))
+    if image_format in ('jpg', 'pjpg'):
+        query.append(('format', image_format))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def json_variant_records(product):
+    """Records like variant_record's for a product from products.json
+    
+    A variant's image is its featured image, else the first product image
+    listing the variant, else the product's first image.
+    """
+    images = product.get('images') or []
+    image_for_variant = {}
+    for image in images:
+        for variant_id in image.get('variant_ids') or []:
+            image_for_variant.setdefault(variant_id, image.get('src'))
+    default_image = images[0].get('src') if images else None
+    
+    records = []
+    for variant in product.get('variants') or []:
+        try:
+            amount = float(variant['price'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        featured = variant.get('featured_image') or {}
+        records.append({
+            'id': str(variant['id']) if variant.get('id') is not None else None,
+            'sku': variant.get('sku') or '',
+            'title': product.get('title', ''),
+            'variant_title': variant.get('title') or '',
+            'price': amount,
+            'currency': None,
+            'image_url': featured.get('src') or image_for_variant.get(variant.get('id')) or default_image,
+            'product_id': str(product['id']) if product.get('id') is not None else None,
+            'product_type': product.get('product_type') or '',
+            'url': f"/products/{product['handle']}" if product.get('handle') else None,
+        })
+    return records
+
+
+def variant_record(variant):
+    """Flatten a productVariants entry, or None if it has no product title or price"""
+    if not isinstance(variant, dict):
+        return None
+    product = variant.get('product') or {}
+    price = variant.get('price') or {}
+    image = variant.get('image') or {}
+    try:
+        title = product['title']
+        amount = float(price['amount'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return {
+        'id': str(variant['id']) if variant.get('id') is not None else None,
+        'sku': variant.get('sku') or '',
+        'title': title,
+        'variant_title': variant.get('title') or '',
+        'price': amount,
+        'currency': price.get('currencyCode'),
+        'image_url': image.get('src') if isinstance(image, dict) else None,
+        'product_id': str(product['id']) if product.get('id') is not None else None,
+        'product_type': product.get('type') or '',
+        'url': product.get('url'),
+    }
+
+
+class MiasModaScraper:
+    def __init__(self, base_url="https://miasmoda.cl", output_dir="./product_pictures",
+                 workers=8, rate=2.0, burst=4, max_retries=5, backoff=1.0, max_backoff=60.0,
+                 source='auto', page_size=250, image_width=2000, image_format='original',
+                 page_workers=4, resume=False, debug_html=None, progress=0, persist=True):
+        self.base_url = base_url.rstrip('/')
+        self.collection_url = f"{self.base_url}/collections/all"
+        self.output_dir = output_dir
+        
+        # Where the product list comes from: 'json' (products.json), 'html'
+        # (collection pages) or 'auto' (products.json, else collection pages)
+        self.source = source
+        # A shorter page than requested ends the list, so never ask for more
+        # than the store returns
+        self.page_size = min(max(1, page_size), MAX_PAGE_SIZE)
+        # Collection pages fetched at once, continuing an interrupted crawl
+        # (see CrawlCheckpoint), and where to save page 1 for debugging
+        self.page_workers = max(1, page_workers)
+        self.resume = resume
+        self.debug_html = debug_html
+        
+        # Request counts and timings (see ScrapeMetrics), printed as a
+        # progress line every `progress` seconds if set
+        self.metrics = ScrapeMetrics()
+        self.progress = progress
+        
+        # Receives every image in memory as it is downloaded, e.g. to render
+        # it right away (see scrape_to_catalog.py). It is told
+        # image_queued(product) for each image queued, image_ready(product,
+        # file_name, data) for each image kept, image_done(product, ok) when
+        # a download finishes and queueing_finished() once all images of
+        # the run are queued. With persist=False the images are not saved
+        # and nothing is written to output_dir.
+        self.listener = None
+        self.persist = persist
+        
+        # Size and format asked from the Shopify CDN. The catalog needs at
+        # most 1300x2500 for the main image, so 2000px wide loses nothing
+        self.image_width = image_width
+        self.image_format = image_format
+        
+        # Concurrent downloads share one connection pool
+        self.workers = max(1, workers)
         self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
+        
+        # Politeness: at most `rate` requests per second to each host, and
+        # exponential backoff with jitter when the server pushes back
+        if not rate > 0:
+            raise ValueError(f"The request rate must be above 0, not {rate}")
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.buckets = {}
+        self.buckets_lock = threading.Lock()
+        
         self.product_counters = defaultdict(int)
+        self.manifest = None
+        self.checkpoint = None
+        self.failed_pages = []
+        # Image keys already queued in this run
+        self.queued = set()
+        # Downloads submitted in this run, cancelled if the run stops early
+        self.submitted = []
+        
+    def bucket_for(self, url):
+        """Token bucket of the URL's host"""
+        host = urlsplit(url).netloc
+        with self.buckets_lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.burst)
+            return self.buckets[host]
+    
+    def backoff_delay(self, attempt):
+        """Exponential backoff with full jitter for the given retry attempt"""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+    
+    def fetch(self, url, kind='page', **kwargs):
+        """GET a URL within the host's rate limit, retrying 429/5xx and connection errors
+        
+        Retry-After headers are honored. Raises requests.HTTPError for other
+        error statuses or once the retries are used up. The request is
+        counted in self.metrics under kind; the latency and size of streamed
+        responses are recorded by save_response.
+        """
+        kwargs.setdefault('timeout', 15)
+        bucket = self.bucket_for(url)
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.metrics.retry(kind)
+            wait_start = time.perf_counter()
+            bucket.acquire()
+            start = time.perf_counter()
+            self.metrics.add_time('rate_limit_wait', start - wait_start)
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.metrics.add_time('network', time.perf_counter() - start)
+                self.metrics.request(kind, 'error')
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+                print(f"Retrying {url} in {delay:.1f}s ({type(e).__name__})")
+            else:
+                seconds = time.perf_counter() - start
+                self.metrics.add_time('network', seconds)
+                self.metrics.request(kind, response.status_code)
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    response.raise_for_status()
+                    if not kwargs.get('stream'):
+                        self.metrics.response(kind, seconds, len(response.content))
+                    return response
+                delay = retry_after_seconds(response)
+                if delay is None:
+                    delay = self.backoff_delay(attempt)
+                delay = min(delay, self.max_backoff)
+                response.close()
+                print(f"Retrying {url} in {delay:.1f}s (HTTP {response.status_code})")
+            self.metrics.add_time('backoff', delay)
+            time.sleep(delay)
         
+
     def setup_output_directory(self):
-        """Create output directory if it doesn't exist."""
-        if not os.path.exists(self.output_dir):
+        """Create output directory if it doesn't exist, and load its download manifest."""
+        if self.persist and not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
             print(f"Created output directory: {self.output_dir}")
+        if not self.persist:
+            self.manifest = DownloadManifest(None)
+            return
+        self.manifest = DownloadManifest(os.path.join(self.output_dir, DOWNLOAD_MANIFEST_NAME))
         
     def extract_product_data(self, html_content):
-        """Extract product data from HTML page content."""
-        products = []
+        """Extract product data from HTML page content.
         
-        # Pattern to find the productVariants array more precisely
-        # Look for the entire meta object structure
-        meta_pattern = r'meta\s*=\s*{[^}]*?"productVariants":\s*\[(.*?)\]\s*[,}]'
-        meta_match = re.search(meta_pattern, html_content, re.DOTALL)
+        Finds every "productVariants": [...] array the store embeds in the
+        page with a plain string search and decodes it with the JSON
+        parser, so field order and nesting do not matter. Returns one record
+        per variant (duplicates across arrays are dropped):
+            {'id': '46602929471770', 'sku': '', 'title': 'Body Abigail',
+             'variant_title': 'Negro / Única (S/38 - M/40 - L/42)',
+             'price': 29990.0, 'currency': 'CLP', 'image_url': '//miasmoda.cl/cdn/...',
+             'product_id': '8596375273754', 'product_type': '', 'url': '/products/...'}
+        image_url is None for variants without an image.
+        """
+        products = []
+        seen = set()
+        decoder = json.JSONDecoder()
+        position = html_content.find(PRODUCT_VARIANTS_KEY)
         
-        if meta_match:
-            variants_content = meta_match.group(1)
-            
-            # Pattern to match each product variant object exactly like the structure you provided
-            product_pattern = r'\{[^{}]*?"price":\s*\{[^{}]*?"amount":\s*([\d.]+)[^{}]*?\}[^{}]*?"product":\s*\{[^{}]*?"title":\s*"([^"]*)"[^{}]*?\}[^{}]*?"image":\s*\{[^{}]*?"src":\s*"([^"]*)"[^{}]*?\}[^{}]*?\}'
-            
-            product_matches = re.findall(product_pattern, variants_content)
+        while position != -1:
+            start = position + len(PRODUCT_VARIANTS_KEY)
+            while start < len(html_content) and html_content[start].isspace():
+                start += 1
+            try:
+                if html_content[start:start + 1] != '[':
+                    raise ValueError("not an array")
+                variants, end = decoder.raw_decode(html_content, start)
+            except ValueError:
+                # Not JSON (e.g. a script building the array); keep looking
+                end = start
+                variants = []
             
-            for price, title, image_url in product_matches:
-                products.append({
-                    'title': title,
-                    'price': float(price),
-                    'image_url': image_url
-                })
-        
-        # If the above pattern doesn't work, try a simpler approach
-        if not products:
-            # Look for productVariants arrays directly
-            variants_pattern = r'"productVariants":\s*\[(.*?)\]'
-            variants_matches = re.findall(variants_pattern, html_content, re.DOTALL)
+            for variant in variants if isinstance(variants, list) else []:
+                record = variant_record(variant)
+                if record is None:
+                    continue
+                identity = record['id'] or (record['title'], record['variant_title'], record['image_url'])
+                if identity not in seen:
+                    seen.add(identity)
+                    products.append(record)
             
-            for variants_content in variants_matches:
-                # Extract products using the pattern based on your example
-                product_pattern = r'\{[^{}]*?"price":\s*\{[^{}]*?"amount":\s*([\d.]+)[^{}]*?\}[^{}]*?"product":\s*\{[^{}]*?"title":\s*"([^"]*)"[^{}]*?\}[^{}]*?"image":\s*\{[^{}]*?"src":\s*"([^"]*)"[^{}]*?\}[^{}]*?\}'
-                
-                product_matches = re.findall(product_pattern, variants_content)
-                
-                for price, title, image_url in product_matches:
-                    products.append({
-                        'title': title,
-                        'price': float(price),
-                        'image_url': image_url
-                    })
-        
-        # If still no products, try the most direct approach
-        if not products:
-            # Pattern exactly matching your example structure
-            direct_pattern = r'\{"price":\{"amount":([\d.]+),"currencyCode":"CLP"\},"product":\{"title":"([^"]*)"[^}]*\}[^}]*"image":\{"src":"([^"]*)"'
-            direct_matches = re.findall(direct_pattern, html_content)
-            
-            for price, title, image_url in direct_matches:
-                products.append({
-                    'title': title,
-                    'price': float(price),
-                    'image_url': image_url
-                })
+            position = html_content.find(PRODUCT_VARIANTS_KEY, end)
         
         return products
     
-    def get_unique_filename(self, title, price):
-        """Generate unique filename for products with same title and price."""
-        key = f"{title}-{price}"
-        self.product_counters[key] += 1
-        counter = self.product_counters[key]
+    def absolute_url(self, image_url):
+        """Resolve protocol-relative and relative image URLs"""
+        if image_url.startswith('//'):
+            return 'https:' + image_url
+        if not image_url.startswith('http'):
+            return urljoin(self.base_url, image_url)
+        return image_url
+    
+    def image_key(self, image_url):
+        """Download manifest key of an image: its normalized URL"""
+        return normalize_image_url(self.absolute_url(image_url))
+    
+    def get_unique_filename(self, title, price, image_url):
+        """Generate unique filename for products with same title and price.
+        
+        An image keeps the number it had in earlier runs; new images get the
+        lowest number not used by their product.
+        """
+        product = f"{title}-{price}"
+        self.product_counters[product] += 1
+        number = self.manifest.assign(product, self.image_key(image_url))
         
         # Clean filename
-        filename = f"{title}-{price}-{counter}".replace(' ', '_')
-        filename = re.sub(r'[^a-zA-Z0-9_-]', '', filename)
-        return filename
+        return product_stem(title, price, number)
+    
+    def image_extension(self, response, image_url):
+        """File extension of a downloaded image, from its Content-Type
+        
+        Raises ValueError if the response is not an image (e.g. an HTML
+        error page served with status 200).
+        """
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type in IMAGE_CONTENT_TYPES:
+            return IMAGE_CONTENT_TYPES[content_type]
+        if content_type in ('', 'application/octet-stream', 'binary/octet-stream'):
+            # No usable type: fall back to the URL
+            url_ext = os.path.splitext(image_url.split('?')[0])[1].lower()
+            if url_ext in IMAGE_CONTENT_TYPES.values() or url_ext == '.jpeg':
+                return url_ext
+        raise ValueError(f"not an image (Content-Type: {content_type or 'missing'})")
     
-    def download_image(self, image_url, filename):
-        """Download image from URL to specified filename."""
+    def save_response(self, response, part_path=None, keep=False):
+        """Stream a response body to part_path; returns its size, SHA-256 and body
+        
+        The caller renames the file once it knows where the image goes, so
+        no image exists half-written under its real name. A body shorter or
+        longer than Content-Length is rejected and its file removed. The body
+        is returned as bytes if part_path is None or keep is set, else None.
+        """
+        expected = response.headers.get('Content-Length')
+        encoded = response.headers.get('Content-Encoding', 'identity') != 'identity'
+        digest = hashlib.sha256()
+        size = 0
+        chunks = [] if keep or part_path is None else None
+        start = time.perf_counter()
+        disk = 0.0
         try:
-            # Handle relative URLs
-            if image_url.startswith('//'):
-                image_url = 'https:' + image_url
-            elif not image_url.startswith('http'):
-                image_url = urljoin(self.base_url, image_url)
+            with open(part_path, 'wb') if part_path else nullcontext() as f:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    if f:
+                        write_start = time.perf_counter()
+                        f.write(chunk)
+                        disk += time.perf_counter() - write_start
+                    if chunks is not None:
+                        chunks.append(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            # Content-Length counts compressed bytes if the body was compressed
+            if expected is not None and not encoded and size != int(expected):
+                raise ValueError(f"incomplete download ({size} of {expected} bytes)")
+        except BaseException:
+            if part_path:
+                try:
+                    os.remove(part_path)
+                except FileNotFoundError:
+                    pass
+            raise
+        finally:
+            response.close()
+            body = time.perf_counter() - start
+            self.metrics.add_time('disk', disk)
+            self.metrics.add_time('network', body - disk)
+            self.metrics.response('image', response.elapsed.total_seconds() + body, size)
+        return size, digest.hexdigest(), None if chunks is None else b''.join(chunks)
+    
+    def download_image(self, image_url, filename, product):
+        """Download image from URL to specified filename.
+        
+        The image is streamed to a .part file (see save_response) and its
+        extension taken from the response's Content-Type. If the image was
+        downloaded before, the request is conditional and a 304 Not Modified
+        response keeps the local file. A file whose product name or price
+        changed is renamed instead of downloaded again. An image with the
+        same content as another image of its product is not saved; filename
+        is None for images already known to be such duplicates. Every image
+        kept is passed to the listener, if any; with persist=False images
+        are only downloaded into memory for the listener.
+        """
+        try:
+            image_url = self.absolute_url(image_url)
+            key = self.image_key(image_url)
+            
+            # Right-sized request to the CDN (the choice is recorded in the manifest)
+            request_url = cdn_image_url(image_url, self.image_width, self.image_format)
+            variant = None
+            headers = {}
+            if request_url != image_url or self.image_format == 'webp':
+                variant = {'width': self.image_width, 'format': self.image_format}
+                if self.image_format == 'webp':
+                    headers['Accept'] = 'image/webp,image/*;q=0.8'
+            
+            # Ask only for changes to a file we still have, in the same size and format
+            entry = self.manifest.get(key)
+            old_path = None
+            if entry and entry.get('variant') == variant:
+                old_file = self.manifest.file_of(key)
+                old_path = os.path.join(self.output_dir, old_file) if old_file else None
+                if old_path and os.path.exists(old_path) and os.path.getsize(old_path) == entry['size']:
+                    if entry.get('etag'):
+                        headers['If-None-Match'] = entry['etag']
+                    if entry.get('last_modified'):
+                        headers['If-Modified-Since'] = entry['last_modified']
+                else:
+                    old_path = None
             
-            response = self.session.get(image_url, timeout=10)
-            response.raise_for_status()
+            response = self.fetch(request_url, kind='image', timeout=10, headers=headers, stream=True)
             
-            # Determine file extension
-            ext = '.jpg'  # default
-            if '.' in image_url:
-                url_ext = os.path.splitext(image_url)[1].split('?')[0]
-                if url_ext in ['.jpg', '.jpeg', '.png', '.webp', '.gif']:
-                    ext = url_ext
+            def image_entry(filename, ext, size, sha256, unchanged):
+                # A 304 may leave out headers the first response had
+                return {
+                    'url': image_url,
+                    'file': filename + ext,
+                    'product': product,
+                    'number': int(filename.rsplit('-', 1)[1]),
+                    'etag': response.headers.get('ETag') or unchanged.get('etag'),
+                    'last_modified': response.headers.get('Last-Modified') or unchanged.get('last_modified'),
+                    'size': size,
+                    'sha256': sha256,
+                    'variant': variant,
+                    'content_type': unchanged.get('content_type') or response.headers.get('Content-Type'),
+                }
             
-            filepath = os.path.join(self.output_dir, filename + ext)
+            if response.status_code == 304 and old_path:
+                response.close()
+                self.metrics.response('image', response.elapsed.total_seconds(), 0)
+                if 'duplicate_of' in entry:
+                    print(f"Unchanged: {old_path} (same image as another variant)")
+                    return True
+                ext = os.path.splitext(entry['file'])[1]
+                filepath = os.path.join(self.output_dir, filename + ext)
+                if old_path != filepath:
+                    os.replace(old_path, filepath)
+                    print(f"Renamed: {old_path} -> {filepath}")
+                else:
+                    print(f"Unchanged: {filepath}")
+                self.manifest.update(key, image_entry(filename, ext, entry['size'], entry['sha256'], entry))
+                if self.listener:
+                    with open(filepath, 'rb') as f:
+                        self.listener.image_ready(product, filename + ext, f.read())
+                return True
             
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
+            try:
+                ext = self.image_extension(response, image_url)
+            except ValueError:
+                response.close()
+                raise
+            part_path = None
+            if self.persist:
+                part_path = os.path.join(self.output_dir, f".{hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]}.part")
+            size, sha256, body = self.save_response(response, part_path, keep=self.listener is not None)
+            try:
+                if filename is None:
+                    # Was a duplicate, but the image changed: it needs a number now
+                    title, price = product.rsplit('-', 1)
+                    filename = product_stem(title, price, self.manifest.assign(product, key))
+                original = self.manifest.record(key, image_entry(filename, ext, size, sha256, {}))
+                if original is not None:
+                    print(f"Skipped: {image_url} is the same image as {self.manifest.file_of(original)}")
+                    return True
+                filepath = os.path.join(self.output_dir, filename + ext)
+                if part_path:
+                    rename_start = time.perf_counter()
+                    os.replace(part_path, filepath)
+                    self.metrics.add_time('disk', time.perf_counter() - rename_start)
+            finally:
+                if part_path and os.path.exists(part_path):
+                    os.remove(part_path)
+            if self.listener:
+                self.listener.image_ready(product, filename + ext, body)
+            if not self.persist:
+                print(f"Downloaded: {filename + ext} ({size:,} bytes, not saved)")
+                return True
             
+            if entry and 'duplicate_of' not in entry and os.path.join(self.output_dir, entry['file']) != filepath:
+                # Renamed and changed: drop the old file
+                try:
+                    os.remove(os.path.join(self.output_dir, entry['file']))
+                except FileNotFoundError:
+                    pass
             print(f"Downloaded: {filepath}")
             return True
             
@@ -134,84 +906,316 @@ class MiasModaScraper:
         
         return 1
     
-    def scrape_page(self, page_number):
-        """Scrape a single page of the collection."""
-        url = f"{self.collection_url}?page={page_number}"
-        print(f"\nScraping page {page_number}: {url}")
-        
-        try:
-            response = self.session.get(url, timeout=15)
-            response.raise_for_status()
+    def queue_downloads(self, products, executor):
+        """Name the products' images (in page order) and start downloading them"""
+        futures = []
+        for product in products:
+            if not product['image_url']:
+                continue
+            key = self.image_key(product['image_url'])
+            if product.get('id'):
+                self.manifest.map_variant(product['id'], key)
+            # Variants sharing an image (e.g. sizes of one color) download it once
+            if key in self.queued:
+                continue
+            self.queued.add(key)
             
-            products = self.extract_product_data(response.text)
-            print(f"Found {len(products)} products on page {page_number}")
-            
-            for product in products:
-                filename = self.get_unique_filename(product['title'], product['price'])
-                self.download_image(product['image_url'], filename)
-                time.sleep(1)  # 1 second delay between image downloads
-            
-            return True
-            
-        except Exception as e:
-            print(f"Error scraping page {page_number}: {str(e)}")
-            return False
+            product_key = f"{product['title']}-{product['price']}"
+            entry = self.manifest.get(key)
+            if entry and 'duplicate_of' in entry and entry['product'] == product_key:
+                # Same content as another image: only checked for changes
+                filename = None
+            else:
+                filename = self.get_unique_filename(product['title'], product['price'], product['image_url'])
+            if self.listener:
+                self.listener.image_queued(product_key)
+            futures.append(executor.submit(
+                self.download_checkpointed, key, product['image_url'], filename, product_key))
+        self.submitted.extend(futures)
+        return futures
+    
+    def queue_checkpointed_downloads(self, products, executor):
+        """queue_downloads, skipping images this crawl already finished (see CrawlCheckpoint)"""
+        futures = []
+        pending = []
+        for product in products:
+            key = self.image_key(product['image_url']) if product['image_url'] else None
+            if key and key not in self.queued and self.checkpoint.image_done(key) and self.manifest.get(key):
+                if product.get('id'):
+                    self.manifest.map_variant(product['id'], key)
+                self.queued.add(key)
+                done = Future()
+                done.set_result(True)
+                futures.append(done)
+            else:
+                pending.append(product)
+        return futures + self.queue_downloads(pending, executor)
+    
+    def download_checkpointed(self, key, image_url, filename, product):
+        """download_image, journaling the result"""
+        ok = self.download_image(image_url, filename, product)
+        self.checkpoint.record_image(key, ok)
+        self.metrics.image_finished(ok)
+        if self.listener:
+            self.listener.image_done(product, ok)
+        return ok
+    
+    def fetch_collection_page(self, page_number):
+        """Products and last linked page number of a collection page
+        
+        Page 1 is dumped to debug_html (or first_page_debug.html if no
+        products are found on it) to help adapt the extraction.
+        """
+        url = self.collection_url if page_number == 1 else f"{self.collection_url}?page={page_number}"
+        print(f"Scraping page {page_number}: {url}")
+        response = self.fetch(url)
+        products = self.extract_product_data(response.text)
+        print(f"Found {len(products)} products on page {page_number}")
+        
+        if page_number == 1 and (self.debug_html or not products):
+            debug_path = self.debug_html or 'first_page_debug.html'
+            with open(debug_path, 'w', encoding='utf-8') as f:
+                f.write(response.text)
+            if not products:
+                variants_count = response.text.count('"productVariants"')
+                product_count = response.text.count('"product":')
+                price_count = response.text.count('"price":')
+                print(f"No products found on page 1 (saved to {debug_path}): {variants_count} 'productVariants', "
+                      f"{product_count} 'product', {price_count} 'price' occurrences")
+        
+        return products, self.get_total_pages(response.text)
+    
+    def crawl_collection(self, executor):
+        """Scrape every collection page, queueing the downloads on executor.
+        
+        Pages are fetched page_workers at a time. Pagination is discovered
+        as pages arrive: every page links to some others (e.g. 1 2 3 ... 7),
+        and all pages up to the highest linked one are fetched. Downloads
+        are queued in page order so images are numbered the same way
+        whatever order the pages arrive in. A failed page does not stop the
+        crawl; it is retried by the next --resume.
+        """
+        downloads = []
+        results = {}
+        in_flight = {}
+        scheduled = 0
+        next_to_queue = 1
+        
+        def schedule(last_page):
+            nonlocal scheduled
+            for page in range(scheduled + 1, last_page + 1):
+                saved = self.checkpoint.page('html', page)
+                if saved is not None:
+                    results[page] = (saved['products'], saved['last_page'])
+                else:
+                    in_flight[page_pool.submit(self.fetch_collection_page, page)] = page
+            scheduled = max(scheduled, last_page)
+        
+        with ThreadPoolExecutor(max_workers=self.page_workers) as page_pool:
+            schedule(1)
+            while True:
+                # Pages finished or taken from the checkpoint extend the frontier
+                for page, (products, last_page) in list(results.items()):
+                    if products is not None and last_page > scheduled:
+                        schedule(last_page)
+                
+                # Queue downloads of finished pages, in page order
+                while next_to_queue in results:
+                    products, last_page = results.pop(next_to_queue)
+                    if products:
+                        downloads.extend(self.queue_checkpointed_downloads(products, executor))
+                    next_to_queue += 1
+                
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    page = in_flight.pop(future)
+                    try:
+                        products, last_page = future.result()
+                    except Exception as e:
+                        print(f"Error scraping page {page}: {str(e)}")
+                        self.failed_pages.append(page)
+                        results[page] = (None, page)
+                        continue
+                    self.checkpoint.record_page('html', page, {'products': products, 'last_page': last_page})
+                    results[page] = (products, last_page)
+        
+        print(f"Scraped {scheduled - len(self.failed_pages)} of {scheduled} collection pages")
+        return downloads
+    
+    def fetch_products_json(self):
+        """Every variant listed by the store's products.json, page_size products per request"""
+        products = []
+        page = 1
+        while True:
+            saved = self.checkpoint.page('json', page)
+            if saved is None:
+                response = self.fetch(f"{self.base_url}/products.json",
+                                      params={'limit': self.page_size, 'page': page})
+                items = response.json().get('products')
+                if not isinstance(items, list):
+                    raise ValueError("products.json has no product list")
+                records = [record for product in items for record in json_variant_records(product)]
+                saved = {'products': records, 'count': len(items)}
+                self.checkpoint.record_page('json', page, saved)
+                print(f"Found {len(items)} products on products.json page {page}")
+            products.extend(saved['products'])
+            if saved['count'] < self.page_size:
+                return products
+            page += 1
     
     def run(self):
-        """Main scraping function."""
+        """Main scraping function.
+        
+        Returns the number of images downloaded (or unchanged) and the
+        number of images found.
+        """
         print("Starting MiasModa scraper...")
         self.setup_output_directory()
+        self.checkpoint = CrawlCheckpoint(os.path.join(self.output_dir, CHECKPOINT_NAME) if self.persist else None,
+                                          resume=self.resume)
+        self.failed_pages = []
+        self.metrics = ScrapeMetrics()
+        
+        stop_progress = threading.Event()
+        if self.progress:
+            def report_progress():
+                while not stop_progress.wait(self.progress):
+                    print(self.metrics.progress_line(len(self.queued)))
+            threading.Thread(target=report_progress, daemon=True).start()
         
-        # First, get the total number of pages
+        downloads = []
+        executor = ThreadPoolExecutor(max_workers=self.workers)
         try:
-            response = self.session.get(self.collection_url)
-            response.raise_for_status()
-            
-            # Debug: Save first page
-            with open('first_page_debug.html', 'w', encoding='utf-8') as f:
-                f.write(response.text)
+            products = None
+            if self.source in ('auto', 'json'):
+                try:
+                    products = self.fetch_products_json()
+                except (requests.RequestException, ValueError) as e:
+                    if self.source == 'json':
+                        raise
+                    print(f"products.json is not available ({e}), scraping collection pages instead")
+                if self.source == 'auto' and not products:
+                    products = None
             
-            # Debug: Look for productVariants
-            if 'productVariants' in response.text:
-                print("Found 'productVariants' in HTML")
-                # Try to extract a sample to understand the structure
-                sample = re.search(r'"productVariants":\s*\[([^]]{1,500})', response.text)
-                if sample:
-                    print(f"Sample of productVariants: {sample.group(1)}...")
-            
-            total_pages = self.get_total_pages(response.text)
-            print(f"Found {total_pages} pages to scrape")
-            
-            # Process the first page
-            products = self.extract_product_data(response.text)
-            print(f"Found {len(products)} products on page 1")
-            
-            if products:
-                print(f"Sample product: {products[0]}")
+            if products is not None:
+                print(f"Found {len(products)} variants in products.json")
+                downloads.extend(self.queue_checkpointed_downloads(products, executor))
             else:
-                print("No products found. Checking HTML structure...")
-                # Additional debug info
-                variants_count = response.text.count('"productVariants"')
-                product_count = response.text.count('"product":')
-                price_count = response.text.count('"price":')
-                print(f"Found {variants_count} 'productVariants', {product_count} 'product', {price_count} 'price' occurrences")
-            
-            for product in products:
-                filename = self.get_unique_filename(product['title'], product['price'])
-                self.download_image(product['image_url'], filename)
-                time.sleep(1)
-            
-            # Process remaining pages
-            for page in range(2, total_pages + 1):
-                time.sleep(5)  # 5 second delay between pages
-                self.scrape_page(page)
+                downloads.extend(self.crawl_collection(executor))
+            if self.listener:
+                self.listener.queueing_finished()
+            executor.shutdown(wait=True)
                 
         except Exception as e:
             print(f"Error in main scraping loop: {str(e)}")
+            self.failed_pages.append(None)
+        finally:
+            # On Ctrl+C, stop without starting the queued downloads
+            for future in self.submitted:
+                future.cancel()
+            executor.shutdown(wait=True)
+            stop_progress.set()
+            self.manifest.save()
         
-        print("\nScraping completed!")
-        print(f"Total unique products processed: {sum(self.product_counters.values())}")
+        downloaded = sum(1 for future in downloads if not future.cancelled() and future.result())
+        complete = downloaded == len(downloads) and not self.failed_pages
+        self.checkpoint.close(complete)
         
-if __name__ == "__main__":
+        print("\nScraping completed!" if complete else "\nScraping finished with errors, continue with --resume")
+        print(f"Total unique products processed: {sum(self.product_counters.values())}")
+        print(f"Images downloaded: {downloaded} of {len(downloads)}")
+        for line in self.metrics.summary_lines():
+            print(line)
+        return downloaded, len(downloads)
+
+
+def benchmark_extraction(paths, repeat=50):
+    """Time extract_product_data on saved collection pages"""
     scraper = MiasModaScraper()
-    scraper.run()
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            html_content = f.read()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            products = scraper.extract_product_data(html_content)
+        elapsed = (time.perf_counter() - start) / repeat
+        print(f"{path}: {len(html_content) / 1e3:.0f} KB, {len(products)} variants, {elapsed * 1e3:.2f} ms per page")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MiasModa product image scraper')
+    parser.add_argument('--base-url', default='https://miasmoda.cl',
+                      help='Store to scrape (default: https://miasmoda.cl)')
+    parser.add_argument('--output', default='./product_pictures',
+                      help='Directory the images are saved to')
+    parser.add_argument('--workers', type=int, default=8,
+                      help='Concurrent image downloads (default: 8)')
+    parser.add_argument('--rate', type=float, default=2.0,
+                      help='Maximum requests per second to each host (default: 2)')
+    parser.add_argument('--burst', type=int, default=4,
+                      help='Requests that may be sent at once before --rate applies (default: 4)')
+    parser.add_argument('--retries', type=int, default=5,
+                      help='Retries of a request on HTTP 429/5xx and connection errors (default: 5)')
+    parser.add_argument('--source', choices=['auto', 'json', 'html'], default='auto',
+                      help='Read products from products.json, collection pages, or products.json '
+                           'falling back to collection pages (default: auto)')
+    parser.add_argument('--page-size', type=int, default=250,
+                      help='Products per products.json request (default: 250, the maximum)')
+    parser.add_argument('--image-width', type=int, default=2000,
+                      help='Widest image to request from the Shopify CDN, 0 = originals (default: 2000)')
+    parser.add_argument('--image-format', choices=CDN_FORMATS, default='original',
+                      help='Image format to request from the Shopify CDN (default: original)')
+    parser.add_argument('--page-workers', type=int, default=4,
+                      help='Collection pages fetched at once (default: 4)')
+    parser.add_argument('--resume', action='store_true',
+                      help='Continue an interrupted or failed scrape where it stopped')
+    parser.add_argument('--debug-html', default=None,
+                      help='Save the first collection page here (it is saved to first_page_debug.html '
+                           'only when no products are found on it)')
+    parser.add_argument('--progress', type=float, default=0, metavar='SECONDS',
+                      help='Print a progress line every this many seconds')
+    parser.add_argument('--metrics', default=None, metavar='JSON',
+                      help='Write request counts, latencies and timings of the run to this file')
+    parser.add_argument('--benchmark-extraction', nargs='+', default=None, metavar='HTML',
+                      help='Only time product extraction on these saved collection pages')
+    args = parser.parse_args()
+    if not args.rate > 0:
+        parser.error(f"--rate must be above 0, not {args.rate}")
+    if args.burst < 1 or args.workers < 1 or args.page_workers < 1:
+        parser.error("--burst, --workers and --page-workers must be at least 1")
+    if not 1 <= args.page_size <= MAX_PAGE_SIZE:
+        parser.error(f"--page-size must be between 1 and {MAX_PAGE_SIZE}")
+    
+    if args.benchmark_extraction:
+        benchmark_extraction(args.benchmark_extraction)
+        return
+    
+    scraper = MiasModaScraper(
+        base_url=args.base_url,
+        output_dir=args.output,
+        workers=args.workers,
+        rate=args.rate,
+        burst=args.burst,
+        max_retries=args.retries,
+        source=args.source,
+        page_size=args.page_size,
+        image_width=args.image_width or None,
+        image_format=args.image_format,
+        page_workers=args.page_workers,
+        resume=args.resume,
+        debug_html=args.debug_html,
+        progress=args.progress
+    )
+    downloaded, total = scraper.run()
+    if args.metrics:
+        with open(args.metrics, 'w', encoding='utf-8') as f:
+            json.dump(scraper.metrics.summary(), f, indent=2)
+        print(f"Metrics written to {args.metrics}")
+    if downloaded < total or scraper.failed_pages:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
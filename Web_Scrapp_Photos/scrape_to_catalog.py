@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+MiasModa scrape-to-catalog pipeline
+Downloads the store's product images and renders the catalog page of each
+product as soon as all of its images are in, without going through the
+product_pictures folder
+"""
+
+import io
+import os
+import sys
+import time
+import queue
+import logging
+import argparse
+import threading
+from pathlib import Path
+from collections import defaultdict
+
+from miasmoda_scraper_solution import CDN_FORMATS, MiasModaScraper
+# Importing the scraper put Create_catalog on the module path
+from catalog_creator import OUTPUT_FORMATS, MiasCatalogCreator
+from product_filenames import parse_product_filename
+
+
+class CatalogPipeline:
+    """Feeds the images a scraper downloads to a catalog creator, product by product
+
+    Acts as the scraper's listener (see MiasModaScraper.listener). The
+    images of a product are collected in memory; once every image of the
+    run is queued and none of the product's downloads is pending, the
+    product is put on a bounded queue that the renderer takes it from. When
+    the queue is full the download threads wait, so memory use stays
+    bounded however far downloads get ahead of rendering.
+    """
+
+    def __init__(self, scraper, creator, queue_size=16):
+        self.scraper = scraper
+        self.creator = creator
+        self.ready = queue.Queue(maxsize=max(1, queue_size))
+        self.lock = threading.Lock()
+        # Downloads not finished and images received, per scraper product
+        self.pending = defaultdict(int)
+        self.images = defaultdict(list)
+        self.released = set()
+        self.listed = False
+
+    def image_queued(self, product):
+        with self.lock:
+            self.pending[product] += 1
+
+    def image_ready(self, product, file_name, data):
+        record = parse_product_filename(Path(file_name).stem)
+        if record is None:
+            print(f"Could not parse file name: {file_name}")
+            return
+        # The name is shown in decoding errors
+        photo = io.BytesIO(data)
+        photo.name = file_name
+        with self.lock:
+            self.images[product].append((record.group_key, record.number, photo))
+
+    def image_done(self, product, ok):
+        with self.lock:
+            self.pending[product] -= 1
+            complete = self.listed and self.pending[product] == 0
+        if complete:
+            self.release(product)
+
+    def queueing_finished(self):
+        with self.lock:
+            if self.listed:
+                return
+            self.listed = True
+            complete = [product for product, count in self.pending.items() if count == 0]
+        for product in complete:
+            self.release(product)
+
+    def release(self, product):
+        """Queue a product's page for rendering, waiting while the queue is full"""
+        with self.lock:
+            if product in self.released:
+                return
+            self.released.add(product)
+            images = self.images.pop(product, [])
+        if not images:
+            print(f"No images of {product} were downloaded, skipping its page")
+            return
+        key = images[0][0]
+        self.ready.put((key, sorted(((number, photo) for _, number, photo in images), key=lambda x: x[0])))
+
+    def run(self):
+        """Scrape the store and render the pages as products complete
+
+        Returns (downloaded, total, pages, failures) with the number of
+        images downloaded and found, the number of pages rendered, and the
+        list of (key, error) for pages that failed.
+        """
+        downloads = {}
+
+        def scrape():
+            try:
+                downloads['result'] = self.scraper.run()
+            finally:
+                # Also releases the products completed before a failed scrape stopped
+                self.queueing_finished()
+                self.ready.put(None)
+
+        self.scraper.listener = self
+        scraper_thread = threading.Thread(target=scrape, name='scraper', daemon=True)
+        scraper_thread.start()
+
+        start = time.perf_counter()
+        pages = 0
+        failures = []
+        for key, output_filename, stats, error in self.creator.render_items(iter(self.ready.get, None)):
+            if error:
+                print(f"Error creating catalog page for {key}: {error}")
+                failures.append((key, error))
+                continue
+            pages += 1
+            print(f"Created catalog page: {', '.join(stats['pages'])} ({stats['seconds']:.2f}s)")
+        scraper_thread.join()
+        elapsed = time.perf_counter() - start
+
+        downloaded, total = downloads.get('result', (0, 0))
+        scrape_seconds = self.scraper.metrics.elapsed()
+        print(f"\n{pages} catalog pages from {downloaded} of {total} images in {elapsed:.1f}s "
+              f"(downloads took {scrape_seconds:.1f}s, the last pages {max(0.0, elapsed - scrape_seconds):.1f}s more)")
+        if failures:
+            print(f"{len(failures)} pages failed:")
+            for key, error in failures:
+                print(f"  {key}: {error}")
+        return downloaded, total, pages, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Download MiasModa product images and render their catalog pages')
+    parser.add_argument('--base-url', default='https://miasmoda.cl',
+                      help='Store to scrape (default: https://miasmoda.cl)')
+    parser.add_argument('--output', default='./new_catalog',
+                      help='Output directory for catalog pages')
+    parser.add_argument('--photos', default=None,
+                      help='Also save the photos in this directory, so re-runs only download changed images '
+                           '(default: photos are only kept in memory)')
+    parser.add_argument('--workers', type=int, default=8,
+                      help='Concurrent image downloads (default: 8)')
+    parser.add_argument('--render-workers', type=int, default=os.cpu_count() or 1,
+                      help='Processes rendering pages (default: number of CPU cores)')
+    parser.add_argument('--queue-size', type=int, default=16,
+                      help='Products waiting to be rendered before downloads pause (default: 16)')
+    parser.add_argument('--rate', type=float, default=2.0,
+                      help='Requests per second to each host (default: 2)')
+    parser.add_argument('--burst', type=int, default=4,
+                      help='Requests that may be sent at once before the rate applies (default: 4)')
+    parser.add_argument('--source', choices=['auto', 'json', 'html'], default='auto',
+                      help='Where the product list comes from (default: auto)')
+    parser.add_argument('--image-width', type=int, default=2000,
+                      help='Width asked from the Shopify CDN, 0 for the original size (default: 2000)')
+    parser.add_argument('--image-format', choices=CDN_FORMATS, default='original',
+                      help='Image format asked from the Shopify CDN (default: original)')
+    parser.add_argument('--format', choices=sorted(OUTPUT_FORMATS), default='jpeg',
+                      help='Catalog page format (default: jpeg)')
+    parser.add_argument('--quality', type=int, default=None,
+                      help='Encoder quality (default: 95 for JPEG, 90 for WebP, 75 for AVIF)')
+    parser.add_argument('--layouts', default='default',
+                      help='Comma-separated page layouts of Create_catalog/layouts.json, e.g. default,instagram,story '
+                           '(default: default)')
+    args = parser.parse_args()
+    if not args.rate > 0:
+        parser.error(f"--rate must be above 0, not {args.rate}")
+    if args.burst < 1 or args.workers < 1 or args.render_workers < 1 or args.queue_size < 1:
+        parser.error("--burst, --workers, --render-workers and --queue-size must be at least 1")
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    scraper = MiasModaScraper(
+        base_url=args.base_url,
+        output_dir=args.photos or args.output,
+        workers=args.workers,
+        rate=args.rate,
+        burst=args.burst,
+        source=args.source,
+        image_width=args.image_width or None,
+        image_format=args.image_format,
+        persist=bool(args.photos)
+    )
+    creator = MiasCatalogCreator(args.photos or args.output, args.output, workers=args.render_workers)
+    try:
+        creator.set_output_format(args.format, quality=args.quality)
+        creator.set_layouts([name.strip() for name in args.layouts.split(',') if name.strip()])
+    except ValueError as e:
+        parser.error(str(e))
+
+    downloaded, total, pages, failures = CatalogPipeline(scraper, creator, args.queue_size).run()
+    if downloaded < total or failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,565 @@
+#!/usr/bin/env python3
+"""
+Tests of the scraper against a local stand-in for the store
+Run with pytest
+"""
+
+import io
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+from miasmoda_scraper_solution import MiasModaScraper, ScrapeMetrics, TokenBucket, cdn_image_url
+from scrape_to_catalog import CatalogPipeline
+from catalog_creator import MiasCatalogCreator
+
+
+HERE = Path(__file__).parent
+SAMPLE_PAGES = [HERE / "collection_sample.html", HERE / "samples" / "collection.html"]
+
+
+def collection_page(variants):
+    """Collection page HTML with the productVariants JSON the store embeds"""
+    collection = {'collection': {'id': '', 'title': 'Productos', 'productVariants': [
+        {
+            'price': {'amount': price, 'currencyCode': 'CLP'},
+            'product': {'title': title, 'vendor': 'miasmoda', 'type': ''},
+            'id': str(index),
+            'image': {'src': src},
+            'sku': '',
+        }
+        for index, (title, price, src) in enumerate(variants)
+    ]}}
+    return f'<script>publish("collection_viewed", {json.dumps(collection)});</script>'
+
+
+def products_json(images):
+    """Shopify products.json products, one per title and price, one variant per image"""
+    products = {}
+    for index, (path, (title, price, data)) in enumerate(images.items()):
+        product = products.setdefault((title, price), {
+            'id': len(products) + 1, 'title': title, 'handle': title.lower().replace(' ', '-'),
+            'product_type': '', 'variants': [], 'images': [],
+        })
+        product['variants'].append({'id': 100 + index, 'title': f"Color {index}", 'sku': f"SKU{index}",
+                                    'price': f"{price:.2f}", 'featured_image': None})
+        product['images'].append({'id': 200 + index, 'src': path, 'variant_ids': [100 + index]})
+    return list(products.values())
+
+
+class StubStore:
+    """Local HTTP server serving one collection page and its images
+
+    `images` maps an image path to (title, price, content) and may be
+    changed between runs. `failures` maps a path to a list of status codes
+    returned before the real response, e.g. {'/cdn/a.jpg': [503, 429]}.
+    `content_types` overrides the image/jpeg Content-Type of some paths and
+    the bodies of paths in `truncate` are cut off halfway. Images have
+    ETags and answer If-None-Match with 304. /products.json is only served
+    with serve_json=True. The collection page lists one variant per image,
+    or the (title, price, src) tuples in `variants` if given. With `pages`
+    (a list of such variant lists) the collection is paginated, each page
+    linking to the next two pages only. Failures of a page are keyed by
+    its URL path and query, e.g. '/collections/all?page=3'.
+    """
+
+    def __init__(self, images, failures=None, content_types=None, truncate=(), serve_json=False,
+                 variants=None, pages=None):
+        self.pages = pages
+        self.serve_json = serve_json
+        self.variants = variants
+        self.images = images
+        self.failures = {path: list(codes) for path, codes in (failures or {}).items()}
+        self.content_types = content_types or {}
+        self.truncate = set(truncate)
+        self.requests = []
+        self.urls = []
+        self.sent = []
+        store = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                store.requests.append((path, time.monotonic()))
+                store.urls.append(self.path)
+                codes = store.failures.get(self.path) or store.failures.get(path)
+                if codes:
+                    self.send_response(codes.pop(0))
+                    if path.endswith('retry-after.jpg'):
+                        self.send_header('Retry-After', '0')
+                    self.end_headers()
+                    return
+                if path == '/products.json' and store.serve_json:
+                    query = parse_qs(urlsplit(self.path).query)
+                    limit = int(query.get('limit', ['30'])[0])
+                    page = int(query.get('page', ['1'])[0])
+                    products = products_json(store.images)[(page - 1) * limit:page * limit]
+                    self.reply('application/json', json.dumps({'products': products}).encode('utf-8'))
+                elif path == '/collections/all' and store.pages:
+                    page = int(parse_qs(urlsplit(self.path).query).get('page', ['1'])[0])
+                    links = ''.join(f'<a href="/collections/all?page={number}">{number}</a>'
+                                    for number in range(1, min(page + 2, len(store.pages)) + 1))
+                    html = collection_page(store.pages[page - 1]) + links
+                    self.reply('text/html', html.encode('utf-8'))
+                elif path == '/collections/all':
+                    variants = store.variants or [
+                        (title, price, path) for path, (title, price, data) in store.images.items()]
+                    self.reply('text/html', collection_page(variants).encode('utf-8'))
+                elif path in store.images:
+                    body = store.images[path][2]
+                    etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+                    if self.headers.get('If-None-Match') == etag:
+                        self.send_response(304)
+                        self.send_header('ETag', etag)
+                        self.end_headers()
+                        return
+                    store.sent.append(path)
+                    content_type = store.content_types.get(path, 'image/jpeg')
+                    if path in store.truncate:
+                        self.send_response(200)
+                        self.send_header('Content-Type', content_type)
+                        self.send_header('Content-Length', str(len(body)))
+                        self.end_headers()
+                        self.wfile.write(body[:len(body) // 2])
+                        self.close_connection = True
+                        return
+                    self.reply(content_type, body, etag)
+                else:
+                    self.send_error(404)
+
+            def reply(self, content_type, body, etag=None):
+                self.send_response(200)
+                if etag:
+                    self.send_header('ETag', etag)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def working_directory(tmp_path_factory, monkeypatch):
+    # The scraper writes first_page_debug.html to the working directory
+    monkeypatch.chdir(tmp_path_factory.mktemp('cwd'))
+
+
+@pytest.fixture
+def make_store():
+    stores = []
+
+    def make(*args, **kwargs):
+        stores.append(StubStore(*args, **kwargs))
+        return stores[-1]
+
+    yield make
+    for store in stores:
+        store.close()
+
+
+def test_extract_sample_pages():
+    scraper = MiasModaScraper()
+    for path in SAMPLE_PAGES:
+        products = scraper.extract_product_data(path.read_text(encoding='utf-8'))
+        assert len(products) == 15, path
+        assert products[0] == {
+            'id': '46602929471770', 'sku': '', 'title': 'Body Abigail',
+            'variant_title': 'Negro / Única (S/38 - M/40 - L/42)',
+            'price': 29990.0, 'currency': 'CLP',
+            'image_url': '//miasmoda.cl/cdn/shop/files/1543.jpg?v=1741509261',
+            'product_id': '8596375273754', 'product_type': '', 'url': '/products/copia-de-body-abigail',
+        }
+        assert [product['title'] for product in products].count('Body Amelia') == 5
+        assert len({product['id'] for product in products}) == 15
+
+
+def test_extract_ignores_field_order_and_bad_arrays():
+    variants = [
+        {'image': {'src': '//cdn/x.jpg'}, 'id': 1, 'product': {'type': 'Bodys', 'title': 'Body X'},
+         'price': {'currencyCode': 'CLP', 'amount': 1990}},
+        {'id': 2, 'price': {'amount': 2990.0}, 'product': {'title': 'Body Y'}, 'image': None},
+        {'id': 3, 'product': {'title': 'No price'}},
+    ]
+    html = ('<script>var x = {"productVariants": buildVariants()};'
+            '"productVariants":[] "productVariants": ' + json.dumps(variants) + ';</script>'
+            + collection_page([('Body X', 1990, '//cdn/x.jpg')]))
+    products = MiasModaScraper().extract_product_data(html)
+    assert [(p['id'], p['title'], p['price'], p['image_url']) for p in products] == [
+        ('1', 'Body X', 1990.0, '//cdn/x.jpg'),
+        ('2', 'Body Y', 2990.0, None),
+        ('0', 'Body X', 1990.0, '//cdn/x.jpg'),
+    ]
+
+
+def test_downloads_with_retries(make_store, tmp_path):
+    images = {
+        '/cdn/a.jpg': ('Body Ada', 24990.0, b'a' * 1000),
+        '/cdn/b.jpg': ('Body Ada', 24990.0, b'b' * 2000),
+        '/cdn/retry-after.jpg': ('Leggins Punto Roma', 15990.0, b'c' * 3000),
+    }
+    store = make_store(images, failures={'/cdn/a.jpg': [503, 500], '/cdn/retry-after.jpg': [429]})
+    scraper = MiasModaScraper(base_url=store.url, output_dir=str(tmp_path), workers=4,
+                              rate=100, burst=10, backoff=0.01)
+
+    assert scraper.run() == (3, 3)
+    assert (tmp_path / "Body_Ada-249900-1.jpg").read_bytes() == b'a' * 1000
+    assert (tmp_path / "Body_Ada-249900-2.jpg").read_bytes() == b'b' * 2000
+    assert (tmp_path / "Leggins_Punto_Roma-159900-1.jpg").read_bytes() == b'c' * 3000
+    assert [path for path, _ in store.requests].count('/cdn/a.jpg') == 3
+
+
+def test_gives_up_after_retries(make_store, tmp_path):
+    images = {'/cdn/a.jpg': ('Body Ada', 24990.0, b'a')}
+    store = make_store(images, failures={'/cdn/a.jpg': [503] * 5})
+    scraper = MiasModaScraper(base_url=store.url, output_dir=str(tmp_path),
+                              rate=100, burst=10, max_retries=2, backoff=0.01)
+
+    assert scraper.run() == (0, 1)
+    # The checkpoint is kept for --resume
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['crawl_checkpoint.jsonl', 'download_manifest.json']
+
+
+def test_interrupted_run_starts_no_queued_downloads(make_store, tmp_path):
+    images = {f'/cdn/{letter}.jpg': ('Body Ada', 24990.0, letter.encode()) for letter in 'abcd'}
+    store = make_store(images)
+    scraper = MiasModaScraper(base_url=store.url, output_dir=str(tmp_path), workers=1, rate=100, burst=10)
+
+    started = []
+    release = threading.Event()
+
+    def download(key, url, filename, product_key):
+        started.append(key)
+        release.wait(5)
+        return True
+
+    class Interrupted:
+        def image_queued(self, product):
+            pass
+
+        def queueing_finished(self):
+            # Ctrl+C while the first download is still running
+            threading.Timer(0.5, release.set).start()
+            raise KeyboardInterrupt
+
+    scraper.download_checkpointed = download
+    scraper.listener = Interrupted()
+    with pytest.raises(KeyboardInterrupt):
+        scraper.run()
+    assert len(started) == 1
+
+
+def test_rerun_only_transfers_changes(make_store, tmp_path):
+    images = {
+        '/cdn/a.jpg': ('Body Ada', 24990.0, b'a' * 1000),
+        '/cdn/b.jpg': ('Body Ada', 24990.0, b'b' * 2000),
+    }
+    store = make_store(images)
+
+    def scrape():
+        scraper = MiasModaScraper(base_url=store.url, output_dir=str(tmp_path), rate=100, burst=10)
+        store.sent.clear()
+        assert scraper.run() == (len(store.images), len(store.images))
+
+    scrape()
+    assert (tmp_path / "Body_Ada-249900-2.jpg").read_bytes() == b'b' * 2000
+
+    # New image listed first, one image changed: numbers stay, only changes are sent
+    images['/cdn/b.jpg'] = ('Body Ada', 24990.0, b'B' * 2000)
+    store.images = {'/cdn/new.jpg': ('Body Ada', 24990.0, b'n' * 500), **images}
+    scrape()
+    assert (tmp_path / "Body_Ada-249900-1.jpg").read_bytes() == b'a' * 1000
+    assert (tmp_path / "Body_Ada-249900-2.jpg").read_bytes() == b'B' * 2000
+    assert (tmp_path / "Body_Ada-249900-3.jpg").read_bytes() == b'n' * 500
+    assert sorted(store.sent) == ['/cdn/b.jpg', '/cdn/new.jpg']
+
+    # A price change renames the files without downloading them again
+    store.images = {path: ('Body Ada', 19990.0, data) for path, (title, price, data) in store.images.items()}
+    scrape()
+    assert store.sent == []
+    assert sorted(path.name for path in tmp_path.glob('*.jpg')) == [
+        "Body_Ada-199900-1.jpg", "Body_Ada-199900-2.jpg", "Body_Ada-199900-3.jpg"]
+    assert (tmp_path / "Body_Ada-199900-1.jpg").read_bytes() == b'a' * 1000
+    manifest = json.loads((tmp_path / "download_manifest.json").read_text())
+    assert {entry['file'] for entry in manifest['images'].values()} == {
+        "Body_Ada-199900-1.jpg", "Body_Ada-199900-2.jpg", "Body_Ada-199900-3.jpg"}
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=20, burst=2)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # Two requests in the burst, then one every 50 ms
+    assert time.monotonic() - start >= 0.19
+
+    for rate in (0, -1):
+        with pytest.raises(ValueError, match="rate must be above 0"):
+            TokenBucket(rate=rate)
+
+
+def test_downloads_are_verified(make_store, tmp_path):
+    images = {
+        '/cdn/photo.jpg': ('Body Ada', 24990.0, b'p' * 300_000),
+        '/cdn/cut.jpg': ('Body Ada', 24990.0, b'c' * 300_000),
+        '/cdn/error.jpg': ('Body Ada', 24990.0, b'<html>Not found</html>'),
+    }
+    store = make_store(images, content_types={'/cdn/photo.jpg': 'image/png', '/cdn/error.jpg': 'text/html'},
+                       truncate={'/cdn/cut.jpg'})
+    scraper = MiasModaScraper(base_url=store.url, output_dir=str(tmp_path), rate=100, burst=10)
+
+    assert scraper.run() == (1, 3)
+    # Saved under the extension of its Content-Type; no partial or bogus files
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        'Body_Ada-249900-1.png', 'crawl_checkpoint.jsonl', 'download_manifest.json']
+    manifest = json.loads((tmp_path / "download_manifest.json").read_text())
+    entry = manifest['images'][store.url + '/cdn/photo.jpg']
+    assert entry['sha256'] == hashlib.sha256(b'p' * 300_000).hexdigest()
+    assert entry['size'] == 300_000
+
+
+def test_products_json_source(make_store, tmp_path):
+    images = {
+        '/cdn/a.jpg': ('Body Ada', 24990.0, b'a'),
+        '/cdn/b.jpg': ('Body Ada', 24990.0, b'b'),
+        '/cdn/c.jpg': ('Body Amanda', 24740.0, b'c'),
+        '/cdn/d.jpg': ('Leggins Punto Roma', 15990.0, b'd'),
+    }
+    store = make_store(images, serve_json=True)
+    scraper = MiasModaScraper(base_url=store.url, output_dir=str(tmp_path), rate=100, burst=10,
+                              source='json', page_size=2)
+
+    assert scraper.run() == (4, 4)
+    paths = [path for path, _ in store.requests]
+    assert paths.count('/products.json') == 2
+    assert '/collections/all' not in paths
+    assert sorted(path.name for path in tmp_path.glob('*.jpg')) == [
+        "Body_Ada-249900-1.jpg", "Body_Ada-249900-2.jpg", "Body_Amanda-247400-1.jpg", "Leggins_Punto_Roma-159900-1.jpg"]
+
+    # products.json returns at most 250 products, so asking for more would stop after the first page
+    assert MiasModaScraper(output_dir=str(tmp_path), page_size=1000).page_size == 250
+    assert MiasModaScraper(output_dir=str(tmp_path), page_size=0).page_size == 1
+
+
+def test_falls_back_to_collection_pages(make_store, tmp_path):
+    store = make_store({'/cdn/a.jpg': ('Body Ada', 24990.0, b'a')})
+    scraper = MiasModaScraper(base_url=store.url, output_dir=str(tmp_path), rate=100, burst=10)
+
+    assert scraper.run() == (1, 1)
+    assert [path for path, _ in store.requests][:2] == ['/products.json', '/collections/all']
+
+
+def test_cdn_image_url():
+    url = 'https://miasmoda.cl/cdn/shop/files/1543.jpg?v=1741509261'
+    assert cdn_image_url(url, 2000) == url + '&width=2000'
+    assert cdn_image_url(url + '&width=300', 1000, 'pjpg') == url + '&width=1000&format=pjpg'
+    assert cdn_image_url(url) == url
+    assert cdn_image_url('https://example.com/images/a.jpg', 2000) == 'https://example.com/images/a.jpg'
+
+
+def test_right_sized_downloads(make_store, tmp_path):
+    store = make_store({'/cdn/shop/files/a.jpg': ('Body Ada', 24990.0, b'a' * 100)})
+
+    def scrape(width):
+        scraper = MiasModaScraper(base_url=store.url, output_dir=str(tmp_path), rate=100, burst=10,
+                                  image_width=width)
+        store.sent.clear()
+        store.urls.clear()
+        assert scraper.run() == (1, 1)
+
+    scrape(1000)
+    assert '/cdn/shop/files/a.jpg?width=1000' in store.urls
+    manifest = json.loads((tmp_path / "download_manifest.json").read_text())
+    entry = manifest['images'][store.url + '/cdn/shop/files/a.jpg']
+    assert entry['variant'] == {'width': 1000, 'format': 'original'}
+    assert entry['content_type'] == 'image/jpeg'
+
+    # Same size again: not transferred; another size: downloaded again
+    scrape(1000)
+    assert store.sent == []
+    scrape(500)
+    assert store.sent == ['/cdn/shop/files/a.jpg']
+
+
+def test_duplicate_images_are_saved_once(make_store, tmp_path):
+    images = {
+        '/cdn/shop/files/a.jpg': ('Body Ada', 24990.0, b'a' * 100),
+        '/cdn/shop/files/a_1024x1024.jpg': ('Body Ada', 24990.0, b'a' * 100),
+        '/cdn/shop/files/copy-of-a.jpg': ('Body Ada', 24990.0, b'a' * 100),
+        '/cdn/shop/files/b.jpg': ('Body Ada', 24990.0, b'b' * 100),
+    }
+    variants = [
+        ('Body Ada', 24990.0, '/cdn/shop/files/a.jpg?v=1'),  # size S
+        ('Body Ada', 24990.0, '/cdn/shop/files/a.jpg?v=2'),  # size M, same image
+        ('Body Ada', 24990.0, '/cdn/shop/files/a_1024x1024.jpg'),  # same image, other size
+        ('Body Ada', 24990.0, '/cdn/shop/files/copy-of-a.jpg'),  # same content, other URL
+        ('Body Ada', 24990.0, '/cdn/shop/files/b.jpg'),
+    ]
+    store = make_store(images, variants=variants)
+
+    def scrape():
+        scraper = MiasModaScraper(base_url=store.url, output_dir=str(tmp_path), rate=100, burst=10, workers=1)
+        store.sent.clear()
+        return scraper.run()
+
+    # The copy's number (2) was given out before its content was known
+    assert scrape() == (3, 3)
+    assert sorted(store.sent) == ['/cdn/shop/files/a.jpg', '/cdn/shop/files/b.jpg', '/cdn/shop/files/copy-of-a.jpg']
+    assert sorted(path.name for path in tmp_path.glob('*.jpg')) == ["Body_Ada-249900-1.jpg", "Body_Ada-249900-3.jpg"]
+    assert (tmp_path / "Body_Ada-249900-3.jpg").read_bytes() == b'b' * 100
+
+    manifest = json.loads((tmp_path / "download_manifest.json").read_text())
+    a_key = store.url + '/cdn/shop/files/a.jpg'
+    assert manifest['variants'] == {'0': a_key, '1': a_key, '2': a_key,
+                                    '3': store.url + '/cdn/shop/files/copy-of-a.jpg',
+                                    '4': store.url + '/cdn/shop/files/b.jpg'}
+    assert manifest['images'][store.url + '/cdn/shop/files/copy-of-a.jpg']['duplicate_of'] == a_key
+
+    # Nothing changed: nothing is transferred and the duplicate stays unsaved
+    assert scrape() == (3, 3)
+    assert store.sent == []
+    assert sorted(path.name for path in tmp_path.glob('*.jpg')) == ["Body_Ada-249900-1.jpg", "Body_Ada-249900-3.jpg"]
+
+    # The copy becomes a different photo: it gets its own file, with the free number
+    images['/cdn/shop/files/copy-of-a.jpg'] = ('Body Ada', 24990.0, b'c' * 100)
+    assert scrape() == (3, 3)
+    assert store.sent == ['/cdn/shop/files/copy-of-a.jpg']
+    assert (tmp_path / "Body_Ada-249900-2.jpg").read_bytes() == b'c' * 100
+
+
+def paginated_images(pages):
+    """Images of `pages` collection pages with two products each, and the pages"""
+    images = {}
+    for page in range(1, pages + 1):
+        images[f'/cdn/{page}a.jpg'] = ('Body Ada', 24990.0, f'{page}a'.encode() * 100)
+        images[f'/cdn/{page}b.jpg'] = (f'Body Page {page}', 9990.0, f'{page}b'.encode() * 100)
+    variants = [(title, price, path) for path, (title, price, data) in images.items()]
+    return images, [variants[index:index + 2] for index in range(0, len(variants), 2)]
+
+
+def test_crawls_pages_concurrently_in_order(make_store, tmp_path):
+    images, pages = paginated_images(6)
+    store = make_store(images, pages=pages)
+    scraper = MiasModaScraper(base_url=store.url, output_dir=str(tmp_path), workers=4, page_workers=3,
+                              rate=100, burst=10, backoff=0.01)
+
+    assert scraper.run() == (12, 12)
+    # Page 1 only links to pages 2 and 3, the others are discovered on the way
+    assert sorted(url for url in store.urls if url.startswith('/collections')) == [
+        '/collections/all'] + [f'/collections/all?page={page}' for page in range(2, 7)]
+    # Numbered in page order whatever order the pages arrived in
+    for page in range(1, 7):
+        assert (tmp_path / f"Body_Ada-249900-{page}.jpg").read_bytes() == f'{page}a'.encode() * 100
+    assert not (tmp_path / "crawl_checkpoint.jsonl").exists()
+    assert not Path('first_page_debug.html').exists()
+
+
+def test_resume_continues_where_it_stopped(make_store, tmp_path):
+    images, pages = paginated_images(5)
+    store = make_store(images, pages=pages, failures={
+        '/collections/all?page=3': [500] * 3, '/cdn/4b.jpg': [503] * 3})
+    options = dict(base_url=store.url, output_dir=str(tmp_path), rate=100, burst=10,
+                   max_retries=2, backoff=0.01)
+
+    # Page 3 and one image fail; pages 4 and 5 are still found through page 2's links
+    assert MiasModaScraper(**options).run() == (7, 8)
+    assert (tmp_path / "crawl_checkpoint.jsonl").exists()
+    store.requests.clear()
+    store.urls.clear()
+    store.sent.clear()
+
+    assert MiasModaScraper(resume=True, **options).run() == (10, 10)
+    # Only the failed page and the images not yet downloaded are fetched
+    assert [url for url in store.urls if url.startswith('/collections')] == ['/collections/all?page=3']
+    assert sorted(store.sent) == ['/cdn/3a.jpg', '/cdn/3b.jpg', '/cdn/4b.jpg']
+    assert (tmp_path / "Body_Page_3-99900-1.jpg").read_bytes() == b'3b' * 100
+    assert not (tmp_path / "crawl_checkpoint.jsonl").exists()
+
+
+def test_metrics(make_store, tmp_path, capsys):
+    images = {
+        '/cdn/a.jpg': ('Body Ada', 24990.0, b'a' * 1000),
+        '/cdn/b.jpg': ('Body Ada', 24990.0, b'b' * 2000),
+    }
+    store = make_store(images, failures={'/cdn/a.jpg': [503]})
+    options = dict(base_url=store.url, output_dir=str(tmp_path), rate=100, burst=10, backoff=0.01)
+
+    scraper = MiasModaScraper(progress=0.01, **options)
+    scraper.run()
+    metrics = scraper.metrics.summary()
+    # products.json (404) and the collection page, then three image requests
+    assert metrics['requests'] == {'image': 3, 'page': 2}
+    assert metrics['statuses']['image'] == {'200': 2, '503': 1}
+    assert metrics['retries'] == {'image': 1, 'page': 0}
+    assert metrics['bytes']['image'] == 3000
+    assert metrics['latency']['image']['count'] == 2
+    assert metrics['latency']['page']['count'] == 1
+    assert sum(metrics['latency']['image']['histogram_ms'].values()) == 2
+    assert metrics['images'] == {'done': 2, 'failed': 0}
+    assert metrics['time_s']['backoff'] > 0
+    json.dumps(metrics)
+    assert 'images/s' in capsys.readouterr().out
+
+    scraper = MiasModaScraper(**options)
+    scraper.run()
+    metrics = scraper.metrics.summary()
+    assert metrics['not_modified'] == 2
+    assert metrics['bytes']['image'] == 0
+    assert metrics['latency']['image']['count'] == 2
+
+    # Nearest-rank percentiles of 10 latencies of 10 to 100 ms
+    summary = ScrapeMetrics.latency_summary([ms / 1e3 for ms in range(100, 0, -10)])
+    assert (summary['p50_ms'], summary['p95_ms'], summary['max_ms']) == (50.0, 100.0, 100.0)
+
+
+def jpeg(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (600, 900), color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def test_pipeline_renders_from_memory(make_store, tmp_path):
+    images = {
+        '/cdn/a1.jpg': ('Body Ada', 24990.0, jpeg('red')),
+        '/cdn/a2.jpg': ('Body Ada', 24990.0, jpeg('blue')),
+        '/cdn/a3.jpg': ('Body Ada', 24990.0, jpeg('yellow')),
+        '/cdn/b.jpg': ('Leggins Punto Roma', 15990.0, jpeg('green')),
+        '/cdn/broken.jpg': ('Body Rota', 9990.0, b'not a photo'),
+    }
+    store = make_store(images)
+    options = dict(base_url=store.url, rate=100, burst=10, backoff=0.01)
+    catalog = tmp_path / "catalog"
+
+    scraper = MiasModaScraper(output_dir=str(catalog), persist=False, **options)
+    creator = MiasCatalogCreator(catalog, catalog)
+    downloaded, total, pages, failures = CatalogPipeline(scraper, creator, queue_size=1).run()
+    assert (downloaded, total, pages) == (5, 5, 2)
+    assert [key for key, error in failures] == ['Body Rota-$9.990']
+    # Only the pages are written
+    assert sorted(path.name for path in catalog.iterdir()) == [
+        'Body_Ada-24990-catalog.jpg', 'Leggins_Punto_Roma-15990-catalog.jpg']
+
+    # With persistence the photos are saved too, and the pages are the same
+    photos = tmp_path / "photos"
+    scraper = MiasModaScraper(output_dir=str(photos), **options)
+    creator = MiasCatalogCreator(photos, tmp_path / "catalog2")
+    assert CatalogPipeline(scraper, creator).run()[:3] == (5, 5, 2)
+    assert (photos / "Body_Ada-249900-2.jpg").read_bytes() == images['/cdn/a2.jpg'][2]
+    for page in catalog.iterdir():
+        assert (tmp_path / "catalog2" / page.name).read_bytes() == page.read_bytes()